@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from corsheaders.defaults import default_headers, default_methods
 from pathlib import Path
+import os
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'doctors.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -94,6 +96,30 @@ DATABASES = {
 }
 
 
+# Caches
+# Version counters (doctors.service.versions) must be shared by every web
+# worker and the chat worker and bumped atomically, so they live in Redis
+# when REDIS_URL is set and in the VersionCounter table otherwise.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+    VERSION_CACHE = 'default'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    VERSION_CACHE = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -210,4 +236,83 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+
+# AI chat pipeline
+AI_NEAREST_HOSPITALS = 3  # hospitals (with distances) listed in each chat prompt
+AI_CANDIDATE_DOCTORS = 25  # doctors retrieved into the prompt; 0 sends the full roster
+AI_CANDIDATE_DISTANCE_SCALE_KM = 10  # distance at which a doctor's relevance is halved
+AI_FULL_ROSTER_MAX_TOKENS = 4000  # a roster up to this size is sent whole, in the cached prompt prefix, instead of candidates
+PROMPT_CACHE_MIN_TOKENS = 1024  # OpenAI caches a prompt prefix only from this length
+BACKGROUND_WORKERS = 4  # threads per process for voice synthesis and other post-response jobs
+CHAT_JOB_QUEUE = False  # queue every chat turn and answer 202; clients can also opt in with "Prefer: respond-async"
+CHAT_JOB_CONCURRENCY = 4  # default thread count for `manage.py run_chat_worker`
+CHAT_JOB_STALE_AFTER = 300  # seconds without a heartbeat before a running job is considered abandoned
+CHAT_JOB_RETRY_DELAY = 10  # seconds before a failed job is retried, doubled after every attempt
+CHAT_JOB_HEARTBEAT_INTERVAL = 30  # seconds between heartbeats of a running job; keep well under CHAT_JOB_STALE_AFTER
+ANSWER_CACHE_MAX_ENTRIES = 2000  # cached answers to history-free text turns, per process
+ANSWER_CACHE_TTL = 60 * 60 * 6  # seconds
+ANSWER_CACHE_CELL_DEGREES = 0.1  # geocell size (~11 km) shared by users asking from the same area
+TRANSLATION_MEMORY_MAX_ENTRIES = 5000  # translations kept in process memory in front of the TranslationMemory table
+AI_HISTORY_RECENT_MESSAGES = 4  # newest messages kept out of the rolling chat summary and replayed verbatim
+AI_HISTORY_TOKEN_BUDGET = 1500  # token cap for the replayed messages, including any the summary has not caught up with
+FILE_TEXT_MAX_CHARS = 20000  # characters of an attached document passed to the model
+FILE_EXTRACTION_WORKERS = 2  # processes parsing PDFs, per web worker
+PDF_MAX_PAGES = 30
+PDF_EXTRACTION_TIMEOUT = 20  # seconds
+VISION_IMAGE_JPEG_QUALITY = 85  # re-encoding quality for images sent to the vision model
+
+# Outbound HTTP: timeouts in seconds, retries with jittered backoff, keep-alive pool size
+# and circuit breaker (opens after failure_threshold consecutive failures for reset_timeout seconds).
+OUTBOUND_SERVICES = {
+    'openai': {'connect_timeout': 5, 'read_timeout': 60, 'retries': 2, 'pool_size': 20,
+               'failure_threshold': 5, 'reset_timeout': 30},
+    'tts': {'connect_timeout': 5, 'read_timeout': 45, 'retries': 1, 'pool_size': 10,
+            'failure_threshold': 5, 'reset_timeout': 60},
+    'translate': {'connect_timeout': 3, 'read_timeout': 10, 'retries': 2, 'pool_size': 10,
+                  'failure_threshold': 5, 'reset_timeout': 60},
+}
+
+# Local vision model (image_reader). None sends chat images to gpt-4o;
+# "transformers" or "stand-in" describes them locally and sends the text instead.
+LOCAL_VISION_BACKEND = None
+LOCAL_VISION_MODEL = None  # None uses image_reader.DEFAULT_MODEL
+LOCAL_VISION_DEVICE = "cpu"
+LOCAL_VISION_DTYPE = "bfloat16"  # reduced-precision weights; bfloat16 runs on CPU
+LOCAL_VISION_QUANTIZE = False  # dynamic int8 linear layers over float32 weights, CPU only
+LOCAL_VISION_MAX_NEW_TOKENS = 256
+LOCAL_VISION_MAX_BATCH_SIZE = 4  # requests answered by one generate() call
+LOCAL_VISION_MAX_WAIT_MS = 50  # how long a batch waits for more requests
+LOCAL_VISION_TIMEOUT = 120  # seconds a chat turn waits for its description
+LOCAL_VISION_LOAD_RETRY = 60  # seconds before a failed model load is retried
+
+# Medical reference retrieval (manage.py ingest_reference)
+REFERENCE_PDF_DIR = BASE_DIR / 'pdf_books'
+REFERENCE_INDEX_DIR = BASE_DIR / 'reference_index'
+REFERENCE_EMBEDDER = 'stand-in'  # 'stand-in' (local, deterministic hashing) or 'openai'
+REFERENCE_EMBEDDING_MODEL = 'text-embedding-3-small'
+REFERENCE_EMBEDDING_DIM = 256
+REFERENCE_EMBED_BATCH = 128  # chunks per embedding request
+REFERENCE_CHUNK_TOKENS = 400
+REFERENCE_CHUNK_OVERLAP = 50
+REFERENCE_TOP_K = 3  # excerpts added to each chat prompt; 0 disables retrieval
+REFERENCE_NPROBE = 8  # IVF lists scanned per query
+REFERENCE_MIN_SCORE = 0.1  # cosine similarity below which excerpts are dropped
+
+# Chat list
+CHAT_PAGE_SIZE = 20
+CHAT_MESSAGES_LIMIT_MAX = 50  # cap for the ?messages_limit= window of each chat
+CHAT_HISTORY_PAGE_SIZE = 50  # messages per page of a chat's history
+CHAT_HISTORY_PAGE_SIZE_MAX = 200
+
+# Text to speech
+TTS_MODEL = "lola"
+TTS_FIRST_CHUNK_CHARS = 160  # kept short so the first audio part is ready early
+TTS_CHUNK_CHARS = 500
+TTS_PARALLELISM = 4  # chunks synthesized at once, per process
+
+
+# Prometheus metrics (/metrics): open to scrapers sending "Authorization: Bearer
+# <METRICS_TOKEN>" and to staff signed in by admin session or API access token.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
@@ -6,4 +6,6 @@ class DoctorsConfig(AppConfig):
     name = 'doctors'
 
     def ready(self):
-        import doctors.signals
\ No newline at end of file
+        import doctors.signals
+        from doctors.service.language import preload
+        preload()
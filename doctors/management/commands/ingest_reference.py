@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from doctors.service.reference import ingest
+
+
+class Command(BaseCommand):
+    help = "Chunks, embeds and indexes the medical reference PDFs; unchanged files are skipped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdf-dir', default=str(settings.REFERENCE_PDF_DIR),
+                            help='Folder searched recursively for PDF files.')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-embed every file, e.g. after changing the chunk size.')
+
+    def handle(self, *args, **options):
+        pdf_dir = Path(options['pdf_dir'])
+        if not pdf_dir.is_dir():
+            raise CommandError(f"{pdf_dir} is not a directory")
+        stats = ingest(pdf_dir, log=self.stdout.write, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.added} file(s) embedded, {stats.unchanged} unchanged, {stats.removed} removed; "
+            f"{stats.chunks} chunks indexed"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from doctors.models import Hospital
+from doctors.service.catalog import refresh_hospital_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes every hospital's stored doctor count and departments from its doctors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Hospitals recomputed per round of queries.')
+
+    def handle(self, *args, **options):
+        hospital_ids = list(Hospital.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(hospital_ids), batch_size):
+            refresh_hospital_stats(hospital_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats of {len(hospital_ids)} hospital(s)"))
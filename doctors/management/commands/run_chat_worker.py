@@ -0,0 +1,54 @@
+import time
+from threading import Event, Thread
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from doctors.service.jobs import claim_next_job, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Processes queued chat turns (ChatJob rows) with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.CHAT_JOB_CONCURRENCY,
+                            help='Number of jobs processed in parallel.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before polling again when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=settings.CHAT_JOB_STALE_AFTER,
+                            help='Seconds without a heartbeat after which a running job is considered abandoned and requeued.')
+
+    def handle(self, *args, **options):
+        stop = Event()
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned job(s)")
+
+        threads = [
+            Thread(target=self.work, args=(stop, options['poll_interval']), name=f"chat-worker-{i}", daemon=True)
+            for i in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f"Chat worker started with {len(threads)} thread(s)"))
+
+        try:
+            while True:
+                time.sleep(options['stale_after'])
+                close_old_connections()
+                requeue_stale_jobs(options['stale_after'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for running jobs to finish...")
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, stop, poll_interval):
+        while not stop.is_set():
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            process_job(job)
@@ -0,0 +1,24 @@
+from doctors.service.metrics import finish_request, start_request
+
+
+class ServerTimingMiddleware:
+    """
+    Reports the chat pipeline stages timed during a request in the
+    ``Server-Timing`` response header. For streaming responses only the
+    stages finished before the first byte are included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = finish_request(token)
+        if timings:
+            response['Server-Timing'] = ", ".join(
+                f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings
+            )
+        return response
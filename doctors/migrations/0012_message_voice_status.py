@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0011_rename_fileddescription_doctortranslation_fielddescription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='doctor',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='voice_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10, null=True),
+        ),
+    ]
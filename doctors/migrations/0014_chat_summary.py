@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0013_chatjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0014_chat_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='language',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+    ]
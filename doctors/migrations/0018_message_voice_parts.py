@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0017_content_addressed_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='voice_parts',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0018_message_voice_parts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='translation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='done', max_length=10),
+        ),
+    ]
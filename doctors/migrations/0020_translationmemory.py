@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0019_doctor_translation_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=10)),
+                ('target', models.CharField(max_length=10)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('translation', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'target', 'text_hash'), name='translation_memory_key')],
+            },
+        ),
+    ]
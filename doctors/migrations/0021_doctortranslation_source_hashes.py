@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0020_translationmemory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctortranslation',
+            name='source_hashes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
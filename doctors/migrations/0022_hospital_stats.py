@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_hospital_stats(apps, schema_editor):
+    Hospital = apps.get_model('doctors', 'Hospital')
+    Doctor = apps.get_model('doctors', 'Doctor')
+    DoctorTranslation = apps.get_model('doctors', 'DoctorTranslation')
+
+    counts = dict(Doctor.objects.values('hospital_id').annotate(count=Count('id')).values_list('hospital_id', 'count'))
+    departments = {}
+    rows = (
+        DoctorTranslation.objects.exclude(field='')
+        .order_by('master_id')
+        .values_list('master__hospital_id', 'language_code', 'field')
+    )
+    for hospital_id, language_code, value in rows:
+        fields = departments.setdefault(hospital_id, {}).setdefault(language_code, [])
+        if value not in fields:
+            fields.append(value)
+    for hospital_id in Hospital.objects.values_list('id', flat=True):
+        Hospital.objects.filter(pk=hospital_id).update(
+            doctor_count=counts.get(hospital_id, 0),
+            departments=departments.get(hospital_id, {}),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0021_doctortranslation_source_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='departments',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='doctor_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_hospital_stats, migrations.RunPython.noop),
+    ]
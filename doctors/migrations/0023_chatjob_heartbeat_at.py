@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0022_hospital_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -3,6 +3,7 @@ from parler.models import TranslatableModel, TranslatedFields
 from taggit.managers import TaggableManager
 from django.conf import settings
 from model_utils import FieldTracker
+from doctors.storage import get_chat_media_storage
 
 class Hospital(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='hospitals')
@@ -15,21 +16,41 @@ class Hospital(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
 
+    # Maintained from doctor changes by doctors.service.catalog; rebuild
+    # with `manage.py rebuild_hospital_stats`.
+    doctor_count = models.PositiveIntegerField(default=0, editable=False)
+    departments = models.JSONField(default=dict, blank=True, editable=False)  # language -> distinct fields
+
     def __str__(self):
         return self.name
 
 class Doctor(TranslatableModel):
-    tracker = FieldTracker(fields=['name', 'prize', 'image'])
+    TRANSLATION_PENDING = 'pending'
+    TRANSLATION_DONE = 'done'
+    TRANSLATION_FAILED = 'failed'
+    TRANSLATION_STATUS_CHOICES = [
+        (TRANSLATION_PENDING, 'Pending'),
+        (TRANSLATION_DONE, 'Done'),
+        (TRANSLATION_FAILED, 'Failed'),
+    ]
+
+    tracker = FieldTracker(fields=['name', 'prize', 'image', 'hospital'])
     translations = TranslatedFields(
         field=models.CharField(max_length=100, default=''),
         fieldDescription = models.TextField(blank=True, default=''),
-        description=models.TextField(blank=True, default='')
+        description=models.TextField(blank=True, default=''),
+        # On machine-translated rows: hash of the uz text each field was translated from.
+        source_hashes=models.JSONField(default=dict, blank=True, editable=False),
     )
     name = models.CharField(max_length=255)
     hospital = models.ForeignKey('Hospital', on_delete=models.CASCADE, related_name='doctors')
     prize = models.CharField(max_length=1000)
     image = models.ImageField(upload_to='doctor_images/', default='doctor_images/default_doctor.png')
     tags = TaggableManager(blank=True)
+    # ru/en translations of the uz fields are filled in by a background job.
+    translation_status = models.CharField(
+        max_length=10, choices=TRANSLATION_STATUS_CHOICES, default=TRANSLATION_DONE
+    )
 
     def __str__(self):
         return f"{self.name} ({self.hospital.name})"
@@ -47,17 +68,130 @@ class Chat(models.Model):
 
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, default=None, null=True)
 
+    # Rolling summary of the conversation up to and including summary_message_id;
+    # later messages are replayed verbatim in prompts.
+    summary = models.TextField(blank=True, default='')
+    summary_message_id = models.BigIntegerField(null=True, blank=True)
+    language = models.CharField(max_length=10, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # keyset pagination of a user's chats, newest activity first
+            models.Index(fields=['user_id', '-updated_at', '-id'], name='chat_user_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Chat {self.id} for User {self.user_id}"
 
 class Message(models.Model):
+    VOICE_PENDING = 'pending'
+    VOICE_READY = 'ready'
+    VOICE_FAILED = 'failed'
+    VOICE_STATUS_CHOICES = [
+        (VOICE_PENDING, 'Pending'),
+        (VOICE_READY, 'Ready'),
+        (VOICE_FAILED, 'Failed'),
+    ]
+
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField(blank=True, null=True)
     voice = models.CharField(max_length=255, null=True, blank=True)
-    image = models.ImageField(upload_to='chat_images/', null=True, blank=True)
-    file = models.FileField(upload_to='chat_files/', null=True, blank=True)
+    voice_status = models.CharField(max_length=10, choices=VOICE_STATUS_CHOICES, null=True, blank=True)
+    # URLs of the voice chunks synthesized so far, playable before ``voice`` is ready
+    voice_parts = models.JSONField(default=list, blank=True)
+    image = models.ImageField(upload_to='chat_images/', storage=get_chat_media_storage, null=True, blank=True)
+    file = models.FileField(upload_to='chat_files/', storage=get_chat_media_storage, null=True, blank=True)
     is_from_user = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # latest messages of a chat (previews, windows and history pages)
+            models.Index(fields=['chat', 'created_at', 'id'], name='message_chat_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Message {self.id} in Chat {self.chat.id}"
+
+
+class StoredFile(models.Model):
+    """
+    Reference count of a content-addressed chat upload; the file is deleted
+    when the last message using it goes.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
+
+
+class TranslationMemory(models.Model):
+    """
+    Machine translations already fetched, keyed by language pair and the
+    hash of the normalized source text.
+    """
+    source = models.CharField(max_length=10)
+    target = models.CharField(max_length=10)
+    text_hash = models.CharField(max_length=64)
+    text = models.TextField()
+    translation = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'target', 'text_hash'], name='translation_memory_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.source}->{self.target}: {self.text[:50]}"
+
+
+class ChatJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='jobs')
+    user_message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='+')
+    ai_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    is_first_turn = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    doctors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # refreshed by the worker while the job runs; a stale heartbeat means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # a failed job is not claimed again before this time
+    not_before = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Job {self.id} for Chat {self.chat_id} ({self.status})"
+
+
+class VersionCounter(models.Model):
+    """
+    Version counters of doctors.service.versions when no Redis cache is
+    configured; bumped with an atomic UPDATE so concurrent bumps never
+    hand out the same version.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField()
+
     def __str__(self):
-        return f"Message {self.id} in Chat {self.chat.id}"
\ No newline at end of file
+        return f"{self.name} = {self.value}"
@@ -1,15 +1,42 @@
-from typing import Optional, Union, Tuple
-import base64
+from typing import Iterator, Optional, Union, Tuple
+import logging
 import re
-from langdetect import detect
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from doctors.service.images import encode_image
+from doctors.service.http import get_breaker
+from doctors.service.chat import Prompt
+from doctors.service.language import DEFAULT_LANGUAGE, detect_language
+from doctors.service.metrics import AI_TOKENS, stage
+from doctors.service.tokens import count_tokens
+from doctors.service.vision import describe_image, local_vision_enabled
+import httpx
+from django.conf import settings
 from openai import OpenAI
 from environs import Env
 
+logger = logging.getLogger(__name__)
+
 env = Env()
 env.read_env()
 
-client = OpenAI(api_key=env.str("OPENAI_TOKEN"))
+openai_config = settings.OUTBOUND_SERVICES["openai"]
+client = OpenAI(
+    api_key=env.str("OPENAI_TOKEN"),
+    timeout=httpx.Timeout(openai_config["read_timeout"], connect=openai_config["connect_timeout"]),
+    max_retries=openai_config["retries"],
+    http_client=httpx.Client(limits=httpx.Limits(
+        max_connections=openai_config["pool_size"],
+        max_keepalive_connections=openai_config["pool_size"],
+    )),
+)
+
+
+def create_completion(**kwargs):
+    """
+    Calls the chat completions API behind the 'openai' circuit breaker;
+    the client itself retries with jittered backoff.
+    """
+    return get_breaker("openai").call(client.chat.completions.create, **kwargs)
 
 SYSTEM_PROMPT = """
 You are a professional AI medical assistant working at a hospital. Your role is to help patients describe their symptoms and provide guidance on next steps. You are not a doctor, but you can:
@@ -34,6 +61,7 @@ Your response format must always follow this structure:
 - Never include doctor IDs within the advice text.
 - If unsure about the condition or next steps, advise consulting a doctor or visiting a nearby hospital.
 - Avoid medical jargon unless explaining it clearly.
+- When medical reference excerpts are provided, ground your advice in them where they are relevant.
 - Ensure responses are culturally sensitive and appropriate for the detected language.
 """
 
@@ -63,62 +91,162 @@ def parse_ai_response(answer: str) -> Tuple[str, list]:
     return main_response, doctor_ids
 
 
-def generate_answer(
-    prompt: str,
+def record_usage(model: str, usage):
+    """
+    Logs and records token usage, including how many prompt tokens the
+    provider served from its prefix cache.
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    AI_TOKENS.observe(usage.prompt_tokens, model=model, kind="prompt")
+    AI_TOKENS.observe(cached, model=model, kind="cached_prompt")
+    AI_TOKENS.observe(usage.completion_tokens, model=model, kind="completion")
+    logger.info(
+        "%s usage: %d prompt tokens (%d cached, %d uncached), %d completion tokens",
+        model, usage.prompt_tokens, cached, usage.prompt_tokens - cached, usage.completion_tokens,
+    )
+
+
+def cacheable_prefix_tokens(messages: list) -> int:
+    """
+    Tokens in the leading system messages, the part of the prompt shared
+    between turns, or 0 when that is too short for the provider to cache.
+    """
+    tokens = 0
+    for message in messages:
+        if message["role"] != "system":
+            break
+        tokens += count_tokens(message["content"])
+    return tokens if tokens >= settings.PROMPT_CACHE_MIN_TOKENS else 0
+
+
+def build_messages(
+    prompt: Prompt,
     image_path: Optional[Union[str, InMemoryUploadedFile]] = None,
-    file_text: Optional[str] = None
+    file_text: Optional[str] = None,
+    lang: Optional[str] = None
 ) -> Tuple[str, list]:
     """
-    Generates a structured medical response using OpenAI GPT model.
-    Automatically detects user's language and ensures proper formatting.
+    Builds the model name and chat messages for a prompt.
+    The system prompt and the versioned roster come first and stay
+    byte-identical between turns, so the provider can serve them from its
+    prompt cache; everything that changes per turn follows them. Only a
+    prefix of ``PROMPT_CACHE_MIN_TOKENS`` or more is cached, and the system
+    prompt alone is shorter: caching applies when ``select_candidates``
+    returned the full roster and the two together reach that length.
+    ``lang`` is the language of the user's own message; without one it is
+    detected from the attached file, never from the assembled prompt.
     """
-    # Detect language for better consistency
-    try:
-        lang = detect(prompt)
-    except Exception:
-        lang = "en"
+    if lang is None:
+        lang = detect_language(file_text) if file_text else DEFAULT_LANGUAGE
 
     user_prompt = (
         f"User message language: {lang}\n"
-        f"User message and context:\n{prompt}\n"
+        f"User message and context:\n{prompt.turn}\n"
     )
 
     if file_text:
         user_prompt += f"\nAttached file content:\n{file_text}\n"
 
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": user_prompt}
-    ]
+    # A local vision model turns the image into text, so the turn can go to
+    # the cheaper text model; if it fails the image is sent to gpt-4o.
+    if image_path and local_vision_enabled():
+        description = describe_image(image_path)
+        if description:
+            user_prompt += f"\nAttached image description:\n{description}\n"
+            image_path = None
 
-    # Add image support if provided
+    # With an image, the text and the image go in one multimodal message
+    # so the prompt is sent only once.
     if image_path:
-        if isinstance(image_path, InMemoryUploadedFile):
-            image_bytes = image_path.read()
-        else:
-            with open(image_path, "rb") as img:
-                image_bytes = img.read()
-
-        messages.append({
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode(),
-                        "detail": "auto"
-                    }
+        user_content = [
+            {"type": "text", "text": user_prompt},
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": encode_image(image_path),
+                    "detail": "auto"
                 }
-            ]
-        })
+            }
+        ]
+    else:
+        user_content = user_prompt
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if prompt.roster:
+        messages.append({"role": "system", "content": f"Doctors available:\n{prompt.roster}\n"})
+    messages.append({"role": "user", "content": user_content})
 
     model = "gpt-4o" if image_path else "gpt-4o-mini"
+    return model, messages
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages
-    )
+
+def generate_answer(
+    prompt: Prompt,
+    image_path: Optional[Union[str, InMemoryUploadedFile]] = None,
+    file_text: Optional[str] = None,
+    lang: Optional[str] = None
+) -> Tuple[str, list]:
+    """
+    Generates a structured medical response using OpenAI GPT model.
+    """
+    model, messages = build_messages(prompt, image_path, file_text, lang)
+
+    with stage("generate_answer"):
+        response = create_completion(
+            model=model,
+            messages=messages
+        )
+    record_usage(model, response.usage)
 
     answer = response.choices[0].message.content
     return parse_ai_response(answer)
+
+
+def stream_answer(model: str, messages: list) -> Iterator[str]:
+    """
+    Yields the raw answer text as the model produces it.
+    The caller joins the pieces and runs ``parse_ai_response`` at the end.
+    """
+    with stage("generate_answer"):
+        stream = create_completion(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    record_usage(model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            # Opening the stream already counted as a success; count a failure mid-stream too.
+            get_breaker("openai").record_error(e)
+            raise
+
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a patient and an AI medical assistant.
+Update the existing summary with the new messages. Keep the patient's symptoms, their duration and severity,
+relevant history, attached files or images and what they showed, advice already given and doctor IDs already recommended.
+Write at most 150 words, in the language of the conversation. Reply with the summary only.
+"""
+
+
+def summarize_conversation(summary: str, transcript: str) -> str:
+    """
+    Folds new transcript lines into an existing conversation summary.
+    """
+    response = create_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+        ]
+    )
+    record_usage("gpt-4o-mini", response.usage)
+    return (response.choices[0].message.content or "").strip()
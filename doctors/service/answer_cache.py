@@ -0,0 +1,99 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from doctors.service.language import detect_language
+from doctors.service.metrics import ANSWER_CACHE_LOOKUPS
+from doctors.service.reference import reference_version
+from doctors.service.roster import ROSTER
+from doctors.service.versions import get_version
+
+_APOSTROPHES = re.compile(r"[’‘ʻʼ`']")
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+class AnswerCache:
+    """
+    Thread-safe LRU of AI answers with a per-entry time to live. Hits and
+    misses are exported as ``diagno_answer_cache_lookups_total``.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, tuple]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                ANSWER_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            ANSWER_CACHE_LOOKUPS.inc(result="hit")
+            return entry[1]
+
+    def set(self, key: str, value: tuple):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+answer_cache = AnswerCache(settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_TTL)
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _APOSTROPHES.sub("", text)
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def geocell(latitude: float, longitude: float) -> str:
+    size = settings.ANSWER_CACHE_CELL_DEGREES
+    return f"{int(latitude // size)}:{int(longitude // size)}"
+
+
+def answer_key(message: str, latitude: float, longitude: float) -> Optional[str]:
+    """
+    Builds the cache key for a history-free text turn, or None when the
+    text is empty. The roster and reference index versions are part of the
+    key, so any doctor or hospital change, or newly ingested reference
+    material, makes earlier answers unreachable.
+    """
+    text = normalize_text(message)
+    if not text:
+        return None
+    lang = detect_language(text)
+    raw = f"{get_version(ROSTER)}|{reference_version()}|{lang}|{geocell(latitude, longitude)}|{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
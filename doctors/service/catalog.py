@@ -0,0 +1,63 @@
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Count
+
+from doctors.models import Doctor, Hospital
+
+DoctorTranslation = Doctor._parler_meta.root_model
+
+
+def doctor_queryset():
+    """
+    Doctors with everything the catalog serializers read: the hospital,
+    translations and tags, in a fixed number of queries.
+    """
+    return Doctor.objects.select_related('hospital').prefetch_related('translations', 'tags')
+
+
+def refresh_hospital_stats(hospital_ids: Iterable[int]):
+    """
+    Recomputes the stored ``doctor_count`` and per-language ``departments``
+    (distinct doctor fields, in doctor order) of the given hospitals.
+    """
+    hospital_ids = {hospital_id for hospital_id in hospital_ids if hospital_id is not None}
+    if not hospital_ids:
+        return
+
+    counts = dict(
+        Doctor.objects.filter(hospital_id__in=hospital_ids)
+        .values('hospital_id')
+        .annotate(count=Count('id'))
+        .values_list('hospital_id', 'count')
+    )
+    departments = {hospital_id: {} for hospital_id in hospital_ids}
+    rows = (
+        DoctorTranslation.objects.filter(master__hospital_id__in=hospital_ids)
+        .exclude(field='')
+        .order_by('master_id')
+        .values_list('master__hospital_id', 'language_code', 'field')
+    )
+    for hospital_id, language_code, value in rows:
+        fields = departments[hospital_id].setdefault(language_code, [])
+        if value not in fields:
+            fields.append(value)
+
+    for hospital_id in hospital_ids:
+        Hospital.objects.filter(pk=hospital_id).update(
+            doctor_count=counts.get(hospital_id, 0),
+            departments=departments[hospital_id],
+        )
+
+
+def schedule_hospital_stats(*hospital_ids: int):
+    """Refreshes the hospitals' stats once the surrounding transaction commits."""
+    transaction.on_commit(lambda: refresh_hospital_stats(hospital_ids))
+
+
+def schedule_doctor_hospital_stats(doctor_id: int):
+    """Refreshes the stats of the doctor's hospital once the surrounding transaction commits."""
+    def run():
+        refresh_hospital_stats(Doctor.objects.filter(pk=doctor_id).values_list('hospital_id', flat=True))
+
+    transaction.on_commit(run)
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from doctors.models import Chat
+from doctors.service.answer_cache import answer_cache, answer_key
+from doctors.service.extraction import extract_file_text
+from doctors.service.geo import get_hospital_index
+from doctors.service.language import chat_language, detect_language
+from doctors.service.metrics import stage
+from doctors.service.reference import search_reference
+from doctors.service.retrieval import Candidates, select_candidates
+from doctors.service.summary import format_message, recent_history, unsummarized_messages
+
+
+@stage("nearest_hospitals")
+def format_nearest_hospitals(latitude, longitude):
+    nearest = get_hospital_index().nearest(latitude, longitude, k=settings.AI_NEAREST_HOSPITALS)
+    if not nearest:
+        return "N/A"
+    return "\n".join(f"- {h['name']} ({h['distance']:.1f} km)" for h in nearest)
+
+
+@dataclass
+class Prompt:
+    """
+    A prompt split for upstream prefix caching. ``roster`` is the full doctor
+    roster, identical for every chat until the roster version changes, and is
+    sent right after the system prompt; it is empty when retrieval picked
+    per-turn candidates instead, which leaves too short a prefix to cache.
+    ``turn`` holds everything specific to the turn.
+    """
+    turn: str
+    roster: str = ""
+
+
+@stage("reference")
+def format_reference(query: str) -> str:
+    """Medical reference excerpts relevant to ``query``, or an empty string."""
+    chunks = search_reference(query)
+    if not chunks:
+        return ""
+    excerpts = "\n".join(f"[{chunk.source}] {chunk.text}" for chunk in chunks)
+    return f"Medical reference excerpts:\n{excerpts}\n"
+
+
+def _doctor_context(candidates: Candidates) -> Tuple[str, str]:
+    """Returns ``(roster, turn_section)`` for the selected doctors."""
+    if candidates.is_full_roster:
+        return candidates.block, ""
+    return "", f"Doctors available:\n{candidates.block}\n"
+
+
+def build_new_chat_prompt(message, latitude, longitude) -> Prompt:
+    with stage("roster"):
+        candidates = select_candidates(message, latitude, longitude)
+    roster, doctor_info = _doctor_context(candidates)
+    nearest_hospitals = format_nearest_hospitals(latitude, longitude)
+    turn = (
+        f"{doctor_info}"
+        f"Nearest hospitals:\n{nearest_hospitals}\n"
+        f"{format_reference(message)}"
+        f"User message: {message}\n"
+    )
+    return Prompt(turn, roster)
+
+
+def build_followup_prompt(chat: Chat, message, before_message_id: Optional[int] = None) -> Prompt:
+    """
+    Builds the prompt for a follow-up turn from the chat's rolling summary
+    and its most recent messages. ``before_message_id`` excludes the turn's
+    own, already saved, message from the history.
+    """
+    recent = recent_history(list(unsummarized_messages(chat, before_message_id)))
+    history = "\n".join(format_message(msg) for msg in recent)
+    query = " ".join([chat.summary] + [msg.content for msg in recent if msg.is_from_user and msg.content] + [message or ''])
+    with stage("roster"):
+        candidates = select_candidates(query, chat.latitude, chat.longitude)
+    roster, doctor_info = _doctor_context(candidates)
+    nearest_hospitals = format_nearest_hospitals(chat.latitude, chat.longitude)
+    summary = f"Conversation summary:\n{chat.summary}\n" if chat.summary else ""
+    turn = (
+        f"{doctor_info}"
+        f"Nearest hospitals:\n{nearest_hospitals}\n"
+        f"{format_reference(query)}"
+        f"{summary}"
+        f"Previous chat history:\n{history}\n"
+        f"New user message: {message or '[file/image]'}\n"
+    )
+    return Prompt(turn, roster)
+
+
+def new_chat_cache_key(message, latitude, longitude, image=None, file=None) -> Optional[str]:
+    """
+    Cache key for the answer to a new chat; only plain-text first turns
+    are cacheable.
+    """
+    if image or file or not message:
+        return None
+    return answer_key(message, latitude, longitude)
+
+
+def new_chat_inputs(message, latitude, longitude, file=None) -> Tuple[Prompt, Optional[str], Optional[str]]:
+    """Returns ``(prompt, file_text, lang)`` for the first turn of a chat."""
+    prompt = build_new_chat_prompt(message, latitude, longitude)
+    file_text = extract_file_text(file) if file else None
+    return prompt, file_text, detect_language(message, default=None)
+
+
+def followup_inputs(chat: Chat, message, file=None,
+                    before_message_id: Optional[int] = None) -> Tuple[Prompt, Optional[str], str]:
+    """Returns ``(prompt, file_text, lang)`` for a follow-up turn."""
+    prompt = build_followup_prompt(chat, message, before_message_id)
+    file_text = extract_file_text(file) if file else None
+    return prompt, file_text, chat_language(chat, message)
+
+
+def answer_new_chat(message, latitude, longitude, image=None, file=None) -> Tuple[str, list]:
+    """
+    Answers the first turn of a chat, serving repeated plain-text questions
+    from the answer cache.
+    """
+    from doctors.service.ai import generate_answer
+
+    key = new_chat_cache_key(message, latitude, longitude, image, file)
+    if key:
+        cached = answer_cache.get(key)
+        if cached:
+            return cached
+    prompt, file_text, lang = new_chat_inputs(message, latitude, longitude, file)
+    response_text, doctor_ids = generate_answer(prompt, image, file_text, lang)
+    if key and response_text:
+        answer_cache.set(key, (response_text, doctor_ids))
+    return response_text, doctor_ids
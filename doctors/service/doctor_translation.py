@@ -0,0 +1,97 @@
+import logging
+from typing import Dict, List, Optional
+
+from django.db import transaction
+
+from doctors.models import Doctor
+from doctors.service.background import submit
+from doctors.service.translation import normalize_source, text_hash, translate_many
+
+logger = logging.getLogger(__name__)
+
+DoctorTranslation = Doctor._parler_meta.root_model
+
+FIELDS = ("field", "fieldDescription", "description")
+SOURCE_LANGUAGE = "uz"
+TARGET_LANGUAGES = ("ru", "en")
+
+
+def source_hashes(source) -> Dict[str, str]:
+    """Hashes of the normalized uz text of each field, as stored on translations."""
+    return {name: text_hash(normalize_source(getattr(source, name, "") or "")) for name in FIELDS}
+
+
+def stale_fields(translation, hashes: Dict[str, str]) -> List[str]:
+    """Fields of a target translation (None if missing) not translated from the current uz text."""
+    stored = translation.source_hashes if translation is not None else {}
+    return [name for name in FIELDS if stored.get(name) != hashes[name]]
+
+
+def _targets(doctor_id: int) -> Dict[str, object]:
+    return {
+        t.language_code: t
+        for t in DoctorTranslation.objects.filter(master_id=doctor_id, language_code__in=TARGET_LANGUAGES)
+    }
+
+
+def translate_doctor(doctor_id: int):
+    """
+    Background job: brings a doctor's ru/en translations up to date with
+    the uz fields. Only fields whose uz text changed since they were last
+    translated are sent, in one batched request per language, and only
+    target rows with stale fields are saved.
+    """
+    source = DoctorTranslation.objects.filter(master_id=doctor_id, language_code=SOURCE_LANGUAGE).first()
+    if source is None:
+        return
+    hashes = source_hashes(source)
+    targets = _targets(doctor_id)
+    try:
+        for target in TARGET_LANGUAGES:
+            translation = targets.get(target)
+            stale = stale_fields(translation, hashes)
+            if not stale:
+                continue
+            values = translate_many([getattr(source, name) for name in stale], SOURCE_LANGUAGE, target)
+            if translation is None:
+                translation = DoctorTranslation(master_id=doctor_id, language_code=target)
+            for name, value in zip(stale, values):
+                setattr(translation, name, value)
+            translation.source_hashes = {**translation.source_hashes, **{name: hashes[name] for name in stale}}
+            translation.save()
+    except Exception:
+        logger.exception("Translating doctor %s failed", doctor_id)
+        Doctor.objects.filter(pk=doctor_id).update(translation_status=Doctor.TRANSLATION_FAILED)
+        return
+
+    # A save during the job has queued another run; that one finishes the job.
+    current = DoctorTranslation.objects.filter(master_id=doctor_id, language_code=SOURCE_LANGUAGE).first()
+    if current is not None and source_hashes(current) == hashes:
+        Doctor.objects.filter(pk=doctor_id).update(translation_status=Doctor.TRANSLATION_DONE)
+
+
+def schedule_translation(source, doctor: Optional[Doctor] = None):
+    """
+    Called with a saved uz translation. If any of its fields differs from
+    the text the ru/en translations were made from, marks the doctor's
+    translations pending and queues one translation job for when the
+    surrounding transaction commits, however many times it is saved
+    before then. Saves that change no uz text cost one read.
+    """
+    if getattr(source, "_translation_scheduled", False):
+        return
+    hashes = source_hashes(source)
+    targets = _targets(source.master_id)
+    if not any(stale_fields(targets.get(target), hashes) for target in TARGET_LANGUAGES):
+        return
+
+    source._translation_scheduled = True
+    if doctor is not None:
+        doctor.translation_status = Doctor.TRANSLATION_PENDING
+    Doctor.objects.filter(pk=source.master_id).update(translation_status=Doctor.TRANSLATION_PENDING)
+
+    def run():
+        source._translation_scheduled = False
+        submit(translate_doctor, source.master_id)
+
+    transaction.on_commit(run)
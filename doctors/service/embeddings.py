@@ -0,0 +1,83 @@
+import hashlib
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+from django.conf import settings
+
+from doctors.service.retrieval import tokenize
+
+
+class StandInEmbedder:
+    """
+    Deterministic local embedder using the hashing trick: every term of
+    ``retrieval.tokenize`` lands in one of ``dim`` signed buckets, weighted
+    by log term frequency. No model or network is needed, so ingestion and
+    search behave the same in tests and offline.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.signature = f"stand-in:{dim}"
+
+    @lru_cache(maxsize=200_000)
+    def _bucket(self, term: str):
+        value = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(tokenize(text)).items():
+                bucket, sign = self._bucket(term)
+                vectors[row, bucket] += sign * (1 + math.log(count))
+        return normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """Embeds through the OpenAI embeddings API, shortened to ``dim`` dimensions."""
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+        self.signature = f"openai:{model}:{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        from doctors.service.ai import client
+        from doctors.service.http import get_breaker
+
+        response = get_breaker("openai").call(
+            client.embeddings.create, model=self.model, input=list(texts), dimensions=self.dim
+        )
+        data = sorted(response.data, key=lambda item: item.index)
+        return normalize(np.array([item.embedding for item in data], dtype=np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+_embedders = {}
+
+
+def get_embedder():
+    """Returns the embedder configured by ``REFERENCE_EMBEDDER``."""
+    name = settings.REFERENCE_EMBEDDER
+    if name not in _embedders:
+        if name == "openai":
+            _embedders[name] = OpenAIEmbedder(settings.REFERENCE_EMBEDDING_MODEL, settings.REFERENCE_EMBEDDING_DIM)
+        elif name == "stand-in":
+            _embedders[name] = StandInEmbedder(settings.REFERENCE_EMBEDDING_DIM)
+        else:
+            raise ValueError(f"Unknown REFERENCE_EMBEDDER {name!r}")
+    return _embedders[name]
+
+
+def embed_batches(embedder, texts: List[str], batch_size: int) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, embedder.dim), dtype=np.float32)
+    return np.vstack([embedder.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
@@ -0,0 +1,222 @@
+import codecs
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from threading import Lock
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from doctors.service.hashing import file_sha256, iter_chunks
+from doctors.service.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+EXTRACTION_FAILURE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _report_pid(started):
+    started.put(os.getpid())
+
+
+class ExtractionPool:
+    """
+    A spawn process pool that records its workers' PIDs as they start, so
+    a parse that timed out can be killed instead of holding its worker.
+    """
+
+    def __init__(self, workers: int):
+        # spawn: forking a multi-threaded web worker is unsafe.
+        context = multiprocessing.get_context('spawn')
+        self._started = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_report_pid,
+            initargs=(self._started,),
+        )
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def kill(self):
+        """Cancels queued jobs and terminates every worker; running jobs fail with BrokenProcessPool."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while not self._started.empty():
+            try:
+                os.kill(self._started.get(), signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _get_pool() -> ExtractionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ExtractionPool(settings.FILE_EXTRACTION_WORKERS)
+    return _pool
+
+
+def _kill_pool(pool: ExtractionPool):
+    """
+    Kills the pool's workers: a parse that timed out keeps running
+    otherwise and holds its worker. The next extraction starts a new pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.kill()
+
+
+def _run_pdf(path: str, max_pages: int, max_chars: int) -> str:
+    pool = _get_pool()
+    future = pool.submit(_extract_pdf, path, max_pages, max_chars)
+    try:
+        return future.result(timeout=settings.PDF_EXTRACTION_TIMEOUT)
+    except TimeoutError:
+        _kill_pool(pool)
+        raise ExtractionTimeout()
+
+
+def _extract_pdf(path: str, max_pages: int, max_chars: int) -> str:
+    """
+    Runs in the process pool. Pages are read one at a time from the file
+    at ``path`` and reading stops at either budget.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    parts = []
+    size = 0
+    for number, page in enumerate(reader.pages):
+        if number >= max_pages or size >= max_chars:
+            break
+        text = page.extract_text()
+        if text:
+            parts.append(text)
+            size += len(text) + 1
+    return "\n".join(parts)[:max_chars]
+
+
+@contextmanager
+def _pdf_path(file):
+    """
+    A filesystem path for the PDF the worker can open itself. In-memory or
+    remote files are spooled to a temporary file in chunks, never read
+    into memory whole.
+    """
+    if isinstance(file, str):
+        yield file
+        return
+    if hasattr(file, 'temporary_file_path'):
+        yield file.temporary_file_path()
+        return
+    try:
+        yield file.path
+        return
+    except (AttributeError, NotImplementedError, ValueError):
+        pass
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as spool:
+        for chunk in iter_chunks(file):
+            spool.write(chunk)
+    try:
+        yield spool.name
+    finally:
+        os.remove(spool.name)
+
+
+def _extract_txt(file, max_chars: int) -> str:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    parts = []
+    size = 0
+    for chunk in iter_chunks(file):
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        parts.append(text)
+        size += len(text)
+        if size >= max_chars:
+            break
+    return "Text extracted from user's file: " + "".join(parts)[:max_chars]
+
+
+def _extract_docx(file, max_chars: int) -> str:
+    from docx import Document
+
+    if not isinstance(file, str):
+        file.seek(0)
+    parts = []
+    size = 0
+    for paragraph in Document(file).paragraphs:
+        parts.append(paragraph.text)
+        size += len(paragraph.text) + 1
+        if size >= max_chars:
+            break
+    return "\n".join(parts)[:max_chars]
+
+
+def _extract(file, name: str) -> Optional[str]:
+    max_chars = settings.FILE_TEXT_MAX_CHARS
+    if name.endswith('.txt'):
+        return _extract_txt(file, max_chars)
+    if name.endswith('.pdf'):
+        with _pdf_path(file) as path:
+            try:
+                return _run_pdf(path, settings.PDF_MAX_PAGES, max_chars)
+            except BrokenProcessPool:
+                # Another request's timeout killed the pool under this one.
+                return _run_pdf(path, settings.PDF_MAX_PAGES, max_chars)
+    if name.endswith('.docx'):
+        return _extract_docx(file, max_chars)
+    return None
+
+
+@stage("extraction")
+def extract_file_text(file) -> Optional[str]:
+    """
+    Extracts plain text from an uploaded or stored TXT, PDF or DOCX file.
+    Results, and timeouts, are cached by content hash, so the same document
+    uploaded again is not parsed twice. Returns None for unsupported files or when
+    extraction fails.
+    """
+    name = getattr(file, 'name', str(file)).lower()
+    if not name.endswith(('.txt', '.pdf', '.docx')):
+        return None
+
+    digest = file_sha256(file)
+    key = f"doctors:extract:{digest}"
+    failed_key = f"doctors:extract-failed:{digest}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    if cache.get(failed_key):
+        return None
+
+    try:
+        text = _extract(file, name)
+    except ExtractionTimeout:
+        # Remembered so retries of the same document do not tie up the pool again.
+        logger.warning("Extraction of %s timed out", name)
+        cache.set(failed_key, True, EXTRACTION_FAILURE_CACHE_TIMEOUT)
+        return None
+    except Exception:
+        logger.exception("Could not extract text from %s", name)
+        return None
+    if text is not None:
+        cache.set(key, text, EXTRACTION_CACHE_TIMEOUT)
+    return text
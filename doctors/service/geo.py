@@ -0,0 +1,169 @@
+from math import radians, cos
+from threading import Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from doctors.models import Hospital
+from doctors.service.versions import get_version, bump_version
+
+EARTH_RADIUS_KM = 6371
+HOSPITALS = "hospitals"
+
+
+class _Columns(NamedTuple):
+    ids: np.ndarray
+    names: Tuple[str, ...]
+    lat: np.ndarray
+    lon: np.ndarray
+    cos_lat: np.ndarray
+
+
+class HospitalIndex:
+    """
+    In-memory index over hospital coordinates.
+    Coordinates are kept as radians in NumPy arrays so a query is a single
+    vectorized haversine pass instead of a Python loop over every hospital.
+    Changes build new arrays and swap them in with one assignment, so
+    readers need no lock and always see columns of the same length.
+    """
+
+    def __init__(self, hospitals: Iterable[Tuple[int, str, float, float]] = (), version: Optional[int] = None):
+        rows = list(hospitals)
+        self.version = version
+        lat = np.radians(np.array([r[2] for r in rows], dtype=np.float64))
+        self._columns = _Columns(
+            ids=np.array([r[0] for r in rows], dtype=np.int64),
+            names=tuple(r[1] for r in rows),
+            lat=lat,
+            lon=np.radians(np.array([r[3] for r in rows], dtype=np.float64)),
+            cos_lat=np.cos(lat),
+        )
+
+    def __len__(self):
+        return len(self._columns.ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._columns.ids
+
+    def upsert(self, hospital_id: int, name: str, latitude: float, longitude: float):
+        lat, lon = radians(latitude), radians(longitude)
+        c = self._columns
+        found = np.flatnonzero(c.ids == hospital_id)
+        if not found.size:
+            self._columns = _Columns(
+                ids=np.append(c.ids, hospital_id),
+                names=c.names + (name,),
+                lat=np.append(c.lat, lat),
+                lon=np.append(c.lon, lon),
+                cos_lat=np.append(c.cos_lat, cos(lat)),
+            )
+            return
+        pos = int(found[0])
+        names = list(c.names)
+        names[pos] = name
+        columns = _Columns(c.ids, tuple(names), c.lat.copy(), c.lon.copy(), c.cos_lat.copy())
+        columns.lat[pos], columns.lon[pos], columns.cos_lat[pos] = lat, lon, cos(lat)
+        self._columns = columns
+
+    def remove(self, hospital_id: int):
+        c = self._columns
+        found = np.flatnonzero(c.ids == hospital_id)
+        if not found.size:
+            return
+        pos = int(found[0])
+        self._columns = _Columns(
+            ids=np.delete(c.ids, pos),
+            names=c.names[:pos] + c.names[pos + 1:],
+            lat=np.delete(c.lat, pos),
+            lon=np.delete(c.lon, pos),
+            cos_lat=np.delete(c.cos_lat, pos),
+        )
+
+    @staticmethod
+    def _distances(c: _Columns, latitude: float, longitude: float) -> np.ndarray:
+        lat, lon = radians(latitude), radians(longitude)
+        a = np.sin((c.lat - lat) / 2) ** 2 + cos(lat) * c.cos_lat * np.sin((c.lon - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def distances(self, latitude: float, longitude: float) -> np.ndarray:
+        """
+        Great-circle distances in kilometers from the point to every hospital.
+        """
+        return self._distances(self._columns, latitude, longitude)
+
+    def distances_by_id(self, latitude: float, longitude: float) -> Dict[int, float]:
+        """Distances in kilometers keyed by hospital id."""
+        c = self._columns
+        return dict(zip(c.ids.tolist(), self._distances(c, latitude, longitude).tolist()))
+
+    @staticmethod
+    def _result(c: _Columns, order: np.ndarray, dist: np.ndarray) -> List[dict]:
+        return [
+            {"id": int(c.ids[i]), "name": c.names[i], "distance": float(dist[i])}
+            for i in order
+        ]
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> List[dict]:
+        """
+        Returns up to ``k`` hospitals ordered by distance, each as
+        ``{"id", "name", "distance"}`` with the distance in kilometers.
+        Hospitals at the same distance keep the order they were added in.
+        """
+        c = self._columns
+        if not len(c.ids) or k <= 0:
+            return []
+        dist = self._distances(c, latitude, longitude)
+        k = min(k, len(dist))
+        part = np.argpartition(dist, k - 1)[:k]
+        return self._result(c, part[np.lexsort((part, dist[part]))], dist)
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[dict]:
+        """
+        Returns every hospital within ``radius_km`` ordered by distance.
+        """
+        c = self._columns
+        if not len(c.ids):
+            return []
+        dist = self._distances(c, latitude, longitude)
+        inside = np.flatnonzero(dist <= radius_km)
+        return self._result(c, inside[np.argsort(dist[inside], kind="stable")], dist)
+
+
+_index = HospitalIndex()
+_lock = Lock()
+
+
+def get_hospital_index() -> HospitalIndex:
+    """
+    Returns the process-wide hospital index, rebuilding it from the
+    database only when another process changed a hospital.
+    """
+    global _index
+    version = get_version(HOSPITALS)
+    if _index.version == version:
+        return _index
+    with _lock:
+        if _index.version != version:
+            rows = Hospital.objects.values_list("id", "name", "latitude", "longitude")
+            _index = HospitalIndex(rows, version=version)
+    return _index
+
+
+def apply_hospital_change(hospital: Hospital, deleted: bool = False):
+    """
+    Publishes a hospital change to other processes and applies it to this
+    process's index in place, avoiding a full rebuild when the local index
+    was current.
+    """
+    version = bump_version(HOSPITALS)
+    with _lock:
+        if _index.version is None:
+            return
+        if deleted:
+            _index.remove(hospital.pk)
+        else:
+            _index.upsert(hospital.pk, hospital.name, hospital.latitude, hospital.longitude)
+        if _index.version == version - 1:
+            _index.version = version
@@ -0,0 +1,54 @@
+import hashlib
+import re
+from typing import Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+# Names given by doctors.storage.ContentAddressedStorage: <prefix>/ab/cd/<sha256><ext>
+CONTENT_ADDRESSED_NAME = re.compile(r"(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(?:\.\w+)?$")
+
+
+def iter_chunks(file) -> Iterator[bytes]:
+    """
+    Reads a file object (from the start) or a filesystem path in chunks.
+    """
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+        return
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if hasattr(file, 'chunks'):
+        yield from file.chunks(CHUNK_SIZE)
+    else:
+        yield from iter(lambda: file.read(CHUNK_SIZE), b'')
+
+
+def hash_from_name(name: Optional[str]) -> Optional[str]:
+    """The SHA-256 encoded in a content-addressed file name or path, if any."""
+    match = CONTENT_ADDRESSED_NAME.search(str(name or '').replace('\\', '/'))
+    return match.group(3) if match else None
+
+
+def file_sha256(file) -> str:
+    """
+    Hex SHA-256 of an uploaded or stored file, or of a filesystem path.
+    Content-addressed files are not read: their name is their hash. The
+    hash of an upload is remembered on it, so caches and storage share one pass.
+    """
+    known = hash_from_name(file if isinstance(file, str) else getattr(file, 'name', None))
+    if known is None:
+        known = getattr(file, '_sha256', None)
+    if known is not None:
+        return known
+    digest = hashlib.sha256()
+    for chunk in iter_chunks(file):
+        digest.update(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if not isinstance(file, str):
+        try:
+            file._sha256 = digest.hexdigest()
+        except AttributeError:
+            pass
+    return digest.hexdigest()
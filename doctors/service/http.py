@@ -0,0 +1,194 @@
+import logging
+import random
+import time
+from threading import Lock
+from typing import Callable, Tuple, Type
+
+import openai
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class UpstreamError(Exception):
+    """Raised for a retryable HTTP status after retries are exhausted."""
+
+    def __init__(self, response):
+        super().__init__(f"Upstream responded with status code {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+
+# Errors that say the upstream itself is unavailable; openai.APIConnectionError
+# includes its timeouts.
+UNAVAILABLE_ERRORS = (requests.ConnectionError, requests.Timeout, openai.APIConnectionError)
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    True for connection errors, timeouts, 429 and 5xx responses. Client
+    errors (a bad image, too much context) are one caller's problem and
+    do not count against the upstream.
+    """
+    if isinstance(exc, UNAVAILABLE_ERRORS):
+        return True
+    status_code = getattr(exc, 'status_code', None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_timeout`` seconds; then lets one trial call through and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        with self._lock:
+            self._trial_running = False
+
+    def record_error(self, exc: BaseException):
+        """Records ``exc`` as a failure if it is an upstream failure; other errors leave the counts alone."""
+        if is_upstream_failure(exc):
+            self.record_failure()
+        else:
+            self.release_trial()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def with_retries(fn: Callable, retries: int, retry_on: Tuple[Type[BaseException], ...],
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+    """Calls ``fn`` and retries it up to ``retries`` times on ``retry_on`` errors."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except retry_on:
+            attempt += 1
+            if attempt > retries:
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+
+
+def service_config(service: str) -> dict:
+    return settings.OUTBOUND_SERVICES[service]
+
+
+_breakers = {}
+_sessions = {}
+_registry_lock = Lock()
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    with _registry_lock:
+        if service not in _breakers:
+            config = service_config(service)
+            _breakers[service] = CircuitBreaker(service, config['failure_threshold'], config['reset_timeout'])
+        return _breakers[service]
+
+
+def get_session(service: str) -> requests.Session:
+    """
+    Returns the keep-alive session for ``service``; its connection pool is
+    shared by every thread of the process.
+    """
+    with _registry_lock:
+        if service not in _sessions:
+            config = service_config(service)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config['pool_size'])
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[service] = session
+        return _sessions[service]
+
+
+def request(service: str, method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Sends an HTTP request to ``service`` through its pooled session with the
+    service's timeout, jittered retries on connection errors, timeouts and
+    429/5xx responses, and its circuit breaker.
+    """
+    config = service_config(service)
+    session = get_session(service)
+    kwargs.setdefault('timeout', (config['connect_timeout'], config['read_timeout']))
+
+    def send():
+        response = session.request(method, url, **kwargs)
+        if response.status_code in RETRY_STATUS_CODES:
+            raise UpstreamError(response)
+        return response
+
+    def send_with_retries():
+        return with_retries(
+            send,
+            retries=config['retries'],
+            retry_on=(requests.ConnectionError, requests.Timeout, UpstreamError),
+        )
+
+    return get_breaker(service).call(send_with_retries)
@@ -0,0 +1,61 @@
+import base64
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageOps
+
+from doctors.service.hashing import file_sha256, iter_chunks
+
+IMAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# gpt-4o fits images into 2048x2048 and then scales the shortest side down
+# to 768 px; anything larger is uploaded only to be thrown away.
+VISION_MAX_LONG_SIDE = 2048
+VISION_MAX_SHORT_SIDE = 768
+
+
+def _target_size(width: int, height: int):
+    scale = min(
+        1.0,
+        VISION_MAX_LONG_SIDE / max(width, height),
+        VISION_MAX_SHORT_SIDE / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def load_image(image) -> Image.Image:
+    """
+    Opens an uploaded or stored image as RGB, upright according to its EXIF
+    orientation and downsized to the resolution vision models actually use.
+    """
+    with Image.open(io.BytesIO(b''.join(iter_chunks(image)))) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        size = _target_size(*img.size)
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+        img.load()
+        return img
+
+
+def encode_image(image) -> str:
+    """
+    Returns a JPEG data URL for an uploaded or stored image, upright
+    according to its EXIF orientation and downsized to the resolution
+    the vision model actually uses. Results are cached by content hash
+    and output settings.
+    """
+    quality = settings.VISION_IMAGE_JPEG_QUALITY
+    key = f"doctors:image:{file_sha256(image)}:{VISION_MAX_SHORT_SIDE}:{quality}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    buffer = io.BytesIO()
+    load_image(image).save(buffer, format='JPEG', quality=quality, optimize=True)
+
+    data_url = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+    cache.set(key, data_url, IMAGE_CACHE_TIMEOUT)
+    return data_url
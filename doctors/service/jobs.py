@@ -0,0 +1,161 @@
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import Event, Thread
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from doctors.models import Chat, ChatJob, Message
+from doctors.service.chat import answer_new_chat, followup_inputs
+from doctors.service.metrics import stage
+from doctors.service.summary import schedule_summary
+from doctors.service.tts import schedule_voice
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+def enqueue_turn(chat: Chat, user_message: Message, is_first_turn: bool = False) -> ChatJob:
+    """
+    Queues the AI answer for an already saved user message.
+    """
+    return ChatJob.objects.create(chat=chat, user_message=user_message, is_first_turn=is_first_turn)
+
+
+def claim_next_job() -> Optional[ChatJob]:
+    """
+    Atomically moves the oldest queued job to running and returns it,
+    skipping failed jobs whose retry delay has not passed yet.
+    The conditional UPDATE lets several workers poll the same table
+    without handing one job to two of them.
+    """
+    queued = (
+        ChatJob.objects
+        .filter(Q(not_before__isnull=True) | Q(not_before__lte=timezone.now()), status=ChatJob.STATUS_QUEUED)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in queued:
+        now = timezone.now()
+        claimed = ChatJob.objects.filter(pk=job_id, status=ChatJob.STATUS_QUEUED).update(
+            status=ChatJob.STATUS_RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ChatJob.objects.select_related('chat', 'user_message').get(pk=job_id)
+    return None
+
+
+def _running(job: ChatJob):
+    """The job's row, as long as this claim of it is still running."""
+    return ChatJob.objects.filter(pk=job.pk, status=ChatJob.STATUS_RUNNING, attempts=job.attempts)
+
+
+@contextmanager
+def heartbeat(job: ChatJob):
+    """
+    Refreshes the job's ``heartbeat_at`` every CHAT_JOB_HEARTBEAT_INTERVAL
+    seconds while the block runs, so ``requeue_stale_jobs`` leaves slow
+    jobs alone and only picks up those whose worker died.
+    """
+    stop = Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.CHAT_JOB_HEARTBEAT_INTERVAL):
+                if not _running(job).update(heartbeat_at=timezone.now()):
+                    return
+        finally:
+            connection.close()
+
+    thread = Thread(target=beat, name=f"chat-job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale_jobs(timeout_seconds: int) -> int:
+    """
+    Returns jobs whose worker stopped sending heartbeats to the queue, or
+    fails them once they used up their attempts.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    stale = ChatJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=ChatJob.STATUS_RUNNING,
+    )
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ChatJob.STATUS_FAILED,
+        error='Worker stopped while processing the job.',
+        finished_at=timezone.now(),
+    )
+    return stale.update(status=ChatJob.STATUS_QUEUED)
+
+
+def process_job(job: ChatJob):
+    """
+    Generates the AI answer for a claimed job and stores it as a Message.
+    Nothing is stored if the job was requeued meanwhile, so a job that
+    outlived its heartbeat cannot answer the turn twice.
+    """
+    with heartbeat(job):
+        _process_job(job)
+
+
+def _process_job(job: ChatJob):
+    from doctors.service.ai import generate_answer
+
+    chat = job.chat
+    user_message = job.user_message
+    text = user_message.content or ''
+    try:
+        image = user_message.image or None
+        if job.is_first_turn:
+            response_text, doctor_ids = answer_new_chat(text, chat.latitude, chat.longitude, image, user_message.file or None)
+        else:
+            prompt, file_text, lang = followup_inputs(chat, text or None, user_message.file or None,
+                                                      before_message_id=user_message.id)
+            response_text, doctor_ids = generate_answer(prompt, image, file_text, lang)
+        if not response_text:
+            raise ValueError('AI could not generate an answer.')
+    except Exception as e:
+        logger.exception("Chat job %s failed", job.id)
+        now = timezone.now()
+        if job.attempts < MAX_ATTEMPTS:
+            delay = timedelta(seconds=settings.CHAT_JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+            _running(job).update(status=ChatJob.STATUS_QUEUED, error=str(e), not_before=now + delay)
+        else:
+            _running(job).update(status=ChatJob.STATUS_FAILED, error=str(e), finished_at=now)
+        return
+
+    with stage("db_write"), transaction.atomic():
+        ai_message = Message.objects.create(
+            chat=chat,
+            content=response_text,
+            voice_status=Message.VOICE_PENDING,
+            is_from_user=False
+        )
+        finished = _running(job).update(
+            status=ChatJob.STATUS_DONE,
+            ai_message=ai_message,
+            doctors=doctor_ids,
+            error='',
+            finished_at=timezone.now(),
+        )
+        if not finished:
+            logger.warning("Chat job %s was requeued while running; dropping its answer", job.id)
+            transaction.set_rollback(True)
+            return
+        schedule_voice(ai_message)
+        if not job.is_first_turn:
+            schedule_summary(chat)
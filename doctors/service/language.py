@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Optional
+
+from langdetect import DetectorFactory, detect
+from langdetect import detector_factory
+from langdetect.lang_detect_exception import LangDetectException
+
+from doctors.models import Chat
+
+DEFAULT_LANGUAGE = "en"
+# Messages shorter than this ("ok", "ha", "rahmat") are too short to
+# detect reliably, so follow-ups keep the chat's language.
+MIN_RELIABLE_CHARS = 20
+MAX_DETECT_CHARS = 500
+
+# langdetect samples randomly unless seeded, which makes it nondeterministic.
+DetectorFactory.seed = 0
+
+
+def preload():
+    """
+    Loads langdetect's language profiles now instead of on the first chat turn.
+    """
+    detector_factory.init_factory()
+
+
+@lru_cache(maxsize=4096)
+def _detect(text: str) -> Optional[str]:
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
+
+def detect_language(text: str, default: Optional[str] = DEFAULT_LANGUAGE) -> Optional[str]:
+    """
+    Detects the language of the user's own text, never of the assembled prompt.
+    """
+    text = (text or "").strip()[:MAX_DETECT_CHARS]
+    if not text:
+        return default
+    return _detect(text) or default
+
+
+def chat_language(chat: Chat, message: Optional[str]) -> str:
+    """
+    Returns the language for a follow-up turn. The chat's stored language is
+    reused unless the new message is long enough to detect, in which case a
+    change of language is remembered on the chat.
+    """
+    text = (message or "").strip()
+    if text and (len(text) >= MIN_RELIABLE_CHARS or not chat.language):
+        lang = detect_language(text, default=None)
+        if lang and lang != chat.language:
+            Chat.objects.filter(pk=chat.pk).update(language=lang)
+            chat.language = lang
+    return chat.language or DEFAULT_LANGUAGE
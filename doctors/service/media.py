@@ -0,0 +1,58 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from doctors.models import StoredFile
+from doctors.service.hashing import hash_from_name
+from doctors.storage import chat_media_storage
+
+logger = logging.getLogger(__name__)
+
+
+def store(name, write):
+    """
+    Counts a new reference to the content-addressed upload ``name`` and
+    calls ``write()`` to store it unless the file is already there. The
+    StoredFile row is locked while deciding, so a concurrent ``_delete_file``
+    either runs first, and the file is written again, or finds the new
+    reference and keeps the file.
+    """
+    with transaction.atomic():
+        stored, created = StoredFile.objects.select_for_update().get_or_create(name=name)
+        if created or not chat_media_storage.exists(name):
+            name = write()
+        StoredFile.objects.filter(pk=stored.pk).update(
+            references=F('references') + 1,
+            size=chat_media_storage.size(name),
+        )
+    return name
+
+
+def release(name):
+    """
+    Drops a reference to a content-addressed chat upload and deletes the
+    file after commit once no message references it. Files stored before
+    content addressing have no StoredFile row and are left alone.
+    """
+    if not name or hash_from_name(name) is None:
+        return
+    if not StoredFile.objects.filter(name=name, references__gt=0).update(references=F('references') - 1):
+        return
+    if StoredFile.objects.filter(name=name, references=0).exists():
+        transaction.on_commit(lambda: _delete_file(name))
+
+
+def _delete_file(name):
+    # A new upload of the same content may have taken a reference meanwhile;
+    # the row lock keeps one from arriving between the check and the delete.
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(name=name, references=0).first()
+        if stored is None:
+            return
+        try:
+            chat_media_storage.delete(name)
+        except OSError:
+            logger.warning("Could not delete unreferenced upload %s", name, exc_info=True)
+            return
+        stored.delete()
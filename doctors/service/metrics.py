@@ -0,0 +1,168 @@
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Stage timings of the current request, for the Server-Timing header;
+# None outside a request (background jobs, the chat worker).
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+_registry: List["Histogram | Counter"] = []
+
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed bucket bounds and optional labels,
+    rendered in the Prometheus text exposition format. Values live in
+    process memory, so each worker process exposes its own series.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one counter per bucket plus +Inf, then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+    Thread-safe monotonic counter with optional labels, rendered like
+    ``Histogram``.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, float] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            series = dict(self._series)
+        for key, value in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}{suffix} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+STAGE_SECONDS = Histogram(
+    "diagno_chat_stage_seconds",
+    "Time spent in each stage of a chat turn.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+
+AI_TOKENS = Histogram(
+    "diagno_ai_tokens",
+    "Tokens per OpenAI request, by model and kind (prompt, cached_prompt, completion).",
+    ["model", "kind"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+
+CANDIDATE_TOKENS_SAVED = Counter(
+    "diagno_candidate_tokens_saved_total",
+    "Prompt tokens saved by sending retrieved candidate doctors instead of the full roster.",
+)
+
+ANSWER_CACHE_LOOKUPS = Counter(
+    "diagno_answer_cache_lookups_total",
+    "Answer cache lookups for history-free chat turns, by result (hit, miss).",
+    ["result"],
+)
+
+TRANSLATION_LOOKUPS = Counter(
+    "diagno_translation_lookups_total",
+    "Texts looked up for translation, by where the answer came from (memory, database, remote).",
+    ["layer"],
+)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a pipeline stage into ``STAGE_SECONDS`` and the current request's
+    Server-Timing header. Works as a context manager or a decorator.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def start_request():
+    """Starts collecting stage timings for the current request."""
+    return _timings.set([])
+
+
+def finish_request(token) -> List[Tuple[str, float]]:
+    """Stops collecting and returns the timings, summed per stage in first-seen order."""
+    timings = _timings.get() or []
+    _timings.reset(token)
+    totals: Dict[str, float] = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return list(totals.items())
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
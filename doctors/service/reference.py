@@ -0,0 +1,352 @@
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from doctors.service.embeddings import embed_batches, get_embedder
+from doctors.service.hashing import file_sha256
+from doctors.service.tokens import split_tokens
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Below this many chunks an exact scan is already fast, so no IVF lists are built.
+IVF_MIN_ROWS = 50_000
+IVF_TRAIN_SAMPLE = 100_000
+IVF_ITERATIONS = 10
+COPY_BLOCK_ROWS = 65_536
+
+
+@dataclass
+class ReferenceChunk:
+    text: str
+    source: str
+    score: float
+
+
+class ReferenceIndex:
+    """
+    Read side of the on-disk reference index. Everything is memory-mapped:
+
+    - ``vectors.npy``: float32 (N, dim) unit vectors, grouped by IVF list
+    - ``offsets.npy`` and ``texts.bin``: chunk ``i`` is ``texts[offsets[i]:offsets[i + 1]]``
+    - ``sources.npy``: source file id of every chunk
+    - ``centroids.npy`` and ``lists.npy``: IVF centroids and, for list ``j``,
+      its rows ``lists[j]:lists[j + 1]``; absent for small indexes
+
+    A query scores the centroids, then only the rows of the ``nprobe``
+    closest lists, which are contiguous slices of the matrix.
+    """
+
+    def __init__(self, root: Path, manifest: dict):
+        data = root / manifest["data"]
+        self.manifest = manifest
+        self.embedder = manifest["embedder"]
+        self.sources = manifest["sources"]
+        self.vectors = np.load(data / "vectors.npy", mmap_mode="r")
+        self.offsets = np.load(data / "offsets.npy", mmap_mode="r")
+        self.chunk_sources = np.load(data / "sources.npy", mmap_mode="r")
+        self.texts = np.memmap(data / "texts.bin", dtype=np.uint8, mode="r") if self.offsets[-1] else None
+        if (data / "centroids.npy").exists():
+            self.centroids = np.load(data / "centroids.npy")
+            self.lists = np.load(data / "lists.npy")
+        else:
+            self.centroids = self.lists = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def text(self, row: int) -> str:
+        return bytes(self.texts[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+    def search(self, vector: np.ndarray, k: int, nprobe: int):
+        """Returns ``[(row, score)]`` of the ``k`` best chunks, best first."""
+        if not len(self) or k <= 0:
+            return []
+        if self.centroids is None:
+            rows = None
+            scores = self.vectors @ vector
+        else:
+            nprobe = min(nprobe, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+            segments = [(self.lists[j], self.lists[j + 1]) for j in probe if self.lists[j + 1] > self.lists[j]]
+            if not segments:
+                return []
+            rows = np.concatenate([np.arange(start, end) for start, end in segments])
+            scores = np.concatenate([self.vectors[start:end] @ vector for start, end in segments])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i] if rows is not None else i), float(scores[i])) for i in top]
+
+
+def index_root() -> Path:
+    return Path(settings.REFERENCE_INDEX_DIR)
+
+
+def read_manifest(root: Path) -> Optional[dict]:
+    try:
+        with open(root / MANIFEST, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+_loaded = {"mtime": None, "index": None}
+_lock = Lock()
+
+
+def get_reference_index() -> Optional[ReferenceIndex]:
+    """
+    Returns the current index, reopened only when ingestion has replaced
+    the manifest since the last call; None if nothing was ingested yet.
+    """
+    root = index_root()
+    try:
+        mtime = os.stat(root / MANIFEST).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _loaded["mtime"] == mtime:
+        return _loaded["index"]
+    with _lock:
+        if _loaded["mtime"] != mtime:
+            _loaded.update(mtime=mtime, index=ReferenceIndex(root, read_manifest(root)))
+        return _loaded["index"]
+
+
+def reference_version() -> int:
+    """Version of the ingested reference index, 0 before the first ingestion."""
+    index = get_reference_index()
+    return index.manifest["version"] if index is not None else 0
+
+
+def search_reference(query: str, k: Optional[int] = None) -> List[ReferenceChunk]:
+    """
+    Returns the reference chunks closest to ``query``. Returns nothing when
+    retrieval is disabled, no index exists, the index was built with another
+    embedder, or the search fails, so answers never depend on it.
+    """
+    if k is None:
+        k = settings.REFERENCE_TOP_K
+    if not k or not (query or "").strip():
+        return []
+    try:
+        index = get_reference_index()
+        if index is None or not len(index):
+            return []
+        embedder = get_embedder()
+        if index.embedder != embedder.signature:
+            logger.warning("Reference index was built with %s, not %s; re-run ingest_reference",
+                           index.embedder, embedder.signature)
+            return []
+        vector = embedder.embed([query])[0]
+        hits = index.search(vector, k, settings.REFERENCE_NPROBE)
+    except Exception:
+        logger.exception("Reference search failed")
+        return []
+    return [
+        ReferenceChunk(index.text(row), index.sources[index.chunk_sources[row]], score)
+        for row, score in hits
+        if score >= settings.REFERENCE_MIN_SCORE
+    ]
+
+
+def extract_pdf_text(path: Path) -> str:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(str(path))
+    return "\n".join(text for text in (page.extract_text() for page in reader.pages) if text)
+
+
+def train_ivf(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the rows; returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(vectors), min(len(vectors), IVF_TRAIN_SAMPLE), replace=False))
+    sample = np.asarray(vectors[sample_rows])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(IVF_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+    return centroids.astype(np.float32)
+
+
+def assign_ivf(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), COPY_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + COPY_BLOCK_ROWS])
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+@dataclass
+class IngestStats:
+    added: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    chunks: int = 0
+
+
+def ingest(pdf_dir: Path, log: Callable[[str], None] = logger.info, force: bool = False) -> IngestStats:
+    """
+    Brings the index in line with the PDFs under ``pdf_dir``. Files whose
+    SHA-256 matches the manifest keep their chunks and vectors; only new or
+    changed files are chunked and embedded, unless the embedder or the
+    chunk size or overlap changed, which redoes every file. The result is written to a new
+    data directory and published by atomically replacing the manifest, so
+    running web processes keep serving the previous index until then.
+    """
+    root = index_root()
+    root.mkdir(parents=True, exist_ok=True)
+    embedder = get_embedder()
+    manifest = read_manifest(root)
+    old = ReferenceIndex(root, manifest) if manifest else None
+    chunking = (settings.REFERENCE_CHUNK_TOKENS, settings.REFERENCE_CHUNK_OVERLAP)
+    if force:
+        old = None
+    elif old is not None and old.embedder != embedder.signature:
+        log(f"Embedder changed from {old.embedder}, re-embedding every file")
+        old = None
+    elif old is not None and (manifest.get("chunk_tokens"), manifest.get("chunk_overlap")) != chunking:
+        log("Chunk size or overlap changed, re-chunking every file")
+        old = None
+    old_files: Dict[str, dict] = manifest["files"] if old is not None else {}
+
+    stats = IngestStats()
+    kept: List[tuple] = []  # (name, sha256, old source id)
+    fresh: List[tuple] = []  # (name, sha256, chunks, vectors)
+    for path in sorted(pdf_dir.rglob("*.pdf")):
+        name = str(path.relative_to(pdf_dir))
+        sha = file_sha256(str(path))
+        previous = old_files.get(name)
+        if previous and previous["sha256"] == sha:
+            kept.append((name, sha, previous["source"]))
+            stats.unchanged += 1
+            continue
+        chunks = split_tokens(extract_pdf_text(path), *chunking)
+        chunks = [chunk for chunk in (c.strip() for c in chunks) if chunk]
+        vectors = embed_batches(embedder, chunks, settings.REFERENCE_EMBED_BATCH)
+        fresh.append((name, sha, chunks, vectors))
+        stats.added += 1
+        log(f"Embedded {name}: {len(chunks)} chunks")
+    stats.removed = len(set(old_files) - {name for name, *_ in kept} - {name for name, *_ in fresh})
+
+    if stats.added == 0 and stats.removed == 0 and old is not None:
+        stats.chunks = len(old)
+        return stats
+
+    version = (manifest["version"] + 1) if manifest else 1
+    data = root / f"v{version}"
+    if data.exists():
+        shutil.rmtree(data)
+    data.mkdir()
+
+    # Kept rows are copied from the old matrix, grouped per source file.
+    old_rows_by_source = {}
+    if old is not None and kept:
+        order = np.argsort(old.chunk_sources, kind="stable")
+        bounds = np.searchsorted(old.chunk_sources[order], np.arange(len(old.sources) + 1))
+        old_rows_by_source = {sid: order[bounds[sid]:bounds[sid + 1]] for sid in range(len(old.sources))}
+
+    sources = [name for name, *_ in kept] + [name for name, *_ in fresh]
+    files = {}
+    parts = []  # (source id, rows of the old index or None, chunks, vectors)
+    for sid, (name, sha, old_sid) in enumerate(kept):
+        rows = np.sort(old_rows_by_source.get(old_sid, np.zeros(0, dtype=np.int64)))
+        parts.append((sid, rows, None, None))
+        files[name] = {"sha256": sha, "source": sid, "chunks": len(rows)}
+    for sid, (name, sha, chunks, vectors) in enumerate(fresh, start=len(kept)):
+        parts.append((sid, None, chunks, vectors))
+        files[name] = {"sha256": sha, "source": sid, "chunks": len(chunks)}
+    total = sum(info["chunks"] for info in files.values())
+
+    staged = np.lib.format.open_memmap(data / "staged.npy", mode="w+", dtype=np.float32, shape=(total, embedder.dim))
+    chunk_sources = np.empty(total, dtype=np.int32)
+    lengths = np.empty(total, dtype=np.int64)
+    with open(data / "staged.bin", "wb") as texts:
+        row = 0
+        for sid, rows, chunks, vectors in parts:
+            if rows is not None:
+                for start in range(0, len(rows), COPY_BLOCK_ROWS):
+                    block = rows[start:start + COPY_BLOCK_ROWS]
+                    staged[row:row + len(block)] = old.vectors[block]
+                    for offset, old_row in enumerate(block):
+                        raw = bytes(old.texts[old.offsets[old_row]:old.offsets[old_row + 1]])
+                        texts.write(raw)
+                        lengths[row + offset] = len(raw)
+                    chunk_sources[row:row + len(block)] = sid
+                    row += len(block)
+            else:
+                staged[row:row + len(chunks)] = vectors
+                for offset, chunk in enumerate(chunks):
+                    raw = chunk.encode("utf-8")
+                    texts.write(raw)
+                    lengths[row + offset] = len(raw)
+                chunk_sources[row:row + len(chunks)] = sid
+                row += len(chunks)
+    staged.flush()
+    staged_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    if total >= IVF_MIN_ROWS:
+        nlist = max(1, int(np.sqrt(total)))
+        log(f"Training {nlist} IVF lists over {total} chunks")
+        centroids = train_ivf(staged, nlist)
+        assignment = assign_ivf(staged, centroids)
+        order = np.argsort(assignment, kind="stable")
+        lists = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+        np.save(data / "centroids.npy", centroids)
+        np.save(data / "lists.npy", lists)
+
+        vectors_out = np.lib.format.open_memmap(data / "vectors.npy", mode="w+", dtype=np.float32,
+                                                shape=(total, embedder.dim))
+        staged_texts = np.memmap(data / "staged.bin", dtype=np.uint8, mode="r") if staged_offsets[-1] else None
+        new_lengths = lengths[order]
+        with open(data / "texts.bin", "wb") as texts:
+            for start in range(0, total, COPY_BLOCK_ROWS):
+                block = order[start:start + COPY_BLOCK_ROWS]
+                vectors_out[start:start + len(block)] = staged[block]
+                for old_row in block:
+                    texts.write(bytes(staged_texts[staged_offsets[old_row]:staged_offsets[old_row + 1]]))
+        vectors_out.flush()
+        del vectors_out, staged, staged_texts
+        np.save(data / "offsets.npy", np.concatenate([[0], np.cumsum(new_lengths)]).astype(np.int64))
+        np.save(data / "sources.npy", chunk_sources[order])
+        os.remove(data / "staged.npy")
+        os.remove(data / "staged.bin")
+    else:
+        del staged
+        os.replace(data / "staged.npy", data / "vectors.npy")
+        os.replace(data / "staged.bin", data / "texts.bin")
+        np.save(data / "offsets.npy", staged_offsets)
+        np.save(data / "sources.npy", chunk_sources)
+
+    new_manifest = {
+        "version": version,
+        "data": data.name,
+        "embedder": embedder.signature,
+        "chunk_tokens": chunking[0],
+        "chunk_overlap": chunking[1],
+        "sources": sources,
+        "files": files,
+    }
+    tmp = root / f"{MANIFEST}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, root / MANIFEST)
+
+    # Processes that still map an older version keep reading the unlinked files.
+    for entry in root.iterdir():
+        if entry.is_dir() and entry.name.startswith("v") and entry.name != data.name:
+            shutil.rmtree(entry, ignore_errors=True)
+    stats.chunks = total
+    return stats
@@ -0,0 +1,237 @@
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from doctors.models import Doctor
+from doctors.service.geo import get_hospital_index
+from doctors.service.metrics import CANDIDATE_TOKENS_SAVED
+from doctors.service.roster import get_roster, render_roster
+from doctors.service.tokens import count_tokens
+from doctors.service.versions import get_version, bump_version
+
+logger = logging.getLogger(__name__)
+
+DOCTORS = "doctors"
+TEXT_FIELDS = ("field", "fieldDescription", "description")
+QUERY_MAX_CHARS = 2000
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_APOSTROPHES = re.compile(r"[’‘ʻʼ`']")
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into index terms.
+    Apostrophes are dropped so the Uzbek spellings o'g'riq / oʻgʻriq match,
+    and a 4-character prefix term is added for every longer word so
+    inflected forms (boshim, boshimda) still hit the stem (bosh).
+    """
+    terms = []
+    for word in _WORDS.findall(_APOSTROPHES.sub("", (text or "").lower())):
+        if len(word) < 2 or word.isdigit():
+            continue
+        terms.append(word)
+        if len(word) > 4:
+            terms.append("~" + word[:4])
+        elif len(word) == 4:
+            terms.append("~" + word)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over one document per doctor. ``add`` and ``remove`` change
+    the index in place and are only used while building it; a published
+    index is never mutated, ``updated`` returns a copy with one doctor
+    reindexed so a doctor save does not rebuild the whole index.
+    """
+
+    def __init__(self, version: Optional[int] = None):
+        self.version = version
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.terms: Dict[int, List[str]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doctor_id: int, terms: Iterable[str]):
+        self.remove(doctor_id)
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doctor_id] = tf
+        length = sum(counts.values())
+        self.terms[doctor_id] = list(counts)
+        self.lengths[doctor_id] = length
+        self.total_length += length
+
+    def remove(self, doctor_id: int):
+        length = self.lengths.pop(doctor_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(doctor_id, ()):
+            docs = self.postings[term]
+            docs.pop(doctor_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def updated(self, doctor_id: int, terms: Optional[Iterable[str]]) -> "BM25Index":
+        """
+        A copy with ``doctor_id`` reindexed from ``terms``, or removed when
+        ``terms`` is None. Only the postings of the doctor's old and new
+        terms are copied; the rest are shared with this index.
+        """
+        terms = None if terms is None else list(terms)
+        index = BM25Index(self.version)
+        index.postings = dict(self.postings)
+        index.terms = dict(self.terms)
+        index.lengths = dict(self.lengths)
+        index.total_length = self.total_length
+        for term in set(self.terms.get(doctor_id, ())) | set(terms or ()):
+            if term in index.postings:
+                index.postings[term] = dict(index.postings[term])
+        if terms is None:
+            index.remove(doctor_id)
+        else:
+            index.add(doctor_id, terms)
+        return index
+
+    def scores(self, terms: Iterable[str]) -> Dict[int, float]:
+        if not self.lengths:
+            return {}
+        n = len(self.lengths)
+        avg_length = self.total_length / n or 1
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doctor_id, tf in docs.items():
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doctor_id] / avg_length)
+                scores[doctor_id] = scores.get(doctor_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+
+def _doctor_queryset():
+    return Doctor.objects.prefetch_related("translations", "tags")
+
+
+def _doctor_terms(doctor: Doctor) -> List[str]:
+    parts = [doctor.name]
+    for translation in doctor.translations.all():
+        parts.extend(getattr(translation, name) or "" for name in TEXT_FIELDS)
+    parts.extend(tag.name for tag in doctor.tags.all())
+    return tokenize(" ".join(parts))
+
+
+_index = BM25Index()
+_lock = Lock()
+_roster_tokens = {"version": None, "count": 0}
+
+
+def get_doctor_index() -> BM25Index:
+    """
+    Returns the process-wide doctor index, rebuilding it only when another
+    process changed a doctor.
+    """
+    global _index
+    version = get_version(DOCTORS)
+    if _index.version == version:
+        return _index
+    with _lock:
+        if _index.version != version:
+            index = BM25Index(version=version)
+            for doctor in _doctor_queryset():
+                index.add(doctor.id, _doctor_terms(doctor))
+            _index = index
+    return _index
+
+
+def apply_doctor_change(doctor_id: int, deleted: bool = False):
+    """
+    Publishes a doctor change to other processes and swaps in a copy of
+    this process's index with the doctor reindexed; readers keep scoring
+    against the index they already hold.
+    """
+    global _index
+    version = bump_version(DOCTORS)
+    with _lock:
+        if _index.version is None:
+            return
+        doctor = None if deleted else _doctor_queryset().filter(pk=doctor_id).first()
+        index = _index.updated(doctor_id, None if doctor is None else _doctor_terms(doctor))
+        if index.version == version - 1:
+            index.version = version
+        _index = index
+
+
+def _full_roster_tokens(version: int, block: str) -> int:
+    """Token count of the full roster, counted once per roster version."""
+    if _roster_tokens["version"] != version:
+        _roster_tokens.update(version=version, count=count_tokens(block))
+    return _roster_tokens["count"]
+
+
+@dataclass
+class Candidates:
+    block: str
+    doctor_ids: List[int]
+    tokens_saved: int
+    roster_version: Optional[int] = None
+
+    @property
+    def is_full_roster(self) -> bool:
+        return self.roster_version is not None
+
+
+def select_candidates(query: str, latitude: float, longitude: float, k: Optional[int] = None) -> Candidates:
+    """
+    Picks the ``k`` doctors most relevant to the user's text for the prompt.
+    BM25 scores are damped by the distance to the doctor's hospital; slots
+    left after the lexical matches are filled with the nearest doctors so
+    the model always has nearby options. With ``k`` of 0, a catalog no
+    larger than ``k``, or a roster within ``AI_FULL_ROSTER_MAX_TOKENS``, the
+    full roster is returned unchanged: it goes into the cached prompt
+    prefix, where it costs less than per-turn candidates.
+    """
+    if k is None:
+        k = settings.AI_CANDIDATE_DOCTORS
+    version, entries, block = get_roster()
+    roster_tokens = _full_roster_tokens(version, block)
+    if not k or len(entries) <= k or roster_tokens <= settings.AI_FULL_ROSTER_MAX_TOKENS:
+        return Candidates(block, [e["id"] for e in entries], 0, roster_version=version)
+
+    index = get_doctor_index()
+    hospital_index = get_hospital_index()
+    distance = hospital_index.distances_by_id(latitude, longitude)
+    scale = settings.AI_CANDIDATE_DISTANCE_SCALE_KM
+
+    def proximity(entry):
+        return 1 / (1 + distance.get(entry["hospital_id"], float("inf")) / scale)
+
+    scores = index.scores(tokenize((query or "")[:QUERY_MAX_CHARS]))
+    ranked = sorted(
+        entries,
+        key=lambda e: (scores.get(e["id"], 0.0) * proximity(e), proximity(e)),
+        reverse=True,
+    )
+    selected = ranked[:k]
+    candidate_block = render_roster(selected)
+    tokens_saved = roster_tokens - count_tokens(candidate_block)
+    CANDIDATE_TOKENS_SAVED.inc(max(tokens_saved, 0))
+    logger.info(
+        "Selected %d of %d doctors (%d lexical matches), saved ~%d prompt tokens",
+        len(selected), len(entries), len(scores), tokens_saved,
+    )
+    return Candidates(candidate_block, [e["id"] for e in selected], tokens_saved)
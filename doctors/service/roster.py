@@ -0,0 +1,102 @@
+from itertools import groupby
+from threading import Lock
+from typing import List, Tuple
+
+from django.core.cache import cache
+
+from doctors.models import Doctor
+from doctors.service.versions import get_version
+
+ROSTER = "roster"
+ROSTER_CACHE_TIMEOUT = 60 * 60 * 24
+ROSTER_LANGUAGE = "uz"
+
+_local = {"version": None, "entries": None, "block": None}
+_lock = Lock()
+
+
+def _pick_translation(doctor: Doctor, name: str) -> str:
+    """
+    Reads a translated field from the prefetched translations, preferring
+    the roster language and falling back to any non-empty translation.
+    """
+    translations = {t.language_code: t for t in doctor.translations.all()}
+    preferred = translations.get(ROSTER_LANGUAGE)
+    if preferred is not None and getattr(preferred, name):
+        return getattr(preferred, name)
+    for translation in translations.values():
+        if getattr(translation, name):
+            return getattr(translation, name)
+    return ""
+
+
+def load_roster_entries() -> List[dict]:
+    """
+    Loads every doctor with its hospital and translations in three queries.
+    """
+    doctors = (
+        Doctor.objects
+        .select_related("hospital")
+        .prefetch_related("translations")
+        .order_by("hospital_id", "id")
+    )
+    return [
+        {
+            "id": doc.id,
+            "name": doc.name,
+            "field": _pick_translation(doc, "field"),
+            "hospital_id": doc.hospital_id,
+            "hospital": doc.hospital.name,
+            "latitude": doc.hospital.latitude,
+            "longitude": doc.hospital.longitude,
+        }
+        for doc in doctors
+    ]
+
+
+def render_roster(entries: List[dict]) -> str:
+    """
+    Renders doctors grouped by hospital, so each hospital name and its
+    coordinates are written once instead of once per doctor:
+
+        @ City Clinic [41.3111, 69.2797]
+        1. Dr. Ali (Kardiolog)
+    """
+    lines = []
+    ordered = sorted(entries, key=lambda e: (e["hospital_id"], e["id"]))
+    for _, group in groupby(ordered, key=lambda e: e["hospital_id"]):
+        group = list(group)
+        head = group[0]
+        lines.append(f"@ {head['hospital']} [{head['latitude']:.4f}, {head['longitude']:.4f}]")
+        lines.extend(f"{e['id']}. {e['name']} ({e['field']})" for e in group)
+    return "\n".join(lines)
+
+
+def get_roster() -> Tuple[int, List[dict], str]:
+    """
+    Returns ``(version, entries, block)`` for the current doctor roster.
+    The rendered block is shared through the Django cache under the roster
+    version and memoized per process, so a chat turn costs no database
+    queries unless a doctor, hospital or translation changed.
+    """
+    version = get_version(ROSTER)
+    if _local["version"] == version:
+        return version, _local["entries"], _local["block"]
+
+    with _lock:
+        if _local["version"] == version:
+            return version, _local["entries"], _local["block"]
+
+        key = f"doctors:roster:{version}"
+        snapshot = cache.get(key)
+        if snapshot is None:
+            entries = load_roster_entries()
+            snapshot = {"entries": entries, "block": render_roster(entries)}
+            cache.set(key, snapshot, ROSTER_CACHE_TIMEOUT)
+
+        _local.update(version=version, entries=snapshot["entries"], block=snapshot["block"])
+        return version, snapshot["entries"], snapshot["block"]
+
+
+def get_roster_block() -> str:
+    return get_roster()[2]
@@ -0,0 +1,54 @@
+import json
+from typing import Iterable, Iterator, Tuple
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+_END = object()
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets streaming views accept ``Accept: text/event-stream``; regular
+    responses such as validation errors are sent as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_event('error', data).encode(self.charset)
+
+
+async def _iterate_in_thread(iterator: Iterator[str]):
+    # Django buffers a synchronous iterator completely before sending it
+    # over ASGI, so pull it one item at a time from the sync thread instead.
+    next_item = sync_to_async(next, thread_sensitive=True)
+    while True:
+        item = await next_item(iterator, _END)
+        if item is _END:
+            break
+        yield item
+
+
+def event_stream_response(request, events: Iterable[Tuple[str, dict]]) -> StreamingHttpResponse:
+    """
+    Wraps ``(event, data)`` pairs into a Server-Sent Events response.
+    Under ASGI the body is an async iterator so every event is flushed to
+    the client as soon as it is produced.
+    """
+    body = (format_event(event, data) for event, data in events)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        body = _iterate_in_thread(body)
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,77 @@
+import copy
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+
+from doctors.models import Chat, Message
+from doctors.service.background import submit
+from doctors.service.tokens import count_tokens, truncate_tokens
+
+
+def format_message(msg: Message) -> str:
+    return f"{'User' if msg.is_from_user else 'AI'}: {msg.content or '[file/image]'}"
+
+
+def unsummarized_messages(chat: Chat, before_message_id=None):
+    messages = chat.messages.order_by('id')
+    if chat.summary_message_id is not None:
+        messages = messages.filter(id__gt=chat.summary_message_id)
+    if before_message_id is not None:
+        messages = messages.filter(id__lt=before_message_id)
+    return messages
+
+
+def recent_history(messages: List[Message]) -> List[Message]:
+    """
+    Keeps the newest of the unsummarized messages that fit in
+    AI_HISTORY_TOKEN_BUDGET tokens, in chronological order. Messages older
+    than the newest AI_HISTORY_RECENT_MESSAGES are kept too while the
+    summary has not folded them in, so a lagging or failed summary job
+    loses nothing that fits. The first message that does not fit is cut
+    down to the tokens left and ends the history.
+    """
+    budget = settings.AI_HISTORY_TOKEN_BUDGET
+    kept = []
+    for msg in reversed(messages):
+        line = format_message(msg)
+        cost = count_tokens(line)
+        if cost > budget:
+            content = msg.content or ""
+            room = budget - (cost - count_tokens(content))
+            if room > 0:
+                msg = copy.copy(msg)
+                msg.content = truncate_tokens(content, room)
+                kept.append(msg)
+            break
+        budget -= cost
+        kept.append(msg)
+    return kept[::-1]
+
+
+def update_summary(chat_id):
+    """
+    Background job: folds every message except the newest
+    AI_HISTORY_RECENT_MESSAGES into the chat's rolling summary.
+    """
+    from doctors.service.ai import summarize_conversation
+
+    chat = Chat.objects.filter(pk=chat_id).first()
+    if chat is None:
+        return
+    pending = list(unsummarized_messages(chat))
+    to_fold = pending[:-settings.AI_HISTORY_RECENT_MESSAGES]
+    if not to_fold:
+        return
+    summary = summarize_conversation(chat.summary, "\n".join(format_message(msg) for msg in to_fold))
+    if not summary:
+        return
+    # Only store the result if no other job advanced the summary meanwhile.
+    Chat.objects.filter(pk=chat.pk, summary_message_id=chat.summary_message_id).update(
+        summary=summary,
+        summary_message_id=to_fold[-1].id,
+    )
+
+
+def schedule_summary(chat: Chat):
+    transaction.on_commit(lambda: submit(update_summary, chat.pk))
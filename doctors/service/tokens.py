@@ -0,0 +1,63 @@
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts prompt tokens with the gpt-4o tokenizer.
+    Falls back to the usual ~4 characters per token estimate when
+    tiktoken or its encoding files are unavailable.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, size: int) -> str:
+    """The first ``size`` tokens of ``text``."""
+    if size <= 0:
+        return ""
+    windows = split_tokens(text, size)
+    return windows[0] if windows else ""
+
+
+def split_tokens(text: str, size: int, overlap: int = 0) -> List[str]:
+    """
+    Splits text into windows of ``size`` tokens, each overlapping the
+    previous one by ``overlap`` tokens. Without tiktoken the windows are
+    measured in characters at ~4 per token.
+    """
+    if not text:
+        return []
+    encoding = _encoding()
+    if encoding is None:
+        units, size, overlap = text, size * 4, overlap * 4
+        join = "".join
+    else:
+        units = encoding.encode(text, disallowed_special=())
+        join = encoding.decode
+    step = max(1, size - overlap)
+    windows = []
+    for start in range(0, len(units), step):
+        windows.append(join(units[start:start + size]))
+        if start + size >= len(units):
+            break
+    return windows
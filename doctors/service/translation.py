@@ -0,0 +1,212 @@
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bs4 import BeautifulSoup
+from deep_translator.constants import BASE_URLS
+from deep_translator.exceptions import TranslationNotFound
+from django.conf import settings
+
+from doctors.models import TranslationMemory
+from doctors.service.http import request
+from doctors.service.metrics import TRANSLATION_LOOKUPS
+
+MAX_CHARS = 5000
+
+
+def translate(text: str, source: str, target: str) -> str:
+    """
+    Translates ``text`` with Google Translate, as deep_translator's
+    GoogleTranslator does, but through the pooled 'translate' session with
+    its timeouts, retries and circuit breaker.
+    """
+    text = (text or '').strip()
+    if not text or source == target:
+        return text
+    if len(text) > MAX_CHARS:
+        raise ValueError(f"Text longer than {MAX_CHARS} characters cannot be translated in one request")
+
+    response = request('translate', 'GET', BASE_URLS['GOOGLE_TRANSLATE'], params={'sl': source, 'tl': target, 'q': text})
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+    element = soup.find('div', {'class': 't0'}) or soup.find('div', {'class': 'result-container'})
+    if not element:
+        raise TranslationNotFound(text)
+    return element.get_text(strip=True)
+
+
+SEPARATOR = '\n|||\n'
+_SPACES = re.compile(r'[^\S\n]+')
+_BLANK_LINES = re.compile(r'\n\s*\n\s*')
+
+
+def _batches(texts: List[str]) -> List[List[int]]:
+    batches, current, size = [], [], 0
+    for i, text in enumerate(texts):
+        extra = len(text) + (len(SEPARATOR) if current else 0)
+        if current and size + extra > MAX_CHARS:
+            batches.append(current)
+            current, size = [], 0
+            extra = len(text)
+        current.append(i)
+        size += extra
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _split_long(text: str) -> List[Tuple[str, str]]:
+    """
+    Cuts a text longer than MAX_CHARS into pieces that fit one request, at
+    the last line break, sentence end or space before the limit. Returns
+    ``(piece, joiner)`` pairs; the joiner goes back after the piece's translation.
+    """
+    pieces = []
+    while len(text) > MAX_CHARS:
+        window = text[:MAX_CHARS]
+        cut, joiner = window.rfind('\n'), '\n'
+        if cut <= 0:
+            cut, joiner = max(window.rfind('. '), window.rfind('! '), window.rfind('? ')) + 1, ' '
+        if cut <= 0:
+            cut, joiner = window.rfind(' '), ' '
+        if cut <= 0:
+            cut, joiner = MAX_CHARS, ''
+        pieces.append((text[:cut].strip(), joiner))
+        text = text[cut:].strip()
+    pieces.append((text, ''))
+    return pieces
+
+
+def _translate_remote(texts: List[str], source: str, target: str) -> List[str]:
+    pieces, owners, joiners = [], [], []
+    for i, text in enumerate(texts):
+        for piece, joiner in _split_long(text):
+            pieces.append(piece)
+            owners.append(i)
+            joiners.append(joiner)
+
+    translated = list(pieces)
+    for batch in _batches(pieces):
+        if len(batch) == 1:
+            translated[batch[0]] = translate(pieces[batch[0]], source, target)
+            continue
+        parts = translate(SEPARATOR.join(pieces[i] for i in batch), source, target).split('|||')
+        if len(parts) != len(batch):
+            parts = [translate(pieces[i], source, target) for i in batch]
+        for i, part in zip(batch, parts):
+            translated[i] = part.strip()
+
+    results = [''] * len(texts)
+    for i, part, joiner in zip(owners, translated, joiners):
+        results[i] += part + joiner
+    return results
+
+
+class TranslationCache:
+    """
+    Thread-safe LRU of translations keyed by (source, target, text hash),
+    in front of the TranslationMemory table.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Tuple[str, str, str], value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+translation_cache = TranslationCache(settings.TRANSLATION_MEMORY_MAX_ENTRIES)
+
+
+def normalize_source(text: str) -> str:
+    """Normalizes Unicode and whitespace, keeping line and paragraph breaks."""
+    text = unicodedata.normalize('NFC', text or '').replace('\r\n', '\n')
+    text = '\n'.join(line.strip() for line in _SPACES.sub(' ', text).split('\n'))
+    return _BLANK_LINES.sub('\n\n', text).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def translate_many(texts: Sequence[str], source: str, target: str) -> List[str]:
+    """
+    Translates several texts, looking each one up in the process LRU and
+    then the TranslationMemory table first. The rest go out in as few
+    requests as possible: they are joined with a separator the translator
+    leaves alone and split back afterwards, and a batch whose separators
+    do not survive is retried text by text. Texts longer than one request
+    allows are translated in pieces. New translations are stored.
+    """
+    texts = [normalize_source(text) for text in texts]
+    if source == target:
+        return texts
+    hashes = {text: text_hash(text) for text in texts if text}
+    found: Dict[str, str] = {}
+
+    for text, digest in hashes.items():
+        cached = translation_cache.get((source, target, digest))
+        if cached is not None:
+            found[text] = cached
+    TRANSLATION_LOOKUPS.inc(len(found), layer='memory')
+
+    missing = {hashes[text]: text for text in hashes if text not in found}
+    if missing:
+        rows = TranslationMemory.objects.filter(
+            source=source, target=target, text_hash__in=list(missing)
+        ).values_list('text_hash', 'translation')
+        for digest, translation in rows:
+            found[missing[digest]] = translation
+            translation_cache.set((source, target, digest), translation)
+        TRANSLATION_LOOKUPS.inc(len(rows), layer='database')
+
+    remote = [text for text in hashes if text not in found]
+    if remote:
+        translations = _translate_remote(remote, source, target)
+        TRANSLATION_LOOKUPS.inc(len(remote), layer='remote')
+        entries = []
+        for text, translation in zip(remote, translations):
+            found[text] = translation
+            if translation:
+                translation_cache.set((source, target, hashes[text]), translation)
+                entries.append(TranslationMemory(
+                    source=source, target=target, text_hash=hashes[text], text=text, translation=translation,
+                ))
+        TranslationMemory.objects.bulk_create(entries, ignore_conflicts=True)
+
+    return [found.get(text, text) for text in texts]
@@ -1,14 +1,49 @@
+import hashlib
+import logging
+import posixpath
+import re
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, Optional
 
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
 from environs import Env
 
+from doctors.models import Chat, Message
+from doctors.service.background import submit
+from doctors.service.http import request, CircuitOpenError, UpstreamError
+from doctors.service.metrics import stage
+
 env = Env()
 env.read_env()
 
 api_key=env.str("VOICE")
 
-def tts(text):
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+TTS_AUDIO_DIR = "tts"
+
+# MPEG audio Layer III bitrates (kbps) for MPEG-1 and MPEG-2/2.5, and sample
+# rates (Hz) keyed by the version bits of the frame header.
+_BITRATES = {1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+             2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+@stage("tts")
+def tts(text, model=None):
+    """
+    Synthesizes speech for ``text`` and returns the audio URL,
+    or None when the request fails.
+    """
     url = 'https://uzbekvoice.ai/api/v1/tts'
     headers = {
         'Authorization': api_key,
@@ -16,18 +51,205 @@ def tts(text):
     }
     data = {
         'text': text,
-        'model': "lola",
+        'model': model or settings.TTS_MODEL,
         'blocking': "true",
         'webhook_notification_url': "https://example.com"
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+        response = request('tts', 'POST', url, headers=headers, data=json.dumps(data))
         if response.status_code == 200:
             return response.json()['result']['url']
+        logger.warning("TTS request failed with status code %s: %s", response.status_code, response.text)
+    except (requests.exceptions.RequestException, UpstreamError, CircuitOpenError) as e:
+        logger.warning("TTS request failed: %s", e)
+    return None
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    parts = []
+    for piece in _CLAUSE_END.split(sentence):
+        while len(piece) > max_chars:
+            cut = piece.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            parts.append(piece[:cut].strip())
+            piece = piece[cut:].strip()
+        if piece:
+            parts.append(piece)
+    return parts
+
+
+def split_for_speech(text: str, first_chars: int, max_chars: int) -> List[str]:
+    """
+    Splits text into chunks on sentence boundaries. Sentences are packed up
+    to ``max_chars`` per chunk, except the first chunk, which stops at
+    ``first_chars`` so its audio is ready early. Only sentences longer than
+    a chunk are split further, at clauses and then at spaces.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text or ""):
+        sentence = sentence.strip()
+        if sentence:
+            sentences.extend(_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        limit = first_chars if not chunks else max_chars
+        if current and len(current) + 1 + len(sentence) > limit:
+            chunks.append(current)
+            current = sentence
         else:
-            return f"Request failed with status code {response.status_code}: {response.text}"
-    except requests.exceptions.Timeout:
-        return "Request timed out. The API response took too long to arrive."
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def audio_name(text: str, model: str, extension: str = ".mp3") -> str:
+    digest = hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+    return posixpath.join(TTS_AUDIO_DIR, model, digest[:2], digest + extension)
+
+
+def synthesize_chunk(text: str, model: str) -> Optional[str]:
+    """
+    Returns the storage name of the audio for ``text``. Audio is cached in
+    media storage by (text hash, voice model), so a phrase is synthesized
+    and downloaded only once.
+    """
+    name = audio_name(text, model)
+    if default_storage.exists(name):
+        return name
+    url = tts(text, model)
+    if not url:
+        return None
+    try:
+        response = request('tts', 'GET', url)
+    except (requests.exceptions.RequestException, UpstreamError, CircuitOpenError) as e:
+        logger.warning("TTS audio download failed: %s", e)
+        return None
+    if response.status_code != 200:
+        logger.warning("TTS audio download failed with status code %s", response.status_code)
+        return None
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(response.content))
+
+
+def _frame_length(header: bytes) -> Optional[int]:
+    """Length in bytes of the Layer III frame starting with ``header``, or None."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version, layer = (header[1] >> 3) & 3, (header[1] >> 1) & 3
+    bitrate_index, rate_index = header[2] >> 4, (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    padding = (header[2] >> 1) & 1
+    return (144 if mpeg1 else 72) * bitrate // _SAMPLE_RATES[version][rate_index] + padding
+
+
+def mp3_frames(data: bytes) -> bytes:
+    """
+    The audio frames of an MP3 file, without its ID3v2/ID3v1 tags and
+    without a leading Xing/Info/VBRI frame, which holds no audio.
+    """
+    start, end = 0, len(data)
+    if data[:3] == b"ID3" and end >= 10:
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    while start < end and data[start] == 0:
+        start += 1
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    length = _frame_length(data[start:start + 4])
+    if length:
+        mono = data[start + 3] >> 6 == 3
+        side_info = (17 if mono else 32) if (data[start + 1] >> 3) & 3 == 3 else (9 if mono else 17)
+        frame = data[start:start + length]
+        if frame[4 + side_info:8 + side_info] in (b"Xing", b"Info") or frame[36:40] == b"VBRI":
+            start += length
+    return data[start:end]
+
+
+def join_mp3(parts: List[bytes]) -> bytes:
+    """
+    Concatenates MP3 files into one stream of frames. Every part's tags and
+    Xing/Info header describe only that part; left in the middle of the
+    stream they make players misreport the duration or stop early.
+    """
+    return b"".join(mp3_frames(part) for part in parts)
+
+
+_executor = None
+_lock = Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Separate from the background pool: voice jobs run there and wait on these.
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TTS_PARALLELISM, thread_name_prefix="doctors-tts")
+    return _executor
+
+
+def _publish(message: Message, **fields):
+    Message.objects.filter(pk=message.pk).update(**fields)
+    # .update() skips the post_save hook that invalidates the chat's ETag.
+    Chat.objects.filter(pk=message.chat_id).update(updated_at=timezone.now())
+
+
+def generate_voice(message_id):
+    """
+    Background job: synthesizes the voice for an AI message chunk by chunk,
+    in parallel. Finished chunks are published in order as ``voice_parts``
+    so clients can start playing before the rest is ready; the concatenated
+    audio becomes ``voice`` when every chunk is done.
+    """
+    message = Message.objects.filter(pk=message_id).first()
+    if message is None or message.voice_status != Message.VOICE_PENDING:
+        return
+    model = settings.TTS_MODEL
+    chunks = split_for_speech(message.content, settings.TTS_FIRST_CHUNK_CHARS, settings.TTS_CHUNK_CHARS)
+    if not chunks:
+        _publish(message, voice_status=Message.VOICE_FAILED)
+        return
+
+    futures = [_get_executor().submit(synthesize_chunk, chunk, model) for chunk in chunks]
+    names = []
+    for future in futures:
+        try:
+            name = future.result()
+        except Exception:
+            logger.exception("TTS chunk of message %s failed", message_id)
+            name = None
+        if name is None:
+            for pending in futures:
+                pending.cancel()
+            _publish(message, voice_status=Message.VOICE_FAILED)
+            return
+        names.append(name)
+        if len(chunks) > 1:
+            _publish(message, voice_parts=[default_storage.url(n) for n in names])
+
+    if len(names) == 1:
+        full = names[0]
+    else:
+        full = audio_name(message.content, model)
+        if not default_storage.exists(full):
+            parts = []
+            for name in names:
+                with default_storage.open(name, "rb") as f:
+                    parts.append(f.read())
+            full = default_storage.save(full, ContentFile(join_mp3(parts)))
+    _publish(message, voice=default_storage.url(full), voice_status=Message.VOICE_READY)
 
 
+def schedule_voice(message):
+    """
+    Queues voice synthesis for a saved AI message once the surrounding
+    transaction commits; the message must be created as pending.
+    """
+    transaction.on_commit(lambda: submit(generate_voice, message.pk))
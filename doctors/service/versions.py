@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from doctors.models import VersionCounter
+
+
+def version_cache():
+    """
+    The cache holding version counters (settings.VERSION_CACHE), shared by
+    all processes and with an atomic ``incr``; None keeps them in the
+    VersionCounter table instead.
+    """
+    if not settings.VERSION_CACHE:
+        return None
+    return caches[settings.VERSION_CACHE]
+
+
+def _version_key(name: str) -> str:
+    return f"doctors:version:{name}"
+
+
+def _seed() -> int:
+    # Seeded from the clock so that a cache flush never brings back a
+    # version number that was already used for cached data.
+    return int(time.time() * 1000)
+
+
+def get_version(name: str) -> int:
+    """Returns the current version counter for ``name``."""
+    cache = version_cache()
+    if cache is None:
+        value = VersionCounter.objects.filter(name=name).values_list('value', flat=True).first()
+        if value is None:
+            value = VersionCounter.objects.get_or_create(name=name, defaults={'value': _seed()})[0].value
+        return value
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name: str) -> int:
+    """
+    Increments the version counter for ``name`` so every cache entry keyed
+    by the previous version is ignored from now on. Returns the new
+    version, which no concurrent bump also returns.
+    """
+    cache = version_cache()
+    if cache is None:
+        with transaction.atomic():
+            # The UPDATE locks the row, so the read below sees this bump and no other.
+            if not VersionCounter.objects.filter(name=name).update(value=F('value') + 1):
+                counter, created = VersionCounter.objects.get_or_create(name=name, defaults={'value': _seed()})
+                if created:
+                    return counter.value
+                VersionCounter.objects.filter(name=name).update(value=F('value') + 1)
+            return VersionCounter.objects.filter(name=name).values_list('value', flat=True).get()
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+        return cache.get(key)
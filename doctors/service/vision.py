@@ -0,0 +1,64 @@
+import logging
+from threading import Lock
+from typing import Optional
+
+from django.conf import settings
+
+from doctors.service.images import load_image
+from doctors.service.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PROMPT = (
+    "Describe this image for a medical assistant: what it shows, visible symptoms, "
+    "and any readable text such as test results or prescriptions."
+)
+
+_service = None
+_lock = Lock()
+
+
+def local_vision_enabled() -> bool:
+    return bool(settings.LOCAL_VISION_BACKEND)
+
+
+def get_vision_service():
+    """
+    Returns the process-wide local vision service; the model itself is only
+    loaded when the first image arrives.
+    """
+    global _service
+    with _lock:
+        if _service is None:
+            from image_reader import DEFAULT_MODEL, StandInBackend, TransformersBackend, VisionService
+
+            if settings.LOCAL_VISION_BACKEND == "stand-in":
+                backend = StandInBackend()
+            else:
+                backend = TransformersBackend(
+                    settings.LOCAL_VISION_MODEL or DEFAULT_MODEL,
+                    device=settings.LOCAL_VISION_DEVICE,
+                    dtype=settings.LOCAL_VISION_DTYPE,
+                    quantize=settings.LOCAL_VISION_QUANTIZE,
+                    max_new_tokens=settings.LOCAL_VISION_MAX_NEW_TOKENS,
+                )
+            _service = VisionService(
+                backend,
+                max_batch_size=settings.LOCAL_VISION_MAX_BATCH_SIZE,
+                max_wait_ms=settings.LOCAL_VISION_MAX_WAIT_MS,
+                load_retry_seconds=settings.LOCAL_VISION_LOAD_RETRY,
+            )
+        return _service
+
+
+@stage("vision")
+def describe_image(image) -> Optional[str]:
+    """
+    Describes an uploaded or stored image with the local vision model,
+    or returns None when it fails.
+    """
+    try:
+        return get_vision_service().describe(load_image(image), IMAGE_PROMPT, timeout=settings.LOCAL_VISION_TIMEOUT)
+    except Exception:
+        logger.exception("Local image description failed")
+        return None
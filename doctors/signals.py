@@ -1,125 +1,101 @@
-from deep_translator import GoogleTranslator
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.utils.translation import activate
-from .models import Doctor
+from django.utils import timezone
+from .models import Chat, Doctor, Hospital, Message
+from .service.roster import ROSTER
+from .service.geo import apply_hospital_change
+from .service.retrieval import apply_doctor_change
+from .service.versions import bump_version
+from .service.doctor_translation import SOURCE_LANGUAGE, schedule_translation
+from .service.media import release
+from .service.catalog import schedule_doctor_hospital_stats, schedule_hospital_stats
 
-from deep_translator import GoogleTranslator
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.utils.translation import activate
-from .models import Doctor
 
+DoctorTranslation = Doctor._parler_meta.root_model
 
-@receiver(post_save, sender=Doctor)
-def create_translations(sender, instance, created, **kwargs):
-    if getattr(instance, '_translations_updating', False):
+
+@receiver(post_save, sender=DoctorTranslation)
+def create_translations(sender, instance, **kwargs):
+    # parler saves a translation only when its fields change, so saves that
+    # leave the uz text alone (prize, image, ...) never get here.
+    if instance.language_code != SOURCE_LANGUAGE:
         return
+    doctor = instance.master if DoctorTranslation.master.is_cached(instance) else None
+    schedule_translation(instance, doctor)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_save, sender=DoctorTranslation)
+@receiver(post_delete, sender=DoctorTranslation)
+def invalidate_roster(sender, instance, **kwargs):
+    # Bump after commit so no reader rebuilds the roster from a state
+    # that is about to be rolled back or is not yet visible. Version hooks
+    # are robust: a failed bump is logged and never fails a committed save.
+    transaction.on_commit(lambda: bump_version(ROSTER), robust=True)
+
+
+@receiver(post_save, sender=Hospital)
+def update_hospital_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: apply_hospital_change(instance), robust=True)
+
+
+@receiver(post_delete, sender=Hospital)
+def remove_from_hospital_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: apply_hospital_change(instance, deleted=True), robust=True)
+
+
+@receiver(post_save, sender=Doctor)
+def reindex_doctor(sender, instance, **kwargs):
+    transaction.on_commit(lambda: apply_doctor_change(instance.pk), robust=True)
+
+
+@receiver(post_delete, sender=Doctor)
+def unindex_doctor(sender, instance, **kwargs):
+    transaction.on_commit(lambda: apply_doctor_change(instance.pk, deleted=True), robust=True)
 
+
+@receiver(post_save, sender=DoctorTranslation)
+@receiver(post_delete, sender=DoctorTranslation)
+def reindex_doctor_translation(sender, instance, **kwargs):
+    transaction.on_commit(lambda: apply_doctor_change(instance.master_id), robust=True)
+
+
+@receiver(post_save, sender=Doctor)
+def update_hospital_stats(sender, instance, created, **kwargs):
     if created:
-        activate('uz')
-        field = instance.safe_translation_getter('field', default='')
-        fieldDescription = instance.safe_translation_getter('fieldDescription', default='')
-        description = instance.safe_translation_getter('description', default='')
-
-        if not instance.has_translation('ru'):
-            instance.set_current_language('ru')
-            instance.field = GoogleTranslator(source='uz', target='ru').translate(field) if field else ''
-            instance.fieldDescription = GoogleTranslator(source='uz', target='ru').translate(fieldDescription) if fieldDescription else ''
-            instance.description = GoogleTranslator(source='uz', target='ru').translate(description) if description else ''
-            setattr(instance, '_translations_updating', True)
-            try:
-                instance.save()
-            finally:
-                setattr(instance, '_translations_updating', False)
-
-        if not instance.has_translation('en'):
-            instance.set_current_language('en')
-            instance.field = GoogleTranslator(source='uz', target='en').translate(field) if field else ''
-            instance.fieldDescription = GoogleTranslator(source='uz', target='en').translate(fieldDescription) if fieldDescription else ''
-            instance.description = GoogleTranslator(source='uz', target='en').translate(description) if description else ''
-            setattr(instance, '_translations_updating', True)
-            try:
-                instance.save()
-            finally:
-                setattr(instance, '_translations_updating', False)
-
-    else:
-        activate('uz')
-        uz_field = instance.safe_translation_getter('field', default='')
-        uz_fieldDescription = instance.safe_translation_getter('fieldDescription', default='')
-        uz_description = instance.safe_translation_getter('description', default='')
-
-        try:
-            if instance.has_translation('ru'):
-                instance.set_current_language('ru')
-                new_field_ru = GoogleTranslator(source='uz', target='ru').translate(uz_field) if uz_field else ''
-                new_fd_ru = GoogleTranslator(source='uz', target='ru').translate(uz_fieldDescription) if uz_fieldDescription else ''
-                new_desc_ru = GoogleTranslator(source='uz', target='ru').translate(uz_description) if uz_description else ''
-
-                changed = False
-                if instance.field != new_field_ru:
-                    instance.field = new_field_ru
-                    changed = True
-                if instance.fieldDescription != new_fd_ru:
-                    instance.fieldDescription = new_fd_ru
-                    changed = True
-                if instance.description != new_desc_ru:
-                    instance.description = new_desc_ru
-                    changed = True
-
-                if changed:
-                    setattr(instance, '_translations_updating', True)
-                    try:
-                        instance.save()
-                    finally:
-                        setattr(instance, '_translations_updating', False)
-            else:
-                instance.set_current_language('ru')
-                instance.field = GoogleTranslator(source='uz', target='ru').translate(uz_field) if uz_field else ''
-                instance.fieldDescription = GoogleTranslator(source='uz', target='ru').translate(uz_fieldDescription) if uz_fieldDescription else ''
-                instance.description = GoogleTranslator(source='uz', target='ru').translate(uz_description) if uz_description else ''
-                setattr(instance, '_translations_updating', True)
-                try:
-                    instance.save()
-                finally:
-                    setattr(instance, '_translations_updating', False)
-        except Exception:
-            pass
-
-        try:
-            if instance.has_translation('en'):
-                instance.set_current_language('en')
-                new_field_en = GoogleTranslator(source='uz', target='en').translate(uz_field) if uz_field else ''
-                new_fd_en = GoogleTranslator(source='uz', target='en').translate(uz_fieldDescription) if uz_fieldDescription else ''
-                new_desc_en = GoogleTranslator(source='uz', target='en').translate(uz_description) if uz_description else ''
-
-                changed = False
-                if instance.field != new_field_en:
-                    instance.field = new_field_en
-                    changed = True
-                if instance.fieldDescription != new_fd_en:
-                    instance.fieldDescription = new_fd_en
-                    changed = True
-                if instance.description != new_desc_en:
-                    instance.description = new_desc_en
-                    changed = True
-
-                if changed:
-                    setattr(instance, '_translations_updating', True)
-                    try:
-                        instance.save()
-                    finally:
-                        setattr(instance, '_translations_updating', False)
-            else:
-                instance.set_current_language('en')
-                instance.field = GoogleTranslator(source='uz', target='en').translate(uz_field) if uz_field else ''
-                instance.fieldDescription = GoogleTranslator(source='uz', target='en').translate(uz_fieldDescription) if uz_fieldDescription else ''
-                instance.description = GoogleTranslator(source='uz', target='en').translate(uz_description) if uz_description else ''
-                setattr(instance, '_translations_updating', True)
-                try:
-                    instance.save()
-                finally:
-                    setattr(instance, '_translations_updating', False)
-        except Exception:
-            pass
+        schedule_hospital_stats(instance.hospital_id)
+    elif instance.tracker.has_changed('hospital'):
+        schedule_hospital_stats(instance.hospital_id, instance.tracker.previous('hospital'))
+
+
+@receiver(post_delete, sender=Doctor)
+def remove_from_hospital_stats(sender, instance, **kwargs):
+    schedule_hospital_stats(instance.hospital_id)
+
+
+@receiver(post_save, sender=DoctorTranslation)
+@receiver(post_delete, sender=DoctorTranslation)
+def update_hospital_departments(sender, instance, **kwargs):
+    schedule_doctor_hospital_stats(instance.master_id)
+
+
+@receiver(m2m_changed, sender=Doctor.tags.through)
+def reindex_doctor_tags(sender, instance, action, **kwargs):
+    if isinstance(instance, Doctor) and action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: apply_doctor_change(instance.pk), robust=True)
+
+
+@receiver(post_save, sender=Message)
+def touch_chat(sender, instance, **kwargs):
+    # Chat.updated_at versions the message history (the chat detail ETag).
+    Chat.objects.filter(pk=instance.chat_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Message)
+def release_uploads(sender, instance, **kwargs):
+    release(instance.image.name)
+    release(instance.file.name)
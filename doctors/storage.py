@@ -0,0 +1,44 @@
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import LazyObject
+
+from doctors.service.hashing import file_sha256
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload once, under the SHA-256 of its content:
+    ``chat_images/scan.jpg`` is saved as ``chat_images/ab/cd/abcd…ef.jpg``.
+    Saving content that is already stored writes nothing and returns the
+    existing name. Every save counts a reference through
+    ``doctors.service.media.store``, and files are deleted through
+    ``doctors.service.media.release`` once nothing references them.
+    """
+
+    def __init__(self, **kwargs):
+        # Two uploads of the same content race for the same name; either copy is correct.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        from doctors.service.media import store
+
+        sha = file_sha256(content)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        target = posixpath.join(directory, sha[:2], sha[2:4], sha + extension)
+        return store(target, lambda: super(ContentAddressedStorage, self)._save(target, content))
+
+
+class _ChatMediaStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = ContentAddressedStorage()
+
+
+chat_media_storage = _ChatMediaStorage()
+
+
+def get_chat_media_storage():
+    return chat_media_storage
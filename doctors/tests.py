@@ -1,3 +1,1377 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models.signals import post_save
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone, translation
+from PIL import Image
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from doctors.models import Chat, ChatJob, Doctor, Hospital, Message, StoredFile, TranslationMemory, VersionCounter
+from doctors.service import ai, chat, extraction, geo, reference, retrieval, roster, tts, vision
+from doctors.service.answer_cache import AnswerCache, answer_key
+from doctors.service.metrics import ANSWER_CACHE_LOOKUPS, CANDIDATE_TOKENS_SAVED, TRANSLATION_LOOKUPS
+from doctors.service.retrieval import BM25Index, select_candidates, tokenize
+from doctors.service.doctor_translation import translate_doctor
+from doctors.service.language import _detect, chat_language, detect_language
+from doctors.service.images import encode_image, load_image
+from doctors.service.http import CircuitBreaker, CircuitOpenError, UpstreamError, request, with_retries
+from doctors.service.jobs import claim_next_job, process_job, requeue_stale_jobs
+from doctors.service.summary import format_message, recent_history
+from doctors.service.tokens import count_tokens
+from doctors.service.translation import MAX_CHARS, text_hash, translate_many, translation_cache
+from doctors.service.versions import bump_version, get_version
+from doctors.storage import chat_media_storage
+from doctors.views.hospitals.serializers import HospitalSerializer
+from image_reader import StandInBackend, VisionService
+from users.models import CustomUser
+
+
+class DoctorCatalogQueryTests(TestCase):
+    """
+    The doctor catalog runs a fixed number of queries however many doctors
+    and hospitals it returns: one for doctors with their hospitals and one
+    each for translations and tags. Hospital stats are stored on the row.
+    """
+
+    LIST_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='clinic', role='clinic')
+        cls.hospitals = [
+            Hospital.objects.create(user=cls.user, name=f'Hospital {i}', latitude=41.3, longitude=69.2)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        # parler caches translations in the cache, which outlives each test's rollback.
+        cache.clear()
+        self.client = APIClient()
+
+    def add_doctors(self, count):
+        # Run the commit hooks that maintain hospital stats, without the
+        # background translation job.
+        with mock.patch('doctors.service.doctor_translation.submit'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self._add_doctors(count)
+
+    def _add_doctors(self, count):
+        for i in range(count):
+            doctor = Doctor(name=f'Doctor {i}', prize='100000', hospital=self.hospitals[i % len(self.hospitals)])
+            doctor.set_current_language('uz')
+            doctor.field = 'Kardiolog'
+            doctor.save()
+            doctor.set_current_language('en')
+            doctor.field = 'Cardiologist'
+            doctor.save()
+            doctor.tags.add('heart', f'tag{i}')
+
+    def test_list_query_count_does_not_grow_with_doctors(self):
+        self.add_doctors(3)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(reverse('doctor-list', args=['en']))
+        self.assertEqual(len(response.data), 3)
+
+        self.add_doctors(12)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(reverse('doctor-list', args=['en']))
+        self.assertEqual(len(response.data), 15)
+
+    def test_list_filtered_by_field(self):
+        self.add_doctors(4)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(reverse('doctor-list', args=['en']), {'field': 'cardio'})
+        self.assertEqual(len(response.data), 4)
+
+    def test_list_hospital_stats(self):
+        self.add_doctors(5)
+        response = self.client.get(reverse('doctor-list', args=['en']))
+        hospital = next(d['hospital'] for d in response.data if d['hospital']['id'] == self.hospitals[0].pk)
+        self.assertEqual(hospital['doctors'], 2)
+        self.assertEqual(hospital['departments'], ['Cardiologist'])
+        self.assertEqual(sorted(response.data[0]['tags']), ['heart', 'tag0'])
+
+    def test_detail_query_count(self):
+        self.add_doctors(6)
+        doctor = Doctor.objects.first()
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(reverse('doctor-detail', args=['en', doctor.pk]))
+        self.assertEqual(response.data['hospital']['doctors'], 2)
+
+    def test_hospital_list_query_count(self):
+        self.add_doctors(6)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('hospital-list'))
+        self.assertEqual([h['doctors'] for h in response.data], [2, 2, 2])
+
+
+class HospitalStatsTests(TestCase):
+    """Doctor changes keep each hospital's stored doctor count and departments current."""
+
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        self.hospital = Hospital.objects.create(user=user, name='A', latitude=41.3, longitude=69.2)
+        self.other = Hospital.objects.create(user=user, name='B', latitude=41.3, longitude=69.2)
+
+    def commit(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def create_doctor(self, hospital, uz, en=None):
+        doctor = Doctor(name='Doctor', prize='100000', hospital=hospital)
+        doctor.set_current_language('uz')
+        doctor.field = uz
+        doctor.save()
+        if en:
+            doctor.set_current_language('en')
+            doctor.field = en
+            doctor.save()
+        return doctor
+
+    def assertStats(self, hospital, count, departments):
+        hospital.refresh_from_db()
+        self.assertEqual(hospital.doctor_count, count)
+        self.assertEqual(hospital.departments, departments)
+
+    @mock.patch('doctors.service.doctor_translation.submit')
+    def test_create_update_move_and_delete(self, submit):
+        with self.commit():
+            first = self.create_doctor(self.hospital, 'Kardiolog', 'Cardiologist')
+            self.create_doctor(self.hospital, 'Kardiolog', 'Cardiologist')
+            self.create_doctor(self.hospital, 'Nevrolog')
+        self.assertStats(self.hospital, 3, {'uz': ['Kardiolog', 'Nevrolog'], 'en': ['Cardiologist']})
+
+        with self.commit():
+            first.set_current_language('uz')
+            first.field = 'Terapevt'
+            first.save()
+        self.assertStats(self.hospital, 3, {'uz': ['Terapevt', 'Kardiolog', 'Nevrolog'], 'en': ['Cardiologist']})
+
+        with self.commit():
+            first.hospital = self.other
+            first.save()
+        self.assertStats(self.hospital, 2, {'uz': ['Kardiolog', 'Nevrolog'], 'en': ['Cardiologist']})
+        self.assertStats(self.other, 1, {'uz': ['Terapevt'], 'en': ['Cardiologist']})
+
+        with self.commit():
+            first.delete()
+        self.assertStats(self.other, 0, {})
+
+    @mock.patch('doctors.service.doctor_translation.submit')
+    def test_departments_fall_back_to_uz_until_translated(self, submit):
+        with self.commit():
+            self.create_doctor(self.hospital, 'Nevrolog')
+        self.hospital.refresh_from_db()
+        with translation.override('ru'):
+            self.assertEqual(HospitalSerializer(self.hospital).data['departments'], ['Nevrolog'])
+
+    @mock.patch('doctors.service.doctor_translation.submit')
+    def test_rebuild_command(self, submit):
+        self.create_doctor(self.hospital, 'Kardiolog', 'Cardiologist')
+        self.create_doctor(self.other, 'Nevrolog')
+        Hospital.objects.update(doctor_count=0, departments={})
+        call_command('rebuild_hospital_stats', stdout=mock.Mock())
+        self.assertStats(self.hospital, 1, {'uz': ['Kardiolog'], 'en': ['Cardiologist']})
+        self.assertStats(self.other, 1, {'uz': ['Nevrolog']})
+
+
+class VersionCounterTests(TestCase):
+    """Version counters are shared by every process and bumped atomically."""
+
+    def test_bumps_are_sequential_and_stored_in_the_database(self):
+        before = get_version('test')
+        self.assertEqual(bump_version('test'), before + 1)
+        self.assertEqual(bump_version('test'), before + 2)
+        self.assertEqual(VersionCounter.objects.get(name='test').value, before + 2)
+        self.assertEqual(get_version('test'), before + 2)
+
+    def test_first_bump_seeds_the_counter(self):
+        bumped = bump_version('new')
+        self.assertEqual(get_version('new'), bumped)
+
+    @override_settings(VERSION_CACHE='default')
+    def test_cache_backed_counters(self):
+        cache.clear()
+        before = get_version('test')
+        self.assertEqual(bump_version('test'), before + 1)
+        self.assertFalse(VersionCounter.objects.exists())
+
+    @mock.patch('doctors.signals.bump_version', side_effect=DatabaseError('no such table'))
+    def test_a_failed_bump_does_not_fail_the_save(self, bump):
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        with self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            Hospital.objects.create(user=user, name='A', latitude=41.3, longitude=69.2)
+        bump.assert_called()
+
+
+class RecordingBackend(StandInBackend):
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+        self.release = threading.Event()
+
+    def generate(self, images, prompts):
+        self.batches.append(len(images))
+        if self.delay:
+            self.release.wait(self.delay)
+        return super().generate(images, prompts)
+
+
+class FailingBackend(StandInBackend):
+    def __init__(self, failures=None):
+        self.failures = failures
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        if self.failures is None or self.loads <= self.failures:
+            raise RuntimeError("no weights")
+
+
+class VisionServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.image = Image.new('RGB', (2, 3), (10, 20, 30))
+
+    def test_requests_are_answered_in_batches(self):
+        backend = RecordingBackend()
+        service = VisionService(backend, max_batch_size=2, max_wait_ms=200)
+        futures = [service.submit(self.image, f'prompt {i}') for i in range(5)]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(backend.batches, [2, 2, 1])
+        self.assertEqual(results[3], '2x3 image, mean colour (10, 20, 30). Prompt: prompt 3')
+
+    def test_describe_times_out(self):
+        backend = RecordingBackend(delay=5)
+        service = VisionService(backend, max_batch_size=1, max_wait_ms=0)
+        with self.assertRaises(FutureTimeoutError):
+            service.describe(self.image, 'slow', timeout=0.05)
+        backend.release.set()
+
+    def test_load_failure_fails_every_request(self):
+        service = VisionService(FailingBackend(), max_wait_ms=0)
+        with self.assertRaises(RuntimeError):
+            service.describe(self.image, 'a', timeout=5)
+        with self.assertRaises(RuntimeError):
+            service.describe(self.image, 'b', timeout=5)
+
+    def test_failed_load_is_retried_after_the_backoff(self):
+        backend = FailingBackend(failures=1)
+        service = VisionService(backend, max_wait_ms=0, load_retry_seconds=0.05)
+        with self.assertLogs('image_reader.service', 'ERROR'), self.assertRaises(RuntimeError):
+            service.describe(self.image, 'a', timeout=5)
+        time.sleep(0.05)
+        self.assertTrue(service.describe(self.image, 'b', timeout=5).startswith('2x3 image'))
+        self.assertEqual(backend.loads, 2)
+
+
+@override_settings(LOCAL_VISION_BACKEND='stand-in')
+class DescribeImageTests(SimpleTestCase):
+    def setUp(self):
+        vision._service = None
+        self.addCleanup(setattr, vision, '_service', None)
+
+    def upload(self):
+        data = io.BytesIO()
+        Image.new('RGB', (4, 4), (255, 0, 0)).save(data, format='PNG')
+        return SimpleUploadedFile('photo.png', data.getvalue(), content_type='image/png')
+
+    def test_describes_with_the_stand_in_backend(self):
+        self.assertTrue(vision.local_vision_enabled())
+        description = vision.describe_image(self.upload())
+        self.assertTrue(description.startswith('4x4 image, mean colour (255, 0, 0).'))
+
+    def test_returns_none_when_description_fails(self):
+        broken = SimpleUploadedFile('photo.png', b'not an image', content_type='image/png')
+        with self.assertLogs('doctors.service.vision', 'ERROR'):
+            self.assertIsNone(vision.describe_image(broken))
+
+    @override_settings(LOCAL_VISION_TIMEOUT=0.05)
+    def test_returns_none_on_timeout(self):
+        backend = RecordingBackend(delay=5)
+        vision._service = VisionService(backend, max_batch_size=1, max_wait_ms=0)
+        with self.assertLogs('doctors.service.vision', 'ERROR'):
+            self.assertIsNone(vision.describe_image(self.upload()))
+        backend.release.set()
+
+
+class PromptCacheTests(TestCase):
+    """
+    The provider caches the leading system messages only from
+    PROMPT_CACHE_MIN_TOKENS up, so caching applies when the full roster is
+    sent after the system prompt; per-turn candidates leave too short a prefix.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        hospitals = [
+            Hospital.objects.create(user=user, name=f'Hospital {i}', latitude=41.3 + i / 100, longitude=69.2)
+            for i in range(4)
+        ]
+        with mock.patch('doctors.service.doctor_translation.submit'):
+            for i in range(120):
+                doctor = Doctor(name=f'Doctor Number {i}', prize='100000', hospital=hospitals[i % 4])
+                doctor.set_current_language('uz')
+                doctor.field = 'Kardiolog'
+                doctor.save()
+
+    def setUp(self):
+        cache.clear()
+        # Version counters roll back with each test; drop the per-process memos keyed by them.
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.dict(roster._local, version=None).start()
+        mock.patch.dict(retrieval._roster_tokens, version=None).start()
+
+    def messages(self, text):
+        return ai.build_messages(chat.build_new_chat_prompt(text, 41.3, 69.2), lang='uz')[1]
+
+    def test_full_roster_prefix_is_cacheable_and_identical_between_turns(self):
+        first, second = self.messages('yuragim og\'riyapti'), self.messages('boshim og\'riyapti')
+        self.assertGreater(len(roster.get_roster()[1]), settings.AI_CANDIDATE_DOCTORS)
+        self.assertEqual(first[:2], second[:2])
+        self.assertIn('Doctor Number 119', first[1]['content'])
+        self.assertGreaterEqual(ai.cacheable_prefix_tokens(first), settings.PROMPT_CACHE_MIN_TOKENS)
+
+    @override_settings(AI_FULL_ROSTER_MAX_TOKENS=0)
+    def test_candidates_leave_no_cacheable_prefix(self):
+        messages = self.messages('yuragim og\'riyapti')
+        self.assertEqual([m['role'] for m in messages], ['system', 'user'])
+        self.assertIn('Doctors available:', messages[1]['content'])
+        self.assertEqual(ai.cacheable_prefix_tokens(messages), 0)
+
+
+@override_settings(AI_HISTORY_RECENT_MESSAGES=2, AI_HISTORY_TOKEN_BUDGET=60)
+class RecentHistoryTests(SimpleTestCase):
+    def messages(self, *contents):
+        return [Message(content=content, is_from_user=i % 2 == 0) for i, content in enumerate(contents)]
+
+    def test_keeps_unsummarized_messages_older_than_the_recent_ones(self):
+        messages = self.messages('bosh', 'dam oling', 'isitma', 'suv iching', 'yo\'tal')
+        self.assertEqual(recent_history(messages), messages)
+
+    def test_cuts_the_newest_message_to_the_budget(self):
+        long = 'boshim juda qattiq og\'riyapti ' * 100
+        history = recent_history(self.messages('bosh', long))
+        self.assertEqual(len(history), 1)
+        self.assertTrue(long.startswith(history[0].content))
+        self.assertLessEqual(count_tokens(format_message(history[0])), 60)
+
+    def test_a_message_over_the_budget_ends_the_history(self):
+        messages = self.messages('bosh', 'isitma ' * 100, 'yo\'tal')
+        history = recent_history(messages)
+        self.assertEqual([msg.content for msg in history][1:], ['yo\'tal'])
+        self.assertTrue(messages[1].content.startswith(history[0].content))
+        self.assertEqual(messages[1].content, 'isitma ' * 100)
+
+
+class ChatJobTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2)
+        message = Message.objects.create(chat=self.chat, content='boshim og\'riyapti')
+        ChatJob.objects.create(chat=self.chat, user_message=message, is_first_turn=True)
+        self.job = claim_next_job()
+
+    def test_requeues_only_jobs_without_a_recent_heartbeat(self):
+        long_ago = timezone.now() - timedelta(seconds=600)
+        ChatJob.objects.filter(pk=self.job.pk).update(started_at=long_ago)
+        self.assertEqual(requeue_stale_jobs(300), 0)
+
+        ChatJob.objects.filter(pk=self.job.pk).update(heartbeat_at=long_ago)
+        self.assertEqual(requeue_stale_jobs(300), 1)
+        self.assertEqual(ChatJob.objects.get(pk=self.job.pk).status, ChatJob.STATUS_QUEUED)
+
+    @mock.patch('doctors.service.jobs.answer_new_chat', return_value=('Kardiologga boring.', [1]))
+    def test_stores_the_answer(self, answer):
+        process_job(self.job)
+        job = ChatJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.status, ChatJob.STATUS_DONE)
+        self.assertEqual(job.ai_message.content, 'Kardiologga boring.')
+
+    @mock.patch('doctors.service.jobs.answer_new_chat')
+    def test_drops_the_answer_of_a_requeued_job(self, answer):
+        def requeue(*args):
+            ChatJob.objects.filter(pk=self.job.pk).update(status=ChatJob.STATUS_QUEUED)
+            return 'Kardiologga boring.', [1]
+
+        answer.side_effect = requeue
+        with self.assertLogs('doctors.service.jobs', 'WARNING'):
+            process_job(self.job)
+        self.assertEqual(ChatJob.objects.get(pk=self.job.pk).status, ChatJob.STATUS_QUEUED)
+        self.assertFalse(self.chat.messages.filter(is_from_user=False).exists())
+
+    @override_settings(CHAT_JOB_RETRY_DELAY=10)
+    @mock.patch('doctors.service.jobs.answer_new_chat', side_effect=ConnectionError('upstream down'))
+    def test_failed_jobs_wait_before_they_are_retried(self, answer):
+        with self.assertLogs('doctors.service.jobs', 'ERROR'):
+            process_job(self.job)
+        job = ChatJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.error), (ChatJob.STATUS_QUEUED, 'upstream down'))
+        self.assertIsNone(claim_next_job())
+
+        retry_at = job.not_before + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=retry_at):
+            job = claim_next_job()
+            self.assertEqual(job.attempts, 2)
+            with self.assertLogs('doctors.service.jobs', 'ERROR'):
+                process_job(job)
+        job = ChatJob.objects.get(pk=job.pk)
+        self.assertEqual(job.not_before - retry_at, timedelta(seconds=20))
+
+        ChatJob.objects.filter(pk=job.pk).update(not_before=None)
+        job = claim_next_job()
+        with self.assertLogs('doctors.service.jobs', 'ERROR'):
+            process_job(job)
+        self.assertEqual(ChatJob.objects.get(pk=job.pk).status, ChatJob.STATUS_FAILED)
+
+
+class ChatHistoryPageTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2)
+        self.messages = [Message.objects.create(chat=self.chat, content=f'message {i}') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def page(self, **params):
+        response = self.client.get(reverse('chat-detail', args=[self.chat.pk]), {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def contents(self, page):
+        return [message['content'] for message in page['messages']]
+
+    def test_latest_page_and_older_pages(self):
+        latest = self.page()
+        self.assertEqual(self.contents(latest), ['message 3', 'message 4'])
+        older = self.page(before=latest['before'])
+        self.assertEqual(self.contents(older), ['message 1', 'message 2'])
+        oldest = self.page(before=older['before'])
+        self.assertEqual(self.contents(oldest), ['message 0'])
+        self.assertIsNone(oldest['before'])
+
+    def test_after_reports_whether_older_messages_exist(self):
+        first = self.page(before=self.page(before=self.page()['before'])['before'])
+        newer = self.page(after=first['after'])
+        self.assertEqual(self.contents(newer), ['message 1', 'message 2'])
+        self.assertIsNotNone(newer['before'])
+
+        self.messages[0].delete()
+        newer = self.page(after=first['after'])
+        self.assertIsNone(newer['before'])
+
+    def test_unchanged_chat_answers_304_until_a_new_message(self):
+        url = reverse('chat-detail', args=[self.chat.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(unchanged.content, b'')
+        self.assertEqual(unchanged['ETag'], etag)
+
+        Message.objects.create(chat=self.chat, content='message 5')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.data['messages'][-1]['content'], 'message 5')
+
+
+def read_events(response):
+    """``(event, data)`` pairs of a Server-Sent Events response, read lazily."""
+    for chunk in response.streaming_content:
+        event, data = chunk.decode().strip().split('\n')
+        yield event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2, language='uz')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.answer = ['Dam oling. ', 'Nevrologga boring.', '\n[7, 9]']
+        inputs = (chat.Prompt('turn'), None, 'uz')
+        mock.patch('doctors.views.chat.views.new_chat_inputs', return_value=inputs).start()
+        mock.patch('doctors.views.chat.views.followup_inputs', return_value=inputs).start()
+        mock.patch('doctors.views.chat.views.answer_cache', AnswerCache(max_entries=10, ttl=60)).start()
+        mock.patch('doctors.service.ai.build_messages', return_value=('model', [])).start()
+        mock.patch('doctors.service.ai.stream_answer', side_effect=lambda model, messages: iter(self.answer)).start()
+        self.schedule_voice = mock.patch('doctors.views.chat.views.schedule_voice').start()
+        self.schedule_summary = mock.patch('doctors.views.chat.views.schedule_summary').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_new_chat_is_saved_after_the_last_token(self):
+        response = self.client.post(reverse('chat-stream'), {'latitude': 41.3, 'longitude': 69.2, 'message': 'Boshim og\'riyapti'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = read_events(response)
+        self.assertEqual(next(events), ('token', {'text': 'Dam oling. '}))
+        self.assertFalse(Chat.objects.exclude(pk=self.chat.pk).exists())
+
+        rest = list(events)
+        self.assertEqual([event for event, _ in rest], ['token', 'token', 'done'])
+        done = rest[-1][1]
+        self.assertEqual((done['message'], done['doctors']), ('Dam oling. Nevrologga boring.', [7, 9]))
+        chat = Chat.objects.get(pk=done['id'])
+        self.assertEqual([(m.is_from_user, m.content) for m in chat.messages.order_by('id')],
+                         [(True, "Boshim og'riyapti"), (False, 'Dam oling. Nevrologga boring.')])
+        self.assertEqual(done['message_id'], chat.messages.latest('id').id)
+        self.schedule_voice.assert_called_once()
+
+    def test_follow_up_is_saved_after_the_stream(self):
+        response = self.client.patch(reverse('chat-detail-stream', args=[self.chat.pk]), {'message': 'Isitma ham bor'})
+        events = read_events(response)
+        next(events)
+        self.assertFalse(self.chat.messages.exists())
+
+        self.assertEqual([event for event, _ in events], ['token', 'token', 'done'])
+        self.assertEqual([(m.is_from_user, m.content) for m in self.chat.messages.order_by('id')],
+                         [(True, 'Isitma ham bor'), (False, 'Dam oling. Nevrologga boring.')])
+        self.schedule_summary.assert_called_once_with(self.chat)
+
+    def test_failed_stream_saves_nothing(self):
+        def broken(model, messages):
+            yield 'Dam '
+            raise ConnectionError
+        with mock.patch('doctors.service.ai.stream_answer', side_effect=broken):
+            response = self.client.patch(reverse('chat-detail-stream', args=[self.chat.pk]), {'message': 'Isitma'})
+            events = list(read_events(response))
+        self.assertEqual([event for event, _ in events], ['token', 'error'])
+        self.assertFalse(self.chat.messages.exists())
+        self.schedule_voice.assert_not_called()
+
+
+class ContentAddressedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2)
+
+    def upload(self):
+        file = SimpleUploadedFile('analysis.txt', b'hemoglobin 120 g/l', content_type='text/plain')
+        return Message.objects.create(chat=self.chat, file=file)
+
+    def test_same_content_is_stored_once_and_deleted_with_its_last_message(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(StoredFile.objects.get(name=first.file.name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(chat_media_storage.exists(second.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(chat_media_storage.exists(second.file.name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_upload_before_a_pending_delete_keeps_the_file(self):
+        first = self.upload()
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        second = self.upload()
+        for callback in callbacks:
+            callback()
+        self.assertTrue(chat_media_storage.exists(second.file.name))
+        self.assertEqual(StoredFile.objects.get(name=second.file.name).references, 1)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsAccessTests(TestCase):
+    def get(self, **headers):
+        return self.client.get(reverse('metrics'), **headers)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_scrape_token(self):
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_staff_users(self):
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        self.client.force_login(CustomUser.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_staff_access_tokens(self):
+        staff = CustomUser.objects.create(username='admin', is_staff=True)
+        user = CustomUser.objects.create(username='patient')
+        for account, status in ((staff, 200), (user, 403)):
+            access = RefreshToken.for_user(account).access_token
+            self.assertEqual(self.get(HTTP_AUTHORIZATION=f'Bearer {access}').status_code, status)
+
+
+@mock.patch('doctors.service.reference.extract_pdf_text', return_value='bosh og\'rig\'i va isitma ' * 400)
+class ReferenceIngestTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.pdf_dir = Path(root) / 'pdf'
+        self.pdf_dir.mkdir()
+        (self.pdf_dir / 'guide.pdf').write_bytes(b'%PDF guide')
+        settings_override = override_settings(REFERENCE_INDEX_DIR=Path(root) / 'index', REFERENCE_EMBEDDER='stand-in')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def ingest(self):
+        return reference.ingest(self.pdf_dir, log=mock.Mock())
+
+    def test_unchanged_files_are_kept(self, extract):
+        self.assertEqual(self.ingest().added, 1)
+        stats = self.ingest()
+        self.assertEqual((stats.added, stats.unchanged), (0, 1))
+
+    def test_changed_chunk_settings_rechunk_every_file(self, extract):
+        chunks = self.ingest().chunks
+        with override_settings(REFERENCE_CHUNK_TOKENS=settings.REFERENCE_CHUNK_TOKENS * 2):
+            stats = self.ingest()
+        self.assertEqual((stats.added, stats.unchanged), (1, 0))
+        self.assertLess(stats.chunks, chunks)
+        manifest = reference.read_manifest(reference.index_root())
+        self.assertEqual(manifest['chunk_tokens'], settings.REFERENCE_CHUNK_TOKENS * 2)
+
+
+class HospitalIndexTests(SimpleTestCase):
+    def test_distances_match_known_values(self):
+        index = geo.HospitalIndex([(1, 'Equator', 0, 1), (2, 'Antipode', 0, 180), (3, 'Samarkand', 39.6542, 66.9597)])
+        distances = index.distances(0, 0)
+        self.assertAlmostEqual(distances[0], 111.195, places=3)
+        self.assertAlmostEqual(distances[1], 20015.087, places=3)
+        # Tashkent to Samarkand, by the scalar haversine formula.
+        self.assertAlmostEqual(index.distances_by_id(41.2995, 69.2401)[3], 265.83, places=2)
+
+    def test_nearest_and_within(self):
+        index = geo.HospitalIndex([(1, 'Far', 41.0, 70.0), (2, 'Near', 41.3, 69.2), (3, 'Mid', 41.3, 69.5)])
+        self.assertEqual([h['id'] for h in index.nearest(41.3, 69.2, k=2)], [2, 3])
+        self.assertEqual([h['id'] for h in index.nearest(41.3, 69.2, k=10)], [2, 3, 1])
+        self.assertEqual([h['id'] for h in index.within(41.3, 69.2, radius_km=30)], [2, 3])
+        self.assertEqual(index.nearest(41.3, 69.2, k=0), [])
+
+    def test_ties_keep_insertion_order(self):
+        index = geo.HospitalIndex([(5, 'B', 41.3, 69.2), (2, 'A', 41.3, 69.2), (9, 'C', 41.3, 69.2)])
+        self.assertEqual([h['id'] for h in index.nearest(41.0, 69.0, k=3)], [5, 2, 9])
+        self.assertEqual([h['id'] for h in index.within(41.0, 69.0, radius_km=100)], [5, 2, 9])
+
+    def test_empty_index(self):
+        index = geo.HospitalIndex()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.nearest(41.3, 69.2, k=3), [])
+        self.assertEqual(index.within(41.3, 69.2, radius_km=10), [])
+        self.assertEqual(index.distances_by_id(41.3, 69.2), {})
+
+    def test_updates_leave_readers_columns_untouched(self):
+        index = geo.HospitalIndex([(1, 'A', 41.3, 69.2), (2, 'B', 41.0, 70.0)])
+        before = index._columns
+        index.upsert(1, 'A moved', 40.0, 71.0)
+        index.upsert(3, 'C', 41.3, 69.2)
+        index.remove(2)
+        self.assertEqual(before.names, ('A', 'B'))
+        self.assertAlmostEqual(before.lat[0], math.radians(41.3))
+        self.assertEqual(index.ids.tolist(), [1, 3])
+        self.assertEqual(index.nearest(41.3, 69.2)[0]['name'], 'C')
+        self.assertEqual(index.nearest(40.0, 71.0)[0]['name'], 'A moved')
+
+
+class BM25IndexTests(SimpleTestCase):
+    def index(self):
+        index = BM25Index()
+        index.add(1, tokenize('Kardiolog yurak kasalliklari, yurak urishi'))
+        index.add(2, tokenize('Nevrolog bosh og\'rig\'i, bosh aylanishi'))
+        index.add(3, tokenize('Terapevt umumiy kasalliklar'))
+        return index
+
+    def test_ranks_the_matching_doctor_first(self):
+        scores = self.index().scores(tokenize('boshim og\'riyapti'))
+        self.assertEqual(max(scores, key=scores.get), 2)
+        self.assertNotIn(1, scores)
+
+    def test_updated_copy_leaves_the_original_untouched(self):
+        index = self.index()
+        updated = index.updated(2, tokenize('Kardiolog yurak'))
+        self.assertEqual(set(updated.scores(tokenize('yurak'))), {1, 2})
+        self.assertEqual(set(index.scores(tokenize('yurak'))), {1})
+        self.assertIn(2, index.scores(tokenize('bosh')))
+
+        removed = index.updated(1, None)
+        self.assertEqual(len(removed), 2)
+        self.assertEqual(set(index.scores(tokenize('yurak'))), {1})
+
+
+class CandidateSelectionTests(TestCase):
+    FIELDS = ['Kardiolog', 'Nevrolog', 'Terapevt', 'Dermatolog', 'Stomatolog']
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        cls.hospital = Hospital.objects.create(user=user, name='Clinic', latitude=41.3, longitude=69.2)
+        with mock.patch('doctors.service.doctor_translation.submit'):
+            cls.doctors = [cls.create_doctor(f'Doctor {i}', cls.FIELDS[i % 5]) for i in range(10)]
+
+    @classmethod
+    def create_doctor(cls, name, field):
+        doctor = Doctor(name=name, prize='100000', hospital=cls.hospital)
+        doctor.set_current_language('uz')
+        doctor.field = field
+        doctor.save()
+        return doctor
+
+    def setUp(self):
+        cache.clear()
+        # Version counters roll back with each test; drop the per-process state keyed by them.
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.dict(roster._local, version=None).start()
+        mock.patch.dict(retrieval._roster_tokens, version=None).start()
+        mock.patch.object(retrieval, '_index', BM25Index()).start()
+        mock.patch.object(geo, '_index', geo.HospitalIndex()).start()
+
+    @override_settings(AI_FULL_ROSTER_MAX_TOKENS=0)
+    def test_selects_the_lexical_matches_first(self):
+        saved = CANDIDATE_TOKENS_SAVED._series.get((), 0)
+        candidates = select_candidates('nevrolog kerak', 41.3, 69.2, k=3)
+        self.assertFalse(candidates.is_full_roster)
+        self.assertEqual(len(candidates.doctor_ids), 3)
+        self.assertEqual(set(candidates.doctor_ids[:2]), {self.doctors[1].id, self.doctors[6].id})
+        self.assertGreater(candidates.tokens_saved, 0)
+        self.assertEqual(CANDIDATE_TOKENS_SAVED._series[()] - saved, candidates.tokens_saved)
+
+    def test_full_roster_within_the_token_budget(self):
+        candidates = select_candidates('nevrolog', 41.3, 69.2, k=3)
+        self.assertTrue(candidates.is_full_roster)
+        self.assertEqual(len(candidates.doctor_ids), 10)
+        with override_settings(AI_FULL_ROSTER_MAX_TOKENS=0):
+            self.assertTrue(select_candidates('nevrolog', 41.3, 69.2, k=10).is_full_roster)
+            self.assertTrue(select_candidates('nevrolog', 41.3, 69.2, k=0).is_full_roster)
+
+    @override_settings(AI_FULL_ROSTER_MAX_TOKENS=0)
+    def test_doctor_changes_reindex_incrementally(self):
+        index = retrieval.get_doctor_index()
+        with mock.patch('doctors.service.doctor_translation.submit'), \
+                self.captureOnCommitCallbacks(execute=True):
+            doctor = self.create_doctor('Doctor 10', 'Pediatr')
+        # Applied to a copy of the current index, without a rebuild.
+        current = retrieval._index
+        self.assertEqual(current.version, get_version(retrieval.DOCTORS))
+        self.assertNotIn(doctor.id, index.scores(tokenize('pediatr')))
+        self.assertIn(doctor.id, current.scores(tokenize('pediatr')))
+        self.assertEqual(select_candidates('pediatr', 41.3, 69.2, k=1).doctor_ids, [doctor.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.delete()
+        self.assertNotIn(doctor.id, retrieval.get_doctor_index().scores(tokenize('pediatr')))
+
+
+def fake_translate_many(texts, source, target):
+    return [f'{target}: {text}' for text in texts]
+
+
+def run_now(fn, *args):
+    fn(*args)
+
+
+DoctorTranslation = Doctor._parler_meta.root_model
+
+
+@mock.patch('doctors.service.doctor_translation.submit', side_effect=run_now)
+@mock.patch('doctors.service.doctor_translation.translate_many', side_effect=fake_translate_many)
+class DoctorTranslationSkipTests(TestCase):
+    """Saves that leave the uz text alone cost no translation requests and no translation saves."""
+
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        self.hospital = Hospital.objects.create(user=user, name='A', latitude=41.3, longitude=69.2)
+        self.saved = []
+
+        def record(sender, instance, **kwargs):
+            if instance.language_code != 'uz':
+                self.saved.append(instance.language_code)
+
+        post_save.connect(record, sender=DoctorTranslation)
+        self.addCleanup(post_save.disconnect, record, sender=DoctorTranslation)
+
+    def create_doctor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor = Doctor(name='Doctor', prize='100000', hospital=self.hospital)
+            doctor.set_current_language('uz')
+            doctor.field = 'Kardiolog'
+            doctor.fieldDescription = 'Yurak shifokori'
+            doctor.description = 'Tajribali'
+            doctor.save()
+        self.saved.clear()
+        return doctor
+
+    def test_saving_a_non_text_field(self, translate_many, submit):
+        doctor = self.create_doctor()
+        translate_many.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.prize = '200000'
+            doctor.save()
+        translate_many.assert_not_called()
+        self.assertEqual(self.saved, [])
+
+    def test_saving_unchanged_uz_text(self, translate_many, submit):
+        doctor = self.create_doctor()
+        translate_many.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            source = DoctorTranslation.objects.get(master=doctor, language_code='uz')
+            source.field = 'Kardiolog  '
+            source.save()
+        translate_many.assert_not_called()
+        submit.assert_called_once()  # the doctor creation only
+        self.assertEqual(self.saved, [])
+
+    def test_changing_one_field_translates_only_that_field(self, translate_many, submit):
+        doctor = self.create_doctor()
+        translate_many.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            source = DoctorTranslation.objects.get(master=doctor, language_code='uz')
+            source.field = 'Kardiojarroh'
+            source.save()
+        self.assertEqual(translate_many.call_args_list, [
+            mock.call(['Kardiojarroh'], 'uz', 'ru'),
+            mock.call(['Kardiojarroh'], 'uz', 'en'),
+        ])
+        self.assertEqual(sorted(self.saved), ['en', 'ru'])
+        english = DoctorTranslation.objects.get(master=doctor, language_code='en')
+        self.assertEqual((english.field, english.description), ('en: Kardiojarroh', 'en: Tajribali'))
+
+
+@mock.patch('doctors.service.doctor_translation.translate_many', side_effect=fake_translate_many)
+class DoctorTranslationStatusTests(TestCase):
+    """A uz save marks the doctor's translations pending until the background job finishes."""
+
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create(username='clinic', role='clinic')
+        self.hospital = Hospital.objects.create(user=user, name='A', latitude=41.3, longitude=69.2)
+
+    def create_doctor(self):
+        with mock.patch('doctors.service.doctor_translation.submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            doctor = Doctor(name='Doctor', prize='100000', hospital=self.hospital)
+            doctor.set_current_language('uz')
+            doctor.field = 'Kardiolog'
+            doctor.save()
+        return doctor, submit
+
+    def status(self, doctor):
+        return Doctor.objects.values_list('translation_status', flat=True).get(pk=doctor.pk)
+
+    def test_pending_then_done(self, translate_many):
+        doctor, submit = self.create_doctor()
+        self.assertEqual(self.status(doctor), Doctor.TRANSLATION_PENDING)
+        submit.assert_called_once_with(translate_doctor, doctor.pk)
+
+        translate_doctor(doctor.pk)
+        self.assertEqual(self.status(doctor), Doctor.TRANSLATION_DONE)
+        self.assertEqual(DoctorTranslation.objects.get(master=doctor, language_code='ru').field, 'ru: Kardiolog')
+
+    def test_pending_then_failed(self, translate_many):
+        doctor, _ = self.create_doctor()
+        translate_many.side_effect = ConnectionError('translator down')
+        with self.assertLogs('doctors.service.doctor_translation', 'ERROR'):
+            translate_doctor(doctor.pk)
+        self.assertEqual(self.status(doctor), Doctor.TRANSLATION_FAILED)
+
+    def test_saving_a_translation_schedules_nothing(self, translate_many):
+        doctor, _ = self.create_doctor()
+        translate_doctor(doctor.pk)
+        with mock.patch('doctors.service.doctor_translation.submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            english = DoctorTranslation.objects.get(master=doctor, language_code='en')
+            english.field = 'Heart doctor'
+            english.save()
+        submit.assert_not_called()
+        self.assertEqual(self.status(doctor), Doctor.TRANSLATION_DONE)
+
+
+def fake_translate(text, source, target):
+    return text.upper()
+
+
+@mock.patch('doctors.service.translation.translate', side_effect=fake_translate)
+class TranslateManyTests(TestCase):
+    def setUp(self):
+        translation_cache.clear()
+        self.addCleanup(translation_cache.clear)
+        self.lookups = dict(TRANSLATION_LOOKUPS._series)
+
+    def assertLookups(self, **layers):
+        counted = {
+            layer: TRANSLATION_LOOKUPS._series.get((layer,), 0) - self.lookups.get((layer,), 0)
+            for layer in ('memory', 'database', 'remote')
+        }
+        self.assertEqual(counted, {'memory': 0, 'database': 0, 'remote': 0, **layers})
+
+    def test_memory_hit_skips_the_database(self, translate):
+        translation_cache.set(('uz', 'en', text_hash('yurak')), 'heart')
+        with self.assertNumQueries(0):
+            self.assertEqual(translate_many(['yurak'], 'uz', 'en'), ['heart'])
+        translate.assert_not_called()
+        self.assertLookups(memory=1)
+
+    def test_database_hit_fills_the_memory_cache(self, translate):
+        TranslationMemory.objects.create(source='uz', target='en', text_hash=text_hash('yurak'),
+                                         text='yurak', translation='heart')
+        self.assertEqual(translate_many(['yurak'], 'uz', 'en'), ['heart'])
+        with self.assertNumQueries(0):
+            self.assertEqual(translate_many(['yurak'], 'uz', 'en'), ['heart'])
+        translate.assert_not_called()
+        self.assertLookups(database=1, memory=1)
+
+    def test_misses_go_out_in_one_request_and_are_stored(self, translate):
+        self.assertEqual(translate_many(['yurak', 'bosh'], 'uz', 'en'), ['YURAK', 'BOSH'])
+        translate.assert_called_once_with('yurak\n|||\nbosh', 'uz', 'en')
+        self.assertEqual(TranslationMemory.objects.count(), 2)
+        self.assertLookups(remote=2)
+
+    def test_lost_separators_fall_back_to_one_request_per_text(self, translate):
+        translate.side_effect = lambda text, source, target: text.replace('|||', '').upper()
+        self.assertEqual(translate_many(['yurak', 'bosh'], 'uz', 'en'), ['YURAK', 'BOSH'])
+        self.assertEqual(translate.call_count, 3)
+
+    def test_texts_longer_than_one_request_are_translated_in_pieces(self, translate):
+        paragraph = 'Yurak kasalliklari. ' * (MAX_CHARS // 40)
+        text = f'{paragraph}\n{paragraph}\n{paragraph}'.replace(' \n', '\n').strip()
+        [translated] = translate_many([text], 'uz', 'en')
+        self.assertGreater(len(text), MAX_CHARS)
+        self.assertEqual(translated, text.upper())
+        self.assertTrue(all(len(call.args[0]) <= MAX_CHARS for call in translate.call_args_list))
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+@mock.patch('doctors.service.http.time.monotonic', return_value=100.0)
+class CircuitBreakerTests(SimpleTestCase):
+    def fail(self, breaker, status_code=503):
+        with self.assertRaises(StatusError):
+            breaker.call(mock.Mock(side_effect=StatusError(status_code)))
+
+    def test_opens_after_the_failure_threshold(self, monotonic):
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+        for _ in range(2):
+            self.fail(breaker)
+        self.assertEqual(breaker.state, 'closed')
+        with self.assertLogs('doctors.service.http', 'WARNING'):
+            self.fail(breaker)
+        self.assertEqual(breaker.state, 'open')
+        upstream = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(upstream)
+        upstream.assert_not_called()
+
+    def test_half_open_lets_one_trial_call_through(self, monotonic):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        with self.assertLogs('doctors.service.http', 'WARNING'):
+            self.fail(breaker)
+        monotonic.return_value = 131.0
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+        monotonic.return_value = 162.0
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_client_errors_do_not_count(self, monotonic):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        for status_code in (400, 404, 422):
+            self.fail(breaker, status_code)
+        self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+
+
+class OutboundRequestTests(SimpleTestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        self.breaker = CircuitBreaker('translate', failure_threshold=5, reset_timeout=60)
+        for target, value in (('get_session', self.session), ('get_breaker', self.breaker)):
+            patcher = mock.patch(f'doctors.service.http.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch('doctors.service.http.time.sleep')
+    def test_client_errors_are_not_retried(self, sleep):
+        self.session.request.return_value = mock.Mock(status_code=404)
+        self.assertEqual(request('translate', 'GET', 'https://example.com').status_code, 404)
+        self.assertEqual(self.session.request.call_count, 1)
+        sleep.assert_not_called()
+        self.assertEqual(self.breaker.failures, 0)
+
+    @mock.patch('doctors.service.http.time.sleep')
+    def test_server_errors_are_retried_then_counted_once(self, sleep):
+        self.session.request.return_value = mock.Mock(status_code=503)
+        with self.assertRaises(UpstreamError):
+            request('translate', 'GET', 'https://example.com')
+        retries = settings.OUTBOUND_SERVICES['translate']['retries']
+        self.assertEqual(self.session.request.call_count, retries + 1)
+        self.assertEqual(sleep.call_count, retries)
+        self.assertEqual(self.breaker.failures, 1)
+
+    @mock.patch('doctors.service.http.time.sleep')
+    def test_backoff_is_jittered_within_the_exponential_cap(self, sleep):
+        fn = mock.Mock(side_effect=ConnectionError)
+        with self.assertRaises(ConnectionError):
+            with_retries(fn, retries=6, retry_on=(ConnectionError,), base_delay=0.5, max_delay=4.0)
+        self.assertEqual(fn.call_count, 7)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        for attempt, delay in enumerate(delays, start=1):
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(4.0, 0.5 * 2 ** (attempt - 1)))
+        self.assertGreater(len(set(delays)), 1)
+
+
+class AnswerCacheTests(TestCase):
+    def lookups(self, result):
+        return ANSWER_CACHE_LOOKUPS._series.get((result,), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        answers = AnswerCache(max_entries=2, ttl=60)
+        answers.set('a', ('A', []))
+        answers.set('b', ('B', []))
+        answers.get('a')
+        answers.set('c', ('C', []))
+        self.assertIsNone(answers.get('b'))
+        self.assertEqual(answers.get('a'), ('A', []))
+        self.assertEqual(answers.get('c'), ('C', []))
+
+    @mock.patch('doctors.service.answer_cache.time.monotonic', return_value=1000.0)
+    def test_entries_expire_after_the_ttl(self, monotonic):
+        answers = AnswerCache(max_entries=10, ttl=60)
+        answers.set('a', ('A', []))
+        monotonic.return_value = 1059.0
+        self.assertEqual(answers.get('a'), ('A', []))
+        monotonic.return_value = 1061.0
+        self.assertIsNone(answers.get('a'))
+        self.assertEqual(answers.stats()['entries'], 0)
+
+    def test_hits_and_misses_are_exported(self):
+        hits, misses = self.lookups('hit'), self.lookups('miss')
+        answers = AnswerCache(max_entries=10, ttl=60)
+        answers.get('a')
+        answers.set('a', ('A', []))
+        answers.get('a')
+        self.assertEqual((self.lookups('hit') - hits, self.lookups('miss') - misses), (1, 1))
+
+    def test_roster_and_reference_changes_change_the_key(self):
+        key = answer_key('Boshim og\'riyapti', 41.3, 69.2)
+        self.assertEqual(answer_key('boshim ogriyapti!', 41.3, 69.2), key)
+        bump_version(roster.ROSTER)
+        after_bump = answer_key('Boshim og\'riyapti', 41.3, 69.2)
+        self.assertNotEqual(after_bump, key)
+        with mock.patch('doctors.service.answer_cache.reference_version', return_value=99):
+            self.assertNotEqual(answer_key('Boshim og\'riyapti', 41.3, 69.2), after_bump)
+
+
+def make_pdf(pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in pages:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids))
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+class FileExtractionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, name, content):
+        return SimpleUploadedFile(name, content)
+
+    def test_results_are_cached_by_content(self):
+        with mock.patch('doctors.service.extraction._extract', wraps=extraction._extract) as extract:
+            first = extraction.extract_file_text(self.upload('a.txt', b'Gemoglobin 120'))
+            second = extraction.extract_file_text(self.upload('b.txt', b'Gemoglobin 120'))
+        self.assertEqual(first, "Text extracted from user's file: Gemoglobin 120")
+        self.assertEqual(second, first)
+        extract.assert_called_once()
+
+    @mock.patch('doctors.service.extraction._run_pdf', side_effect=extraction.ExtractionTimeout)
+    def test_timeouts_are_cached_as_failures(self, run_pdf):
+        with self.assertLogs('doctors.service.extraction', 'WARNING'):
+            self.assertIsNone(extraction.extract_file_text(self.upload('scan.pdf', make_pdf(['slow']))))
+        self.assertIsNone(extraction.extract_file_text(self.upload('again.pdf', make_pdf(['slow']))))
+        run_pdf.assert_called_once()
+
+    def test_pdf_reading_stops_at_the_page_limit(self):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf:
+            pdf.write(make_pdf(['Page one', 'Page two', 'Page three']))
+        self.addCleanup(os.remove, pdf.name)
+        self.assertEqual(extraction._extract_pdf(pdf.name, 2, 1000), 'Page one\nPage two')
+        self.assertEqual(extraction._extract_pdf(pdf.name, 30, 5), 'Page ')
+
+    def test_in_memory_uploads_are_spooled_to_a_file(self):
+        content = make_pdf(['Page one'])
+        with extraction._pdf_path(self.upload('scan.pdf', content)) as path:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(path))
+
+    def test_killing_the_pool_stops_a_running_parse(self):
+        pool = extraction.ExtractionPool(1)
+        future = pool.submit(time.sleep, 30)
+        deadline = time.monotonic() + 30
+        while pool._started.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        pool.kill()
+        with self.assertRaises(BrokenProcessPool):
+            future.result(timeout=10)
+
+
+def mp3_frame(fill, xing=False):
+    """An MPEG-1 Layer III frame at 128 kbps and 44.1 kHz, which is 417 bytes."""
+    body = bytes(32) + b'Xing' if xing else b''
+    return b'\xff\xfb\x90\x44' + (body + bytes([fill]) * 417)[:413]
+
+
+ID3V2 = b'ID3\x04\x00\x00\x00\x00\x00\x05tags!'
+ID3V1 = b'TAG' + bytes(125)
+
+
+class SpeechSplitTests(SimpleTestCase):
+    def test_sentences_are_packed_and_the_first_chunk_is_short(self):
+        text = 'Birinchi gap. Ikkinchi gap! Uchinchi gap?'
+        self.assertEqual(tts.split_for_speech(text, 15, 30), ['Birinchi gap.', 'Ikkinchi gap! Uchinchi gap?'])
+        self.assertEqual(tts.split_for_speech(text, 100, 100), [text])
+
+    def test_long_sentences_split_at_clauses_then_spaces(self):
+        self.assertEqual(tts.split_for_speech("Bosh og'riydi, isitma bor, yo'tal ham bor", 15, 15),
+                         ["Bosh og'riydi,", 'isitma bor,', "yo'tal ham bor"])
+        self.assertEqual(tts.split_for_speech('x' * 40, 15, 15), ['x' * 15, 'x' * 15, 'x' * 10])
+        self.assertEqual(tts.split_for_speech(' \n ', 15, 15), [])
+
+    def test_joined_mp3_keeps_only_audio_frames(self):
+        first = ID3V2 + mp3_frame(0, xing=True) + mp3_frame(1) + ID3V1
+        second = ID3V2 + mp3_frame(2) + mp3_frame(3)
+        self.assertEqual(tts.join_mp3([first, second]), mp3_frame(1) + mp3_frame(2) + mp3_frame(3))
+
+
+@override_settings(TTS_MODEL='lola', TTS_FIRST_CHUNK_CHARS=15, TTS_CHUNK_CHARS=30)
+class VoiceGenerationTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2)
+        self.audio = {}
+        self.tts = mock.patch('doctors.service.tts.tts', side_effect=self.synthesize).start()
+        mock.patch('doctors.service.tts.request', side_effect=self.download).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def synthesize(self, text, model):
+        url = f'https://voice.test/{len(self.audio)}.mp3'
+        self.audio[url] = ID3V2 + mp3_frame(len(self.audio)) + ID3V1
+        return url
+
+    def download(self, service, method, url):
+        return mock.Mock(status_code=200, content=self.audio[url])
+
+    def message(self, content):
+        return Message.objects.create(chat=self.chat, content=content, voice_status=Message.VOICE_PENDING)
+
+    def test_unchanged_chunks_reuse_stored_audio(self):
+        name = tts.synthesize_chunk('Salom.', 'lola')
+        self.assertEqual(tts.synthesize_chunk('Salom.', 'lola'), name)
+        self.assertNotEqual(tts.synthesize_chunk('Salom.', 'other'), name)
+        self.assertEqual(self.tts.call_count, 2)
+
+    def test_pending_voice_becomes_ready(self):
+        message = self.message('Birinchi gap. Ikkinchi gap!')
+        tts.generate_voice(message.pk)
+        message.refresh_from_db()
+        self.assertEqual(message.voice_status, Message.VOICE_READY)
+        self.assertEqual(len(message.voice_parts), 2)
+        name = tts.audio_name(message.content, 'lola')
+        with default_storage.open(name, 'rb') as f:
+            self.assertEqual(f.read(), mp3_frame(0) + mp3_frame(1))
+        self.assertEqual(message.voice, default_storage.url(name))
+
+        self.message('Birinchi gap. Uchinchi gap?')
+        tts.generate_voice(Message.objects.latest('id').pk)
+        self.assertEqual(self.tts.call_count, 3)
+
+    def test_pending_voice_fails_when_a_chunk_fails(self):
+        self.tts.side_effect = None
+        self.tts.return_value = None
+        message = self.message('Birinchi gap. Ikkinchi gap!')
+        tts.generate_voice(message.pk)
+        message.refresh_from_db()
+        self.assertEqual(message.voice_status, Message.VOICE_FAILED)
+        self.assertIsNone(message.voice)
+
+
+class ImagePreparationTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, image, format='JPEG', **params):
+        data = io.BytesIO()
+        image.save(data, format=format, **params)
+        return SimpleUploadedFile(f'photo.{format.lower()}', data.getvalue())
+
+    def rotated(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90 degrees clockwise to display
+        return self.upload(Image.new('RGB', (40, 20), (200, 0, 0)), exif=exif)
+
+    def test_large_images_are_downsized_to_what_the_model_uses(self):
+        self.assertEqual(load_image(self.upload(Image.new('RGB', (4000, 3000)))).size, (1024, 768))
+        self.assertEqual(load_image(self.upload(Image.new('RGB', (3000, 500)))).size, (2048, 341))
+        self.assertEqual(load_image(self.upload(Image.new('RGB', (640, 480)))).size, (640, 480))
+
+    def test_exif_orientation_is_applied(self):
+        self.assertEqual(load_image(self.rotated()).size, (20, 40))
+        self.assertEqual(load_image(self.upload(Image.new('RGBA', (8, 8)), format='PNG')).mode, 'RGB')
+
+    def test_encoded_jpeg_is_upright_without_exif_and_cached(self):
+        upload = self.rotated()
+        with mock.patch('doctors.service.images.load_image', wraps=load_image) as load:
+            data_url = encode_image(upload)
+            self.assertEqual(encode_image(upload), data_url)
+        load.assert_called_once()
+        prefix, encoded = data_url.split(',', 1)
+        self.assertEqual(prefix, 'data:image/jpeg;base64')
+        with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+            self.assertEqual(img.size, (20, 40))
+            self.assertNotIn(0x0112, img.getexif())
+
+
+class LanguageTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='patient')
+        self.chat = Chat.objects.create(user_id=user, latitude=41.3, longitude=69.2, language='ru')
+
+    def test_detection_is_deterministic(self):
+        text = 'ok rahmat'
+        results = set()
+        for _ in range(5):
+            _detect.cache_clear()
+            results.add(detect_language(text))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(detect_language('У меня болит голова и высокая температура'), 'ru')
+        self.assertEqual(detect_language('  ', default='uz'), 'uz')
+        self.assertIsNone(detect_language('123 !!', default=None))
+
+    def test_short_follow_ups_keep_the_chat_language(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(chat_language(self.chat, 'ok'), 'ru')
+        self.assertEqual(chat_language(self.chat, None), 'ru')
+
+    def test_a_change_of_language_is_saved_on_the_chat(self):
+        self.assertEqual(chat_language(self.chat, 'I have had a headache and fever since yesterday'), 'en')
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.language, 'en')
+
+    def test_chats_without_a_language_detect_short_messages(self):
+        Chat.objects.filter(pk=self.chat.pk).update(language='')
+        self.chat.refresh_from_db()
+        self.assertEqual(chat_language(self.chat, 'Здравствуйте'), 'ru')
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.language, 'ru')
+
+    def test_new_chats_store_the_detected_language(self):
+        client = APIClient()
+        client.force_authenticate(self.chat.user_id)
+        with mock.patch('doctors.views.chat.views.answer_new_chat', return_value=('Dam oling.', [])), \
+                mock.patch('doctors.views.chat.views.schedule_voice'):
+            response = client.post(reverse('chat-list'), {
+                'latitude': 41.3, 'longitude': 69.2, 'message': 'У меня болит голова и высокая температура',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Chat.objects.get(pk=response.data['id']).language, 'ru')
+
+
+class ChatListTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='patient')
+        other = CustomUser.objects.create(username='other')
+        Chat.objects.create(user_id=other, latitude=41.3, longitude=69.2)
+        self.chats = [Chat.objects.create(user_id=self.user, latitude=41.3, longitude=69.2) for _ in range(3)]
+        for chat in self.chats:
+            for i in range(4):
+                Message.objects.create(chat=chat, content=f'{chat.pk}: message {i}')
+        # Answering the oldest chat makes it the most recently active.
+        Message.objects.create(chat=self.chats[0], content='newest')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list(self, url=None, **params):
+        response = self.client.get(url or reverse('chat-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_pages_follow_activity(self):
+        first = self.list(page_size=2)
+        self.assertEqual([c['id'] for c in first['results']], [self.chats[0].pk, self.chats[2].pk])
+        self.assertIsNone(first['previous'])
+        second = self.list(first['next'])
+        self.assertEqual([c['id'] for c in second['results']], [self.chats[1].pk])
+        self.assertIsNone(second['next'])
+        self.assertEqual([c['id'] for c in self.list(second['previous'])['results']],
+                         [self.chats[0].pk, self.chats[2].pk])
+
+    def test_only_the_last_message_by_default(self):
+        chat = self.list()['results'][0]
+        self.assertNotIn('messages', chat)
+        self.assertEqual(chat['last_message']['content'], 'newest')
+
+    @override_settings(CHAT_MESSAGES_LIMIT_MAX=3)
+    def test_messages_limit_is_bounded(self):
+        chat = self.list(messages_limit=2)['results'][0]
+        self.assertEqual([m['content'] for m in chat['messages']], [f'{self.chats[0].pk}: message 3', 'newest'])
+        chat = self.list(messages_limit=1000)['results'][1]
+        self.assertEqual(len(chat['messages']), 3)
+        self.assertNotIn('messages', self.list(messages_limit=-5)['results'][0])
+        response = self.client.get(reverse('chat-list'), {'messages_limit': 'all'})
+        self.assertEqual(response.status_code, 400)
@@ -1,12 +1,17 @@
 from django.urls import path
-from doctors.views.chat.views import (ChatListView, ChatDetailView, CreateChatWithDoctorView)
+from doctors.views.chat.views import (ChatListView, ChatDetailView, CreateChatWithDoctorView,
+                                      ChatStreamView, ChatDetailStreamView, ChatJobDetailView)
 from doctors.views.doctors.views import DoctorListView, DoctorDetailView, DoctorFieldListView
 from doctors.views.hospitals.views import HospitalListView, HospitalDetailView
 from doctors.views.clinic.views import MyDoctorsView, MyDoctorDetailView
+from doctors.views.metrics.views import metrics_view
 
 urlpatterns = [
     path('chats/', ChatListView.as_view(), name='chat-list'),
     path('chats/<int:pk>/', ChatDetailView.as_view(), name='chat-detail'),
+    path('chats/stream/', ChatStreamView.as_view(), name='chat-stream'),
+    path('chats/<int:pk>/stream/', ChatDetailStreamView.as_view(), name='chat-detail-stream'),
+    path('chats/jobs/<int:pk>/', ChatJobDetailView.as_view(), name='chat-job-detail'),
     path('chats/doctor/<int:doctor_id>/', CreateChatWithDoctorView.as_view(), name='create-chat-with-doctor'),
 
     path('api/<str:lang_code>/doctors/', DoctorListView.as_view(), name='doctor-list'),
@@ -17,4 +22,6 @@ urlpatterns = [
 
     path('api/my-doctors/', MyDoctorsView.as_view(), name='my-doctor-list'), 
     path('api/my-doctors/<int:pk>/', MyDoctorDetailView.as_view(), name='my-doctor-detail'),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from doctors.models import Chat, Message
+from doctors.models import Chat, ChatJob, Message
 
 class MessageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
@@ -7,7 +7,7 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'content', 'image', 'file', 'is_from_user', 'created_at', 'voice']
+        fields = ['id', 'content', 'image', 'file', 'is_from_user', 'created_at', 'voice', 'voice_status', 'voice_parts']
 
     def get_image(self, obj):
         if obj.image:
@@ -59,3 +59,58 @@ class ChatSerializer(serializers.ModelSerializer):
             )
 
         return chat
+
+
+class ChatListSerializer(serializers.ModelSerializer):
+    """
+    A chat in the paginated chat list. Expects ``recent_messages`` to be
+    prefetched newest first; ``messages`` is only included when the view
+    was asked for a window of them.
+    """
+    last_message = serializers.SerializerMethodField()
+    messages = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'created_at', 'updated_at', 'doctor', 'last_message', 'messages']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.context.get('messages_limit'):
+            fields.pop('messages')
+        return fields
+
+    def get_last_message(self, obj):
+        recent = obj.recent_messages
+        return MessageSerializer(recent[0]).data if recent else None
+
+    def get_messages(self, obj):
+        window = obj.recent_messages[:self.context['messages_limit']]
+        return MessageSerializer(reversed(window), many=True).data
+
+
+class ChatHistoryPageSerializer(serializers.Serializer):
+    """A page of a chat's messages with the cursors for the pages around it."""
+    id = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+    messages = MessageSerializer(many=True)
+    before = serializers.CharField(allow_null=True)
+    after = serializers.CharField(allow_null=True)
+
+
+class ChatJobSerializer(serializers.ModelSerializer):
+    message = serializers.SerializerMethodField()
+    message_id = serializers.IntegerField(source='ai_message_id', read_only=True)
+    voice_status = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatJob
+        fields = ['id', 'chat', 'status', 'message', 'message_id', 'doctors', 'voice_status',
+                  'error', 'created_at', 'finished_at']
+
+    def get_message(self, obj):
+        return obj.ai_message.content if obj.ai_message else None
+
+    def get_voice_status(self, obj):
+        return obj.ai_message.voice_status if obj.ai_message else None
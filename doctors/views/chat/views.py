@@ -1,37 +1,170 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from doctors.models import Hospital, Doctor, Chat, Message
-from .serializers import ChatSerializer
+from doctors.models import Doctor, Chat, ChatJob, Message
+from .serializers import ChatSerializer, ChatHistoryPageSerializer, ChatJobSerializer, ChatListSerializer
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from math import radians, sin, cos, sqrt, atan2
+from drf_spectacular.types import OpenApiTypes
 from rest_framework.parsers import MultiPartParser, FormParser
 from drf_spectacular.utils import OpenApiExample
-from doctors.service.tts import tts
+from doctors.service.tts import schedule_voice
+from doctors.service.summary import schedule_summary
+from doctors.service.chat import answer_new_chat, followup_inputs, new_chat_cache_key, new_chat_inputs
+from doctors.service.answer_cache import answer_cache
+from doctors.service.language import detect_language
+from doctors.service.sse import event_stream_response, EventStreamRenderer
+from doctors.service.jobs import enqueue_turn
+from doctors.service.http import CircuitOpenError
+from doctors.service.metrics import stage
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.pagination import CursorPagination
+from django.db.models import Prefetch, Q
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag, urlsafe_base64_decode, urlsafe_base64_encode
+from datetime import datetime
+import hashlib
+
+class ChatCursorPagination(CursorPagination):
+    """Keyset pagination over a user's chats, served by ``chat_user_updated_idx``."""
+    ordering = ('-updated_at', '-id')
+    page_size = settings.CHAT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def encode_message_cursor(message) -> str:
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return urlsafe_base64_encode(raw.encode())
+
+
+def decode_message_cursor(cursor):
+    """Returns ``(created_at, id)`` for a cursor, None without one; ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        created_at, message_id = urlsafe_base64_decode(cursor).decode().split('|')
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (TypeError, UnicodeDecodeError) as e:
+        raise ValueError(cursor) from e
+
+
+def before_cursor(cursor):
+    created_at, message_id = cursor
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id)
+
+
+def after_cursor(cursor):
+    created_at, message_id = cursor
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id)
+
+
+def chat_etag(chat, request) -> str:
+    """
+    Validator for a page of chat history: every message change touches
+    ``Chat.updated_at``, and the query string selects the page.
+    """
+    raw = f"{chat.id}:{chat.updated_at.isoformat()}:{request.GET.urlencode()}"
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def wants_async(request):
+    return settings.CHAT_JOB_QUEUE or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def turn_body(chat, ai_message, response_text, doctor_ids) -> dict:
+    return {"id": chat.id, "message": response_text, "doctors": doctor_ids,
+            "message_id": ai_message.id, "voice": None, "voice_status": ai_message.voice_status}
+
+
+def save_first_turn(serializer, message, response_text, doctor_ids) -> dict:
+    """
+    Saves a new chat with the user's message and the AI answer, schedules
+    the answer's voice and returns the response body.
+    """
+    with stage("db_write"):
+        chat = serializer.save(language=detect_language(message, default=''))
+        ai_message = Message.objects.create(
+            chat=chat,
+            content=response_text,
+            voice_status=Message.VOICE_PENDING,
+            is_from_user=False
+        )
+    schedule_voice(ai_message)
+    return turn_body(chat, ai_message, response_text, doctor_ids)
+
+
+def save_followup_turn(chat, serializer, message, image, file, response_text, doctor_ids) -> dict:
+    """
+    Saves the user's follow-up message and the AI answer, schedules the
+    answer's voice and the chat summary and returns the response body.
+    """
+    with stage("db_write"):
+        Message.objects.create(
+            chat=chat,
+            content=message,
+            image=image,
+            file=file,
+            is_from_user=True
+        )
+        serializer.save()
+        ai_message = Message.objects.create(
+            voice_status=Message.VOICE_PENDING,
+            chat=chat,
+            content=response_text,
+            is_from_user=False
+        )
+    schedule_voice(ai_message)
+    schedule_summary(chat)
+    return turn_body(chat, ai_message, response_text, doctor_ids)
+
+
+def job_accepted(request, job):
+    response = Response(
+        {"job_id": job.id, "id": job.chat_id, "status": job.status},
+        status=status.HTTP_202_ACCEPTED
+    )
+    response['Location'] = request.build_absolute_uri(reverse('chat-job-detail', args=[job.id]))
+    return response
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth's radius in kilometers
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    return R * c
 
 class ChatListView(APIView):
     parser_classes = [MultiPartParser, FormParser]
 
     @extend_schema(
-        responses=ChatSerializer(many=True),
-        parameters=[]  # Removed user_id parameter
+        responses=ChatListSerializer(many=True),
+        parameters=[
+            OpenApiParameter('cursor', OpenApiTypes.STR, description="Opaque cursor from the `next`/`previous` link."),
+            OpenApiParameter('page_size', OpenApiTypes.INT, description=f"Chats per page (default {settings.CHAT_PAGE_SIZE}, at most 100)."),
+            OpenApiParameter('messages_limit', OpenApiTypes.INT,
+                             description=f"Include up to this many latest messages per chat (at most {settings.CHAT_MESSAGES_LIMIT_MAX}); "
+                                         "by default only `last_message` is returned."),
+        ],
+        description="The user's chats, most recently active first, as cursor-paginated `results` with `next`/`previous` links."
     )
     def get(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
-        user_id = request.user.id
-        chats = Chat.objects.filter(user_id=user_id).prefetch_related('messages')
-        serializer = ChatSerializer(chats, many=True)
-        return Response(serializer.data)
+        try:
+            messages_limit = min(max(int(request.query_params.get('messages_limit', 0)), 0), settings.CHAT_MESSAGES_LIMIT_MAX)
+        except ValueError:
+            return Response({"error": "messages_limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        recent = Message.objects.order_by('-created_at', '-id')[:max(messages_limit, 1)]
+        chats = Chat.objects.filter(user_id=request.user.id).prefetch_related(
+            Prefetch('messages', queryset=recent, to_attr='recent_messages')
+        )
+        paginator = ChatCursorPagination()
+        page = paginator.paginate_queryset(chats, request, view=self)
+        serializer = ChatListSerializer(page, many=True, context={'messages_limit': messages_limit})
+        return paginator.get_paginated_response(serializer.data)
 
     @extend_schema(
         request={
@@ -61,8 +194,11 @@ class ChatListView(APIView):
                 media_type='multipart/form-data'
             ),
         ],
-        responses=ChatSerializer,
-        description="Create a chat with latitude, longitude, and at least one of message, image, or file. AI will recommend doctors."
+        responses={201: ChatSerializer, 202: ChatJobSerializer},
+        description="Create a chat with latitude, longitude, and at least one of message, image, or file. AI will recommend doctors. "
+                    "The voice is generated in the background: poll the chat until the AI message's `voice_status` is `ready` or `failed`. "
+                    "With `Prefer: respond-async` (or CHAT_JOB_QUEUE enabled) the turn is queued and the response is "
+                    "202 with a job id to poll at `chats/jobs/<id>/`."
     )
     def post(self, request):
         if not request.user.is_authenticated:
@@ -79,88 +215,72 @@ class ChatListView(APIView):
                     {"error": "At least one of message, image, or file must be provided."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            image_file = image if image else None
-            file_file = file if file else None
-            doctors = Doctor.objects.all()
-            doctor_info = "\n".join([
-                f"{doc.id}. {doc.name} ({doc.field}) at {doc.hospital.name} [{doc.hospital.latitude}, {doc.hospital.longitude}]"
-                for doc in doctors
-            ])
-            nearest_hospital = None
-            min_distance = float('inf')
-            for hospital in Hospital.objects.all():
-                dist = calculate_distance(latitude, longitude, hospital.latitude, hospital.longitude)
-                if dist < min_distance:
-                    min_distance = dist
-                    nearest_hospital = hospital
-            prompt = (
-                f"User message: {message}\n"
-                f"Doctors available:\n{doctor_info}\n"
-                f"Nearest hospital: {nearest_hospital.name if nearest_hospital else 'N/A'}\n"
-            )
-            file_text = None
-            if file_file:
-                name = getattr(file_file, 'name', str(file_file))
-                if name.endswith('.txt'):
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        file_bytes = file_file.read()
-                        file_text = "Text extracted from user's file: " + (file_bytes.decode('utf-8') if isinstance(file_bytes, bytes) else file_bytes)
-                    else:
-                        with open(file_file, 'r', encoding='utf-8') as f:
-                            file_text = 'Text extracted from user\'s file: ' + f.read()
-                elif name.endswith('.pdf'):
-                    from PyPDF2 import PdfReader
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        reader = PdfReader(file_file)
-                    else:
-                        with open(file_file, 'rb') as f:
-                            reader = PdfReader(f)
-                    pdf_content = "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
-                    file_text = pdf_content
-                elif name.endswith('.docx'):
-                    from docx import Document
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        doc = Document(file_file)
-                    else:
-                        doc = Document(file_file)
-                    doc_content = "\n".join(paragraph.text for paragraph in doc.paragraphs)
-                    file_text = doc_content
-            from doctors.service.ai import generate_answer
-            response_text, doctor_ids = generate_answer(prompt, image_file, file_text)
+            if wants_async(request):
+                chat = serializer.save(language=detect_language(message, default=''))
+                job = enqueue_turn(chat, chat.messages.order_by('id').first(), is_first_turn=True)
+                return job_accepted(request, job)
+            try:
+                response_text, doctor_ids = answer_new_chat(message, latitude, longitude, image or None, file or None)
+            except CircuitOpenError:
+                return Response({"error": "AI service is temporarily unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             if not response_text:
                 return Response({"error": "AI could not generate an answer."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            audio = tts(response_text)
-            chat = serializer.save()
-
-            Message.objects.create(
-                chat=chat,
-                content=response_text,
-                voice=audio,
-                is_from_user=False
-            )
-
-            return Response({
-                "id": chat.id,
-                "message": response_text,
-                "doctors": doctor_ids,
-                'voice': audio 
-            }, status=status.HTTP_201_CREATED)
+            return Response(save_first_turn(serializer, message, response_text, doctor_ids),
+                            status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ChatDetailView(APIView):
     parser_classes = [MultiPartParser, FormParser]
 
-    @extend_schema(responses=ChatSerializer)
+    @extend_schema(
+        responses={200: ChatHistoryPageSerializer, 304: None},
+        parameters=[
+            OpenApiParameter('before', OpenApiTypes.STR, description="Cursor: return messages older than it (the `before` value of a previous response)."),
+            OpenApiParameter('after', OpenApiTypes.STR, description="Cursor: return messages newer than it (the `after` value of a previous response), for polling."),
+            OpenApiParameter('limit', OpenApiTypes.INT, description=f"Messages per page (default {settings.CHAT_HISTORY_PAGE_SIZE}, at most {settings.CHAT_HISTORY_PAGE_SIZE_MAX})."),
+        ],
+        description="A page of the chat's messages in chronological order, by default the latest ones. "
+                    "`before` is the cursor for older messages (null when there are none) and `after` the cursor to poll "
+                    "for newer ones. Responses carry an ETag; send it as If-None-Match to get 304 when the chat is unchanged."
+    )
     def get(self, request, pk):
         try:
             chat = Chat.objects.get(pk=pk)
         except Chat.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
-        serializer = ChatSerializer(chat)
-        return Response(serializer.data)
+        etag = chat_etag(chat, request)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return not_modified(etag)
+        try:
+            before = decode_message_cursor(request.query_params.get('before'))
+            after = decode_message_cursor(request.query_params.get('after'))
+            limit = min(max(int(request.query_params.get('limit', settings.CHAT_HISTORY_PAGE_SIZE)), 1),
+                        settings.CHAT_HISTORY_PAGE_SIZE_MAX)
+        except ValueError:
+            return Response({"error": "Invalid cursor or limit."}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = chat.messages.all()
+        if after:
+            page = list(messages.filter(after_cursor(after)).order_by('created_at', 'id')[:limit])
+            has_older = bool(page) and messages.filter(before_cursor((page[0].created_at, page[0].id))).exists()
+        else:
+            if before:
+                messages = messages.filter(before_cursor(before))
+            page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+            has_older = len(page) > limit
+            page = page[:limit][::-1]
+
+        response = Response(ChatHistoryPageSerializer({
+            "id": chat.id,
+            "created_at": chat.created_at,
+            "updated_at": chat.updated_at,
+            "messages": page,
+            "before": encode_message_cursor(page[0]) if page and has_older else None,
+            "after": encode_message_cursor(page[-1]) if page else request.query_params.get('after'),
+        }).data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
     @extend_schema(
         request={
@@ -185,8 +305,11 @@ class ChatDetailView(APIView):
                 media_type='multipart/form-data'
             ),
         ],
-        responses=ChatSerializer,
-        description="Update a chat with message, image, or file. AI will use previous history and files/images to recommend doctors."
+        responses={200: ChatSerializer, 202: ChatJobSerializer},
+        description="Update a chat with message, image, or file. AI will use previous history and files/images to recommend doctors. "
+                    "The voice is generated in the background: poll the chat until the AI message's `voice_status` is `ready` or `failed`. "
+                    "With `Prefer: respond-async` (or CHAT_JOB_QUEUE enabled) the turn is queued and the response is "
+                    "202 with a job id to poll at `chats/jobs/<id>/`."
     )
     def patch(self, request, pk):
         try:
@@ -203,74 +326,26 @@ class ChatDetailView(APIView):
                     {"error": "At least one of message, image, or file must be provided."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            image_file = image if image else None
-            file_file = file if file else None
-            doctors = Doctor.objects.all()
-            doctor_info = "\n".join([
-                f"{doc.id}. {doc.name} ({doc.field}) at {doc.hospital.name} [{doc.hospital.latitude}, {doc.hospital.longitude}]"
-                for doc in doctors
-            ])
-            history = "\n".join([
-                f"{'User' if msg.is_from_user else 'AI'}: {msg.content or '[file/image]'}"
-                for msg in chat.messages.all()
-            ])
-            prompt = (
-                f"Previous chat history:\n{history}\n"
-                f"New user message: {message or '[file/image]'}\n"
-                f"Doctors available:\n{doctor_info}\n"
-            )
-            file_text = None
-            if file_file:
-                name = getattr(file_file, 'name', str(file_file))
-                if name.endswith('.txt'):
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        file_bytes = file_file.read()
-                        file_text = "Text extracted from user's file: " + (file_bytes.decode('utf-8') if isinstance(file_bytes, bytes) else file_bytes)
-                    else:
-                        with open(file_file, 'r', encoding='utf-8') as f:
-                            file_text = 'Text extracted from user\'s file: ' + f.read()
-                elif name.endswith('.pdf'):
-                    from PyPDF2 import PdfReader
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        reader = PdfReader(file_file)
-                    else:
-                        with open(file_file, 'rb') as f:
-                            reader = PdfReader(f)
-                    pdf_content = "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
-                    file_text = pdf_content
-                elif name.endswith('.docx'):
-                    from docx import Document
-                    if hasattr(file_file, 'read'):
-                        file_file.seek(0)
-                        doc = Document(file_file)
-                    else:
-                        doc = Document(file_file)
-                    doc_content = "\n".join(paragraph.text for paragraph in doc.paragraphs)
-                    file_text = doc_content
+            if wants_async(request):
+                user_message = Message.objects.create(
+                    chat=chat,
+                    content=message,
+                    image=image,
+                    file=file,
+                    is_from_user=True
+                )
+                serializer.save()
+                job = enqueue_turn(chat, user_message)
+                return job_accepted(request, job)
+            prompt, file_text, lang = followup_inputs(chat, message, file or None)
             from ...service.ai import generate_answer
-            response_text, doctor_ids = generate_answer(prompt, image_file, file_text)
+            try:
+                response_text, doctor_ids = generate_answer(prompt, image or None, file_text, lang)
+            except CircuitOpenError:
+                return Response({"error": "AI service is temporarily unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             if not response_text:
                 return Response({"error": "AI could not generate an answer."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            audio = tts(response_text)
-
-            Message.objects.create(
-                chat=chat,
-                content=message,
-                image=image,
-                file=file,
-                is_from_user=True
-            )
-            serializer.save()
-
-            Message.objects.create(
-                voice=audio,
-                chat=chat,
-                content=response_text,
-                is_from_user=False
-            )
-            return Response({"id": chat.id, "message": ''.join(response_text), "doctors": doctor_ids, 'voice': audio})
+            return Response(save_followup_turn(chat, serializer, message, image, file, response_text, doctor_ids))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @extend_schema(responses={204: None})
@@ -318,4 +393,144 @@ class CreateChatWithDoctorView(APIView):
         )
         
         serializer = ChatSerializer(chat)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+def stream_turn(model, messages, on_complete, cache_key=None):
+    """
+    Yields SSE ``token`` events while the model writes, then persists the
+    turn through ``on_complete(response_text, doctor_ids)`` and finishes
+    with a ``done`` event carrying the cleaned answer and doctor IDs.
+    """
+    from doctors.service.ai import stream_answer, parse_ai_response
+    parts = []
+    try:
+        for delta in stream_answer(model, messages):
+            parts.append(delta)
+            yield 'token', {'text': delta}
+    except Exception:
+        yield 'error', {'error': 'AI could not generate an answer.'}
+        return
+    response_text, doctor_ids = parse_ai_response(''.join(parts))
+    if not response_text:
+        yield 'error', {'error': 'AI could not generate an answer.'}
+        return
+    if cache_key:
+        answer_cache.set(cache_key, (response_text, doctor_ids))
+    yield 'done', on_complete(response_text, doctor_ids)
+
+
+def cached_turn(answer, on_complete):
+    response_text, doctor_ids = answer
+    yield 'token', {'text': response_text}
+    yield 'done', on_complete(response_text, doctor_ids)
+
+
+class ChatStreamView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    @extend_schema(
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'latitude': {'type': 'number'},
+                    'longitude': {'type': 'number'},
+                    'message': {'type': 'string', 'nullable': True},
+                    'image': {'type': 'string', 'format': 'binary', 'nullable': True},
+                    'file': {'type': 'string', 'format': 'binary', 'nullable': True},
+                },
+                'required': ['latitude', 'longitude']
+            }
+        },
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR},
+        description="Streaming variant of chat creation. Responds with Server-Sent Events: `token` events carry "
+                    "answer text as it is generated, and a final `done` event carries the chat id, cleaned "
+                    "message, doctor IDs, AI message id and voice status, after the chat is saved. Failures end with an `error` event."
+    )
+    def post(self, request):
+        if not request.user.is_authenticated:
+            return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+        serializer = ChatSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        latitude = serializer.validated_data.get('latitude')
+        longitude = serializer.validated_data.get('longitude')
+        message = serializer.validated_data.get('message', '')
+        image = serializer.validated_data.get('image')
+        file = serializer.validated_data.get('file')
+        if not (message or image or file):
+            return Response(
+                {"error": "At least one of message, image, or file must be provided."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def on_complete(response_text, doctor_ids):
+            return save_first_turn(serializer, message, response_text, doctor_ids)
+
+        cache_key = new_chat_cache_key(message, latitude, longitude, image, file)
+        cached = answer_cache.get(cache_key) if cache_key else None
+        if cached:
+            return event_stream_response(request, cached_turn(cached, on_complete))
+
+        from doctors.service.ai import build_messages
+        prompt, file_text, lang = new_chat_inputs(message, latitude, longitude, file)
+        model, messages = build_messages(prompt, image, file_text, lang)
+        return event_stream_response(request, stream_turn(model, messages, on_complete, cache_key))
+
+
+class ChatDetailStreamView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    @extend_schema(
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'message': {'type': 'string', 'nullable': True},
+                    'image': {'type': 'string', 'format': 'binary', 'nullable': True},
+                    'file': {'type': 'string', 'format': 'binary', 'nullable': True},
+                }
+            }
+        },
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR},
+        description="Streaming variant of chat update, with the same events as chat creation streaming."
+    )
+    def patch(self, request, pk):
+        try:
+            chat = Chat.objects.get(pk=pk)
+        except Chat.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        serializer = ChatSerializer(chat, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        message = serializer.validated_data.get('message')
+        image = serializer.validated_data.get('image')
+        file = serializer.validated_data.get('file')
+        if not (message or image or file):
+            return Response(
+                {"error": "At least one of message, image, or file must be provided."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        from doctors.service.ai import build_messages
+        prompt, file_text, lang = followup_inputs(chat, message, file)
+        model, messages = build_messages(prompt, image, file_text, lang)
+
+        def on_complete(response_text, doctor_ids):
+            return save_followup_turn(chat, serializer, message, image, file, response_text, doctor_ids)
+
+        return event_stream_response(request, stream_turn(model, messages, on_complete))
+
+
+class ChatJobDetailView(APIView):
+    @extend_schema(
+        responses=ChatJobSerializer,
+        description="Status of a queued chat turn. Once `status` is `done` the AI answer is saved as a chat message."
+    )
+    def get(self, request, pk):
+        try:
+            job = ChatJob.objects.select_related('ai_message').get(pk=pk, chat__user_id=request.user)
+        except ChatJob.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(ChatJobSerializer(job).data)
@@ -4,7 +4,7 @@ from taggit_serializer.serializers import TagListSerializerField
 from doctors.models import Doctor
 from doctors.views.hospitals.serializers import HospitalSerializer
 from parler.utils.context import switch_language
-from deep_translator import GoogleTranslator
+from django.db import transaction
 
 
 class DoctorTranslationSerializer(serializers.Serializer):
@@ -35,7 +35,8 @@ class DoctorSerializer(TranslatableModelSerializer):
 
     class Meta:
         model = Doctor
-        fields = ['id', 'name', 'hospital', 'prize', 'image','tags', 'translations']
+        fields = ['id', 'name', 'hospital', 'prize', 'image','tags', 'translations', 'translation_status']
+        read_only_fields = ['translation_status']
 
 class DoctorSerializerCreate(TranslatableModelSerializer):
     field = serializers.CharField(required=False, allow_blank=True)
@@ -53,34 +54,22 @@ class DoctorSerializerCreate(TranslatableModelSerializer):
     class Meta:
         model = Doctor
         fields = ['id', 'name', 'hospital', 'prize', 'image', 'tags',
-                  'field', 'description']
+                  'field', 'description', 'translation_status']
+        read_only_fields = ['translation_status']
 
     def create(self, validated_data):
         field = validated_data.pop("field", "")
         fieldDescription = validated_data.pop("fieldDescription", "")
         description = validated_data.pop("description", "")
 
-        doctor = Doctor.objects.create(**validated_data)
-
-        # ✅ Save Uzbek translation by default
-        with switch_language(doctor, "uz"):
-            doctor.field = field
-            doctor.fieldDescription = fieldDescription
-            doctor.description = description
-            doctor.save()
-        
-        # ✅ Generate RU translation
-        with switch_language(doctor, "ru"):
-                doctor.field = GoogleTranslator(source="uz", target="ru").translate(field) if field else ""
-                doctor.fieldDescription = GoogleTranslator(source="uz", target="ru").translate(fieldDescription) if fieldDescription else ""
-                doctor.description = GoogleTranslator(source="uz", target="ru").translate(description) if description else ""
-                doctor.save()
-
-        # ✅ Generate EN translation
-        with switch_language(doctor, "en"):
-                doctor.field = GoogleTranslator(source="uz", target="en").translate(field) if field else ""
-                doctor.fieldDescription = GoogleTranslator(source="uz", target="en").translate(fieldDescription) if fieldDescription else ""
-                doctor.description = GoogleTranslator(source="uz", target="en").translate(description) if description else ""
+        # ru/en are translated in the background after commit (see signals),
+        # so the doctor and its uz fields must commit together.
+        with transaction.atomic():
+            doctor = Doctor.objects.create(**validated_data)
+            with switch_language(doctor, "uz"):
+                doctor.field = field
+                doctor.fieldDescription = fieldDescription
+                doctor.description = description
                 doctor.save()
 
         return doctor
@@ -3,7 +3,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiExample
 from .serializers import DoctorSerializer, DoctorSerializerCreate
+from django.db import transaction
 from doctors.models import Doctor
+from doctors.service.catalog import doctor_queryset
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 import json
 
@@ -22,7 +24,7 @@ class MyDoctorsView(APIView):
     def get(self, request):
         user = request.user
         if user.is_authenticated and user.role == 'clinic':
-            doctors = Doctor.objects.filter(hospital__user=user)
+            doctors = doctor_queryset().filter(hospital__user=user)
             serializer = DoctorSerializer(doctors, many=True, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -133,7 +135,10 @@ class MyDoctorDetailView(APIView):
                 doctor = Doctor.objects.get(pk=pk, hospital__user=user)
                 serializer = DoctorSerializer(doctor, data=request.data, partial=True, context={'request': request})
                 if serializer.is_valid():
-                    serializer.save()
+                    # Translations are saved after the doctor; commit them together
+                    # so the background translation job sees the new uz text.
+                    with transaction.atomic():
+                        serializer.save()
                     return Response(serializer.data, status=status.HTTP_200_OK)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             except Doctor.DoesNotExist:
@@ -8,9 +8,10 @@ from drf_spectacular.types import OpenApiTypes
 from django.conf import settings
 from collections import Counter
 from rest_framework.permissions import AllowAny
+from doctors.service.catalog import doctor_queryset
 
 class DoctorListView(generics.ListAPIView):
-    queryset = Doctor.objects.all()
+    queryset = doctor_queryset()
     serializer_class = DoctorSerializer
     permission_classes = [AllowAny]
 
@@ -80,14 +81,14 @@ class DoctorFieldListView(generics.ListAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         activate(lang_code)
-        doctors = Doctor.objects.all()
+        doctors = Doctor.objects.prefetch_related('translations')
         fields_count = Counter(doctor.field for doctor in doctors)
         field_list = [{'field': field, 'count': count} for field, count in fields_count.items()]
         return Response(field_list)
 
 
 class DoctorDetailView(generics.RetrieveAPIView):
-    queryset = Doctor.objects.all()
+    queryset = doctor_queryset()
     serializer_class = DoctorSerializer
     permission_classes = [AllowAny]
 
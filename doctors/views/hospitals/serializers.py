@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from doctors.models import Hospital, Doctor
+from doctors.models import Hospital
+from django.utils.translation import get_language
+from doctors.service.doctor_translation import SOURCE_LANGUAGE
 
 class HospitalSerializer(serializers.ModelSerializer):
     doctors = serializers.SerializerMethodField()
@@ -8,12 +10,11 @@ class HospitalSerializer(serializers.ModelSerializer):
     banner_image = serializers.SerializerMethodField()
 
     def get_doctors(self, obj):
-        doctors = Doctor.objects.filter(hospital=obj)
-        return len(doctors)
-    
+        return obj.doctor_count
+
     def get_departments(self, obj):
-        doctors = Doctor.objects.filter(hospital=obj)
-        return [doc.field for doc in doctors if doc.field]
+        # Until a hospital's doctors are translated, show the uz departments.
+        return obj.departments.get(get_language()) or obj.departments.get(SOURCE_LANGUAGE, [])
 
     def get_image(self, obj):
         if obj.image:
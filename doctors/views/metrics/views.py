@@ -0,0 +1,35 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from doctors.service.metrics import render_metrics
+
+
+def can_read_metrics(request) -> bool:
+    """
+    A scraper presenting METRICS_TOKEN as a bearer token, or staff users
+    signed in through the admin session or an API access token.
+    """
+    token = settings.METRICS_TOKEN
+    scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(presented.encode(), token.encode()):
+        return True
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+@require_GET
+def metrics_view(request):
+    """Chat pipeline metrics in the Prometheus text format."""
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
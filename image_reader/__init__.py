@@ -0,0 +1,15 @@
+from image_reader.service import (
+    DEFAULT_MODEL,
+    StandInBackend,
+    TransformersBackend,
+    VisionRequest,
+    VisionService,
+)
+
+__all__ = [
+    "DEFAULT_MODEL",
+    "StandInBackend",
+    "TransformersBackend",
+    "VisionRequest",
+    "VisionService",
+]
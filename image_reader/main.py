@@ -1,49 +1,34 @@
-from transformers import Qwen3VLForConditionalGeneration, AutoProcessor
-
-# default: Load the model on the available device(s)
-model = Qwen3VLForConditionalGeneration.from_pretrained(
-    "Qwen/Qwen3-VL-8B-Instruct", dtype="auto", device_map="auto"
-)
-
-# We recommend enabling flash_attention_2 for better acceleration and memory saving, especially in multi-image and video scenarios.
-# model = Qwen3VLForConditionalGeneration.from_pretrained(
-#     "Qwen/Qwen3-VL-8B-Instruct",
-#     dtype=torch.bfloat16,
-#     attn_implementation="flash_attention_2",
-#     device_map="auto",
-# )
-
-processor = AutoProcessor.from_pretrained("Qwen/Qwen3-VL-8B-Instruct")
-
-messages = [
-    {
-        "role": "user",
-        "content": [
-            {
-                "type": "image",
-                "image": "https://qianwen-res.oss-cn-beijing.aliyuncs.com/Qwen-VL/assets/demo.jpeg",
-            },
-            {"type": "text", "text": "Describe this image."},
-        ],
-    }
-]
-
-# Preparation for inference
-inputs = processor.apply_chat_template(
-    messages,
-    tokenize=True,
-    add_generation_prompt=True,
-    return_dict=True,
-    return_tensors="pt"
-)
-inputs = inputs.to(model.device)
-
-# Inference: Generation of the output
-generated_ids = model.generate(**inputs, max_new_tokens=128)
-generated_ids_trimmed = [
-    out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-]
-output_text = processor.batch_decode(
-    generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-)
-print(output_text)
+"""Demo: python -m image_reader.main [--stand-in] [images ...]"""
+import argparse
+import os
+
+from PIL import Image
+
+from image_reader import DEFAULT_MODEL, StandInBackend, TransformersBackend, VisionService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Describe images with the local vision model.")
+    parser.add_argument("images", nargs="*", default=[os.path.join(os.path.dirname(__file__), "image.png")])
+    parser.add_argument("--prompt", default="Describe this image.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--dtype", default="bfloat16")
+    parser.add_argument("--quantize", action="store_true", help="dynamic int8 linear layers (CPU only)")
+    parser.add_argument("--stand-in", action="store_true", help="use the weightless stand-in model")
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.stand_in:
+        backend = StandInBackend()
+    else:
+        backend = TransformersBackend(args.model, device=args.device, dtype=args.dtype, quantize=args.quantize)
+    service = VisionService(backend, max_batch_size=args.max_batch_size)
+
+    futures = [service.submit(Image.open(path).convert("RGB"), args.prompt) for path in args.images]
+    for path, future in zip(args.images, futures):
+        print(f"{path}: {future.result()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from PIL import Image, ImageStat
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "Qwen/Qwen2.5-VL-7B-Instruct"  # Qwen3-VL needs transformers >= 4.57
+
+
+@dataclass
+class VisionRequest:
+    image: Image.Image
+    prompt: str
+    future: Future = field(default_factory=Future)
+
+
+class StandInBackend:
+    """
+    Weightless stand-in for tests and local development: "describes" an
+    image by its size and mean colour, deterministically and instantly.
+    """
+
+    def load(self):
+        pass
+
+    def generate(self, images: Sequence[Image.Image], prompts: Sequence[str]) -> List[str]:
+        outputs = []
+        for image, prompt in zip(images, prompts):
+            mean = ImageStat.Stat(image.convert("RGB")).mean
+            color = ", ".join(str(round(c)) for c in mean)
+            outputs.append(f"{image.width}x{image.height} image, mean colour ({color}). Prompt: {prompt}")
+        return outputs
+
+
+class TransformersBackend:
+    """
+    Runs a Hugging Face image-text-to-text model. Weights are loaded in
+    ``dtype`` (bfloat16 halves the memory of float32 and runs on CPU).
+    ``quantize=True`` instead loads float32 weights, which dynamic int8
+    quantization of the linear layers expects; it is CPU-only.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = "cpu",
+                 dtype: str = "bfloat16", quantize: bool = False, max_new_tokens: int = 256):
+        self.model_name = model_name
+        self.device = device
+        self.dtype = dtype
+        self.quantize = quantize
+        self.max_new_tokens = max_new_tokens
+        self.model = None
+        self.processor = None
+
+    def load(self):
+        import torch
+        from transformers import AutoModelForImageTextToText, AutoProcessor
+
+        started = time.monotonic()
+        model = AutoModelForImageTextToText.from_pretrained(
+            self.model_name,
+            torch_dtype=torch.float32 if self.quantize else getattr(torch, self.dtype),
+            device_map=self.device,
+        )
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        processor = AutoProcessor.from_pretrained(self.model_name)
+        # Generation continues from the end of every row, so pad on the left.
+        processor.tokenizer.padding_side = "left"
+        self.model, self.processor = model, processor
+        logger.info("Loaded %s on %s in %.1fs", self.model_name, self.device, time.monotonic() - started)
+
+    def generate(self, images: Sequence[Image.Image], prompts: Sequence[str]) -> List[str]:
+        import torch
+
+        conversations = [
+            [{"role": "user", "content": [{"type": "image", "image": image}, {"type": "text", "text": prompt}]}]
+            for image, prompt in zip(images, prompts)
+        ]
+        inputs = self.processor.apply_chat_template(
+            conversations,
+            tokenize=True,
+            add_generation_prompt=True,
+            return_dict=True,
+            return_tensors="pt",
+            padding=True,
+        ).to(self.model.device)
+        with torch.inference_mode():
+            generated_ids = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
+        trimmed = generated_ids[:, inputs.input_ids.shape[1]:]
+        return self.processor.batch_decode(
+            trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+
+
+class VisionService:
+    """
+    Describes images with a local vision model. The backend is loaded on
+    the first request, once per process. Requests are queued and a single
+    worker thread answers them in batches of up to ``max_batch_size``,
+    waiting at most ``max_wait_ms`` after the first request of a batch for
+    more to arrive. When loading fails, requests fail with the load error
+    until ``load_retry_seconds`` have passed, then the next batch retries it.
+    """
+
+    def __init__(self, backend, max_batch_size: int = 4, max_wait_ms: float = 50,
+                 load_retry_seconds: float = 60):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.load_retry = load_retry_seconds
+        self._queue: "queue.Queue[VisionRequest]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, image: Image.Image, prompt: str) -> Future:
+        request = VisionRequest(image, prompt)
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def describe(self, image: Image.Image, prompt: str, timeout: Optional[float] = None) -> str:
+        return self.submit(image, prompt).result(timeout)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="vision-service", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> List[VisionRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _load(self) -> Optional[Exception]:
+        try:
+            self.backend.load()
+        except Exception as e:
+            logger.exception("Could not load the vision model")
+            return e
+        return None
+
+    def _run(self):
+        load_error = self._load()
+        failed_at = time.monotonic()
+
+        while True:
+            batch = self._next_batch()
+            if load_error is not None and time.monotonic() - failed_at >= self.load_retry:
+                load_error = self._load()
+                failed_at = time.monotonic()
+            if load_error is not None:
+                for request in batch:
+                    request.future.set_exception(load_error)
+                continue
+            try:
+                outputs = self.backend.generate([r.image for r in batch], [r.prompt for r in batch])
+            except Exception as e:
+                logger.exception("Vision batch of %d failed", len(batch))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output.strip())